@@ -0,0 +1,278 @@
+import heapq
+import math
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from .edge_turns import count_sharp_turns
+
+EARTH_DIAMETER_METERS = 2 * 6371e3
+
+# Scratch state slots used by the bidirectional searches
+FORWARD_SLOT, BACKWARD_SLOT, POTENTIAL_SLOT = 0, 1, 2
+
+
+# --- Shared helpers ---
+
+def lower_bound_to(graph, target: int, origin: int) -> Callable[[int], float]:
+    """
+    Returns h(v), a consistent lower bound on the graph distance between v and
+    target (dense indices): haversine, raised by the graph's ALT landmarks if any.
+    origin is the other end of the query, used to pick the most useful landmarks.
+    """
+    lat_rad, lon_rad, cos_lat = graph.lat_rad, graph.lon_rad, graph.cos_lat
+    t_phi, t_lambda, t_cos = lat_rad[target], lon_rad[target], cos_lat[target]
+    sin, sqrt, asin = math.sin, math.sqrt, math.asin
+    alt_terms = graph.landmarks.goal_terms(origin, target) if graph.landmarks is not None else ()
+
+    def bound(v: int) -> float:
+        a = sin((lat_rad[v] - t_phi) * 0.5) ** 2 + cos_lat[v] * t_cos * sin((lon_rad[v] - t_lambda) * 0.5) ** 2
+        h = EARTH_DIAMETER_METERS * asin(sqrt(a if a < 1.0 else 1.0))
+        for d_from, from_goal, d_to, to_goal in alt_terms:
+            b = from_goal - d_from[v]
+            if b > h: h = b
+            b = d_to[v] - to_goal
+            if b > h: h = b
+        return h
+
+    return bound
+
+
+def average_potential(graph, start: int, goal: int, scale: float,
+                      bounds: Optional[Tuple[Callable[[int], float], Callable[[int], float]]] = None) -> Callable[[int], float]:
+    """
+    Forward potential p(v) = (h_goal(v) - h_start(v)) / 2 for bidirectional A*.
+
+    Using p for the forward search and -p for the backward one keeps both
+    consistent, so the classic bidirectional Dijkstra stopping rule
+    (top_forward + top_backward >= best) stays correct. Values are cached in a
+    generation-stamped per-node array because both directions ask for the
+    same nodes. bounds is (h_goal, h_start) when the distance bounds of
+    lower_bound_to() don't fit the costs searched.
+    """
+    to_goal, to_start = bounds or (lower_bound_to(graph, goal, start), lower_bound_to(graph, start, goal))
+    cache = graph.search_state(POTENTIAL_SLOT)
+    values, stamp, generation = cache.g_score, cache.stamp, cache.generation
+
+    def potential(v: int) -> float:
+        if stamp[v] == generation:
+            return values[v]
+        p = values[v] = (to_goal(v) - to_start(v)) * 0.5 * scale
+        stamp[v] = generation
+        return p
+
+    return potential
+
+
+# --- Node-based search (shortest / energy_efficient) ---
+
+def bidirectional_astar(graph, start: int, goal: int, weight_factor: float = 1.0, stats=None,
+                        costs: Optional[Tuple[Sequence[float], Sequence[float]]] = None,
+                        bounds: Optional[Tuple[Callable[[int], float], Callable[[int], float]]] = None
+                        ) -> Tuple[List[int], float]:
+    """
+    Bidirectional A* between two dense node indices on an undirected graph.
+
+    Returns (index path, cost) or ([], inf). Edge weights are multiplied by
+    weight_factor as they are relaxed. For directed costs (energy) pass
+    costs=(per-slot costs, each slot's reverse cost), which the forward and
+    backward searches relax respectively, and bounds=(h_goal, h_start),
+    consistent lower bounds on those costs to goal and from start.
+    """
+    with graph.search_scratch():
+        return _bidirectional_astar(graph, start, goal, weight_factor, stats, costs, bounds)
+
+
+def _bidirectional_astar(graph, start: int, goal: int, weight_factor: float = 1.0, stats=None,
+                         costs: Optional[Tuple[Sequence[float], Sequence[float]]] = None,
+                         bounds: Optional[Tuple[Callable[[int], float], Callable[[int], float]]] = None
+                         ) -> Tuple[List[int], float]:
+    if start == goal:
+        return [start], 0.0
+
+    offsets, targets = graph.offsets, graph.targets
+    side_weights = costs or (graph.weights, graph.weights)
+    potential = average_potential(graph, start, goal, weight_factor, bounds)
+    # Cached potentials are read straight from the array; potential() only runs on a miss
+    p_cache = graph.search_state(POTENTIAL_SLOT, begin=False)
+    p_values, p_stamp, p_generation = p_cache.g_score, p_cache.stamp, p_cache.generation
+
+    # Index 0 is the forward search (from start), 1 the backward one (from goal).
+    # Backward keys use -potential.
+    states = (graph.search_state(FORWARD_SLOT), graph.search_state(BACKWARD_SLOT))
+    for state, root in zip(states, (start, goal)):
+        state.g_score[root] = 0.0
+        state.came_from[root] = -1
+        state.stamp[root] = state.generation
+    heaps = ([(potential(start), start)], [(-potential(goal), goal)])
+    signs = (1.0, -1.0)
+    best, meet = math.inf, -1
+    expanded = skipped = heap_peak = 0
+
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        heap, sign = heaps[side], signs[side]
+        own, other = states[side], states[1 - side]
+        weights = side_weights[side]
+        g, came_from, stamp, generation = own.g_score, own.came_from, own.stamp, own.generation
+        other_g, other_stamp, other_generation = other.g_score, other.stamp, other.generation
+
+        if len(heap) > heap_peak: heap_peak = len(heap)
+        key, u = heapq.heappop(heap)
+        d = g[u]
+        if key > d + sign * p_values[u]:
+            skipped += 1
+            continue # Stale heap entry (u's potential is cached since it was pushed)
+        expanded += 1
+
+        for slot in range(offsets[u], offsets[u + 1]):
+            v = targets[slot]
+            nd = d + weights[slot] * weight_factor
+            if stamp[v] != generation or nd < g[v]:
+                g[v] = nd
+                came_from[v] = u
+                stamp[v] = generation
+                p = p_values[v] if p_stamp[v] == p_generation else potential(v)
+                heapq.heappush(heap, (nd + sign * p, v))
+                if other_stamp[v] == other_generation and nd + other_g[v] < best:
+                    best, meet = nd + other_g[v], v
+
+    if stats is not None:
+        stats.record(expanded, skipped, len(heaps[0]) + len(heaps[1]), heap_peak)
+    if meet == -1:
+        return [], math.inf
+
+    path = states[0].path_to(meet)
+    backward = states[1].path_to(meet)
+    backward.reverse()
+    path.extend(backward[1:])
+    return path, best
+
+
+# --- Edge-based search (least_turn) ---
+
+def bidirectional_turn_search(graph, start: int, goal: int, turn_penalty: float, sharp_turn_rad: float,
+                              headings: Sequence[float], stats=None) -> Tuple[List[int], float, int]:
+    """
+    Bidirectional least-turn search over directed edge slots (the line graph).
+
+    A forward state is an edge slot e = (p -> c) meaning "arrived at c via e";
+    its cost includes w(e) and every turn up to e. A backward state is an edge
+    slot meaning "arrived via e, still to go"; its cost covers the turns after
+    e and the rest of the route. The two meet on a shared edge slot, so a
+    route's cost splits exactly as forward + backward and the usual stopping
+    rule applies. headings[slot] is the initial bearing of an edge slot; a turn
+    sharper than sharp_turn_rad costs turn_penalty.
+
+    Returns (index path, cost, turn count) or ([], inf, 0).
+    """
+    with graph.search_scratch():
+        return _bidirectional_turn_search(graph, start, goal, turn_penalty, sharp_turn_rad, headings, stats)
+
+
+def _bidirectional_turn_search(graph, start: int, goal: int, turn_penalty: float, sharp_turn_rad: float,
+                               headings: Sequence[float], stats=None) -> Tuple[List[int], float, int]:
+    if start == goal:
+        return [start], 0.0, 0
+
+    offsets, targets, weights, twins = graph.offsets, graph.targets, graph.weights, graph.twins
+    potential = average_potential(graph, start, goal, 1.0)
+    two_pi, pi = 2 * math.pi, math.pi
+
+    # Forward roots: every edge leaving start. Backward roots: every edge entering goal.
+    fwd, bwd = graph.edge_search_state(FORWARD_SLOT), graph.edge_search_state(BACKWARD_SLOT)
+    g_f, parent_f, stamp_f, gen_f = fwd.g_score, fwd.came_from, fwd.stamp, fwd.generation
+    g_b, parent_b, stamp_b, gen_b = bwd.g_score, bwd.came_from, bwd.stamp, bwd.generation
+    heap_f: List[Tuple[float, int]] = []
+    heap_b: List[Tuple[float, int]] = []
+    for slot in range(offsets[start], offsets[start + 1]):
+        g_f[slot] = weights[slot]
+        parent_f[slot] = -1
+        stamp_f[slot] = gen_f
+        heap_f.append((weights[slot] + potential(targets[slot]), slot))
+    for slot in range(offsets[goal], offsets[goal + 1]):
+        into_goal = twins[slot]
+        g_b[into_goal] = 0.0
+        parent_b[into_goal] = -1
+        stamp_b[into_goal] = gen_b
+        heap_b.append((-potential(goal), into_goal))
+    heapq.heapify(heap_f)
+    heapq.heapify(heap_b)
+
+    # A root edge from start straight into goal already is a complete route
+    best, meet = math.inf, -1
+    for slot in range(offsets[start], offsets[start + 1]):
+        if stamp_b[slot] == gen_b and g_f[slot] < best:
+            best, meet = g_f[slot], slot
+    expanded = skipped = heap_peak = 0
+
+    while heap_f and heap_b:
+        if heap_f[0][0] + heap_b[0][0] >= best:
+            break
+
+        if heap_f[0][0] <= heap_b[0][0]:
+            if len(heap_f) > heap_peak: heap_peak = len(heap_f)
+            key, e = heapq.heappop(heap_f)
+            d = g_f[e]
+            current = targets[e]
+            if key > d + potential(current):
+                skipped += 1
+                continue # Stale heap entry
+            expanded += 1
+            previous = targets[twins[e]]
+            heading_in = headings[e]
+            for f in range(offsets[current], offsets[current + 1]):
+                nxt = targets[f]
+                # No U-turns, except when passing back through the start
+                if nxt == previous and current != start: continue
+                change = headings[f] - heading_in
+                if change < 0: change = -change
+                if change > pi: change = two_pi - change
+                nd = d + weights[f] + turn_penalty if change > sharp_turn_rad else d + weights[f]
+                if stamp_f[f] != gen_f or nd < g_f[f]:
+                    g_f[f] = nd
+                    parent_f[f] = e
+                    stamp_f[f] = gen_f
+                    heapq.heappush(heap_f, (nd + potential(nxt), f))
+                    if stamp_b[f] == gen_b and nd + g_b[f] < best:
+                        best, meet = nd + g_b[f], f
+        else:
+            if len(heap_b) > heap_peak: heap_peak = len(heap_b)
+            key, f = heapq.heappop(heap_b)
+            d = g_b[f]
+            if key > d - potential(targets[f]):
+                skipped += 1
+                continue # Stale heap entry
+            expanded += 1
+            current = targets[twins[f]] # tail of f, where the preceding edge ends
+            nxt = targets[f]
+            extra = d + weights[f]
+            heading_out = headings[f]
+            for r in range(offsets[current], offsets[current + 1]):
+                e = twins[r] # edge previous -> current
+                previous = targets[r]
+                if nxt == previous and current != start: continue
+                change = heading_out - headings[e]
+                if change < 0: change = -change
+                if change > pi: change = two_pi - change
+                nd = extra + turn_penalty if change > sharp_turn_rad else extra
+                if stamp_b[e] != gen_b or nd < g_b[e]:
+                    g_b[e] = nd
+                    parent_b[e] = f
+                    stamp_b[e] = gen_b
+                    heapq.heappush(heap_b, (nd - potential(current), e))
+                    if stamp_f[e] == gen_f and nd + g_f[e] < best:
+                        best, meet = nd + g_f[e], e
+
+    if stats is not None:
+        stats.record(expanded, skipped, len(heap_f) + len(heap_b), heap_peak)
+    if meet == -1:
+        return [], math.inf, 0
+
+    edges = fwd.path_to(meet)
+    backward = bwd.path_to(meet)
+    backward.reverse()
+    edges.extend(backward[1:])
+
+    path = [start] + [targets[e] for e in edges]
+    return path, best, count_sharp_turns(edges, headings, sharp_turn_rad)
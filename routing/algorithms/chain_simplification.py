@@ -0,0 +1,546 @@
+import heapq
+import math
+from array import array
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from ..utils.search_state import DEFAULT_SCRATCH_SETS, ScratchPool, SearchState
+
+NOT_CORE = -1
+
+# (chain, interior position, toward the chain's end?) for an endpoint inside a chain
+Partial = Tuple[int, int, bool]
+
+
+class SimplifiedGraph:
+    """
+    Degree-2 chain simplification overlay for one undirected routing graph.
+
+    GPX-derived maps are mostly long runs of trackpoints with exactly two
+    neighbours. Every node that isn't such a trackpoint is a "core" node; each
+    maximal run between two core nodes (a chain) becomes a single core edge,
+    stored CSR style with two directed slots like GraphData. A core slot keeps
+    the chain's accumulated weight, the number of sharp turns inside it in its
+    direction of travel, the headings it starts and ends with, and the first
+    and last trackpoint next to its ends (for the no-U-turn rule). The
+    intermediate trackpoints (the packed geometry) are kept per chain with
+    their distance from the chain start and per-direction turn flags, so
+    queries can start or end in the middle of a chain and every result is
+    unpacked back into the full node path.
+
+    Directed costs (energy, which differs uphill and downhill) can be carried
+    alongside the weights: costs per core slot, and per trackpoint the cost
+    from its chain's start and back to it.
+
+    Full-graph indices are GraphData's dense indices; core indices are dense
+    indices over the core nodes only.
+    """
+
+    def __init__(self, node_count: int, sharp_turn_rad: float, core_nodes: array, core_of: array,
+                 chain_of: array, pos_of: array, offsets: array, targets: array, weights: array, twins: array,
+                 slot_chain: array, slot_forward: bytearray, slot_turns: array, entry_heading: array,
+                 exit_heading: array, first_hop: array, last_hop: array, chain_start: array, chain_end: array,
+                 chain_weight: array, chain_slot: array, chain_offsets: array, chain_nodes: array,
+                 chain_dist: array, turn_fwd: bytearray, turn_bwd: bytearray, costs: Optional[array] = None,
+                 chain_cost: Optional[array] = None, chain_cost_back: Optional[array] = None,
+                 chain_total_cost: Optional[array] = None, chain_total_cost_back: Optional[array] = None,
+                 scratch_sets: int = DEFAULT_SCRATCH_SETS):
+        self.node_count = node_count
+        self.sharp_turn_rad = sharp_turn_rad
+        self.core_nodes = core_nodes
+        self.core_of = core_of
+        self.chain_of = chain_of
+        self.pos_of = pos_of
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.twins = twins
+        self.slot_chain = slot_chain
+        self.slot_forward = slot_forward
+        self.slot_turns = slot_turns
+        self.entry_heading = entry_heading
+        self.exit_heading = exit_heading
+        self.first_hop = first_hop
+        self.last_hop = last_hop
+        self.chain_start = chain_start
+        self.chain_end = chain_end
+        self.chain_weight = chain_weight
+        self.chain_slot = chain_slot
+        self.chain_offsets = chain_offsets
+        self.chain_nodes = chain_nodes
+        self.chain_dist = chain_dist
+        self.turn_fwd = turn_fwd
+        self.turn_bwd = turn_bwd
+        self.costs = costs
+        self.chain_cost = chain_cost
+        self.chain_cost_back = chain_cost_back
+        self.chain_total_cost = chain_total_cost
+        self.chain_total_cost_back = chain_total_cost_back
+        self._scratch = ScratchPool(scratch_sets)
+
+    @property
+    def core_count(self) -> int:
+        return len(self.core_nodes)
+
+    # --- preprocessing ---
+
+    @classmethod
+    def build(cls, graph, headings: Sequence[float], sharp_turn_rad: float,
+              costs: Optional[Sequence[float]] = None, scratch_sets: int = DEFAULT_SCRATCH_SETS) -> "SimplifiedGraph":
+        """
+        Collapses the degree-2 chains of graph (a GraphData). headings[slot] is the
+        initial bearing of every full-graph edge slot; turns sharper than
+        sharp_turn_rad are counted. costs[slot], if given, are directed
+        full-graph slot costs to carry along (see shortest_path(directed=True)).
+        """
+        n = graph.node_count
+        offsets, targets, weights, twins = graph.offsets, graph.targets, graph.weights, graph.twins
+
+        # A chain node has exactly two slots, to two different nodes other than itself
+        core = bytearray(n)
+        for v in range(n):
+            o = offsets[v]
+            core[v] = not (offsets[v + 1] - o == 2 and targets[o] != targets[o + 1]
+                           and targets[o] != v and targets[o + 1] != v)
+
+        def sharp(h1: float, h2: float) -> int:
+            change = abs(h2 - h1)
+            if change > math.pi: change = 2 * math.pi - change
+            return 1 if change > sharp_turn_rad else 0
+
+        chain_of = array('q', [NOT_CORE]) * n
+        pos_of = array('q', [NOT_CORE]) * n
+        visited = bytearray(len(targets))
+        chain_start, chain_end, chain_weight = array('q'), array('q'), array('d')
+        chain_offsets, chain_nodes, chain_dist = array('q', [0]), array('q'), array('d')
+        turn_fwd, turn_bwd = bytearray(), bytearray()
+        chain_first, chain_last = array('q'), array('q') # first / last full slot, forward direction
+        directed = costs is not None
+        chain_cost, chain_cost_back = array('d'), array('d')
+        chain_total_cost, chain_total_cost_back = array('d'), array('d')
+
+        def walk(a: int, slot: int) -> None:
+            """Follows slot out of core node a through chain nodes to the next core node."""
+            k = len(chain_start)
+            slots = [slot]
+            total = weights[slot]
+            if directed:
+                cost, cost_back = costs[slot], costs[twins[slot]]
+            v = targets[slot]
+            while not core[v]:
+                chain_of[v] = k
+                pos_of[v] = len(slots) - 1
+                chain_nodes.append(v)
+                chain_dist.append(total)
+                if directed:
+                    chain_cost.append(cost)
+                    chain_cost_back.append(cost_back)
+                o = offsets[v]
+                nxt = o + 1 if o == twins[slots[-1]] else o
+                turn_fwd.append(sharp(headings[slots[-1]], headings[nxt]))
+                turn_bwd.append(sharp(headings[twins[nxt]], headings[twins[slots[-1]]]))
+                slots.append(nxt)
+                total += weights[nxt]
+                if directed:
+                    cost += costs[nxt]
+                    cost_back += costs[twins[nxt]]
+                v = targets[nxt]
+            for s in slots:
+                visited[s] = 1
+                visited[twins[s]] = 1
+            chain_start.append(a)
+            chain_end.append(v)
+            chain_weight.append(total)
+            if directed:
+                chain_total_cost.append(cost)
+                chain_total_cost_back.append(cost_back)
+            chain_offsets.append(len(chain_nodes))
+            chain_first.append(slots[0])
+            chain_last.append(slots[-1])
+
+        for a in range(n):
+            if core[a]:
+                for slot in range(offsets[a], offsets[a + 1]):
+                    if not visited[slot]:
+                        walk(a, slot)
+        # Components that are a pure cycle of chain nodes: promote one node to core
+        for v in range(n):
+            if not core[v] and chain_of[v] == NOT_CORE:
+                core[v] = 1
+                for slot in range(offsets[v], offsets[v + 1]):
+                    if not visited[slot]:
+                        walk(v, slot)
+
+        core_nodes = array('q', (v for v in range(n) if core[v]))
+        core_of = array('q', [NOT_CORE]) * n
+        for i, v in enumerate(core_nodes):
+            core_of[v] = i
+        core_n = len(core_nodes)
+        chain_count = len(chain_start)
+
+        # Core CSR: chain k gives slot start -> end (forward) and its reverse twin
+        core_offsets = array('q', [0]) * (core_n + 1)
+        for k in range(chain_count):
+            core_offsets[core_of[chain_start[k]] + 1] += 1
+            core_offsets[core_of[chain_end[k]] + 1] += 1
+        for i in range(core_n):
+            core_offsets[i + 1] += core_offsets[i]
+        m = core_offsets[core_n]
+
+        core_targets = array('q', [0]) * m
+        core_weights = array('d', [0.0]) * m
+        core_twins = array('q', [0]) * m
+        slot_chain = array('q', [0]) * m
+        slot_forward = bytearray(m)
+        slot_turns = array('q', [0]) * m
+        entry_heading = array('d', [0.0]) * m
+        exit_heading = array('d', [0.0]) * m
+        first_hop = array('q', [0]) * m
+        last_hop = array('q', [0]) * m
+        chain_slot = array('q', [0]) * chain_count
+        core_costs = array('d', [0.0]) * m if directed else None
+        cursor = core_offsets[:core_n]
+        for k in range(chain_count):
+            a, b = core_of[chain_start[k]], core_of[chain_end[k]]
+            f = cursor[a]; cursor[a] += 1
+            r = cursor[b]; cursor[b] += 1
+            first, last = chain_first[k], chain_last[k]
+            lo, hi = chain_offsets[k], chain_offsets[k + 1]
+            chain_slot[k] = f
+            for slot, target, forward in ((f, b, 1), (r, a, 0)):
+                core_targets[slot] = target
+                core_weights[slot] = chain_weight[k]
+                slot_chain[slot] = k
+                slot_forward[slot] = forward
+            core_twins[f], core_twins[r] = r, f
+            if directed:
+                core_costs[f], core_costs[r] = chain_total_cost[k], chain_total_cost_back[k]
+            slot_turns[f] = sum(turn_fwd[lo:hi])
+            slot_turns[r] = sum(turn_bwd[lo:hi])
+            entry_heading[f], exit_heading[f] = headings[first], headings[last]
+            entry_heading[r], exit_heading[r] = headings[twins[last]], headings[twins[first]]
+            first_hop[f], last_hop[f] = targets[first], targets[twins[last]]
+            first_hop[r], last_hop[r] = targets[twins[last]], targets[first]
+
+        return cls(n, sharp_turn_rad, core_nodes, core_of, chain_of, pos_of, core_offsets, core_targets,
+                   core_weights, core_twins, slot_chain, slot_forward, slot_turns, entry_heading, exit_heading,
+                   first_hop, last_hop, chain_start, chain_end, chain_weight, chain_slot, chain_offsets,
+                   chain_nodes, chain_dist, turn_fwd, turn_bwd,
+                   *((core_costs, chain_cost, chain_cost_back, chain_total_cost, chain_total_cost_back)
+                     if directed else ()), scratch_sets=scratch_sets)
+
+    # --- chain pieces (weight, sharp turns, trackpoints in travel order) ---
+
+    def _pieces(self, directed: bool) -> Tuple[array, array, array, array]:
+        """(cost from chain start, cost back to it, chain total, total back): the directed costs or the weights."""
+        if directed:
+            return self.chain_cost, self.chain_cost_back, self.chain_total_cost, self.chain_total_cost_back
+        return self.chain_dist, self.chain_dist, self.chain_weight, self.chain_weight
+
+    def _from(self, k: int, p: int, forward: bool, directed: bool = False) -> Tuple[float, int, List[int]]:
+        """Leaving interior position p of chain k toward its end (forward) or start; excludes p and the core end."""
+        lo, hi = self.chain_offsets[k], self.chain_offsets[k + 1]
+        dist, dist_back, total, _ = self._pieces(directed)
+        if forward:
+            return (total[k] - dist[lo + p], sum(self.turn_fwd[lo + p + 1:hi]),
+                    list(self.chain_nodes[lo + p + 1:hi]))
+        return dist_back[lo + p], sum(self.turn_bwd[lo:lo + p]), list(reversed(self.chain_nodes[lo:lo + p]))
+
+    def _to(self, k: int, q: int, forward: bool, directed: bool = False) -> Tuple[float, int, List[int]]:
+        """Entering chain k at its start (forward) or end and stopping at interior position q; excludes both."""
+        lo, hi = self.chain_offsets[k], self.chain_offsets[k + 1]
+        dist, dist_back, _, total_back = self._pieces(directed)
+        if forward:
+            return dist[lo + q], sum(self.turn_fwd[lo:lo + q]), list(self.chain_nodes[lo:lo + q])
+        return (total_back[k] - dist_back[lo + q], sum(self.turn_bwd[lo + q + 1:hi]),
+                list(reversed(self.chain_nodes[lo + q + 1:hi])))
+
+    def _between(self, k: int, p: int, q: int, directed: bool = False) -> Tuple[float, int, List[int]]:
+        """From interior position p to q of the same chain, without leaving it; excludes both."""
+        lo = self.chain_offsets[k]
+        dist, dist_back, _, _ = self._pieces(directed)
+        if p < q:
+            return (dist[lo + q] - dist[lo + p], sum(self.turn_fwd[lo + p + 1:lo + q]),
+                    list(self.chain_nodes[lo + p + 1:lo + q]))
+        return (dist_back[lo + p] - dist_back[lo + q], sum(self.turn_bwd[lo + q + 1:lo + p]),
+                list(reversed(self.chain_nodes[lo + q + 1:lo + p])))
+
+    def _interior(self, slot: int) -> List[int]:
+        """Trackpoints strictly inside core slot, in its direction of travel."""
+        k = self.slot_chain[slot]
+        nodes = list(self.chain_nodes[self.chain_offsets[k]:self.chain_offsets[k + 1]])
+        if not self.slot_forward[slot]:
+            nodes.reverse()
+        return nodes
+
+    def _sharp(self, h1: float, h2: float) -> bool:
+        change = abs(h2 - h1)
+        if change > math.pi: change = 2 * math.pi - change
+        return change > self.sharp_turn_rad
+
+    def _state(self, kind: str, size: int) -> SearchState:
+        state = self._scratch.current().state(kind, 0, size)
+        state.begin()
+        return state
+
+    # --- node-based queries (shortest / energy_efficient) ---
+
+    def shortest_path(self, start: int, goal: int, weight_factor: float, bound: Callable[[int], float],
+                      stats=None, directed: bool = False) -> Tuple[List[int], float]:
+        """
+        Shortest path between two full-graph indices as (full index path, cost), or ([], inf).
+
+        A* over the core graph; an endpoint inside a chain is joined to both of
+        its chain's ends. bound(v) is a consistent lower bound on the base-weight
+        distance from full node v to goal. directed=True searches the directed
+        costs the overlay was built with instead (bound then bounds those).
+        """
+        with self._scratch.checkout():
+            return self._shortest_path(start, goal, weight_factor, bound, stats, directed)
+
+    def _shortest_path(self, start: int, goal: int, weight_factor: float, bound: Callable[[int], float],
+                       stats=None, directed: bool = False) -> Tuple[List[int], float]:
+        if start == goal:
+            return [start], 0.0
+
+        core_of, chain_of, pos_of = self.core_of, self.chain_of, self.pos_of
+        best, best_node, direct_path = math.inf, -1, None
+        if core_of[start] == NOT_CORE and chain_of[start] == chain_of[goal]:
+            weight, _, nodes = self._between(chain_of[start], pos_of[start], pos_of[goal], directed)
+            best, direct_path = weight * weight_factor, [start] + nodes + [goal]
+
+        # Seeds: core nodes the start reaches directly, with the chain piece that gets there
+        if core_of[start] != NOT_CORE:
+            seeds = [(core_of[start], 0.0, None)]
+        else:
+            k, p = chain_of[start], pos_of[start]
+            seeds = [(core_of[self.chain_end[k]], self._from(k, p, True, directed)[0], (k, p, True)),
+                     (core_of[self.chain_start[k]], self._from(k, p, False, directed)[0], (k, p, False))]
+        # Tails: core nodes the goal is reached from directly, with their remaining weight
+        tails: Dict[int, Tuple[float, Optional[Partial]]] = {}
+        if core_of[goal] != NOT_CORE:
+            tails[core_of[goal]] = (0.0, None)
+        else:
+            k, q = chain_of[goal], pos_of[goal]
+            for end, forward in ((self.chain_start[k], True), (self.chain_end[k], False)):
+                weight = self._to(k, q, forward, directed)[0]
+                if weight < tails.get(core_of[end], (math.inf,))[0]:
+                    tails[core_of[end]] = (weight, (k, q, forward))
+
+        offsets, targets, core_nodes = self.offsets, self.targets, self.core_nodes
+        weights = self.costs if directed else self.weights
+        state = self._state('node_state', self.core_count)
+        g, came_from, stamp, generation = state.g_score, state.came_from, state.stamp, state.generation
+        seed_partial: Dict[int, Optional[Partial]] = {}
+        heap = []
+        for u, weight, partial in seeds:
+            d = weight * weight_factor
+            if stamp[u] != generation or d < g[u]:
+                g[u] = d
+                came_from[u] = -1
+                stamp[u] = generation
+                seed_partial[u] = partial
+                heapq.heappush(heap, (d + bound(core_nodes[u]) * weight_factor, d, u))
+        expanded = skipped = heap_peak = 0
+
+        while heap:
+            if len(heap) > heap_peak: heap_peak = len(heap)
+            f, d, u = heapq.heappop(heap)
+            if f >= best:
+                skipped += 1
+                break
+            if d > g[u]:
+                skipped += 1
+                continue
+            expanded += 1
+            tail = tails.get(u)
+            if tail is not None and d + tail[0] * weight_factor < best:
+                best, best_node = d + tail[0] * weight_factor, u
+
+            for slot in range(offsets[u], offsets[u + 1]):
+                v = targets[slot]
+                nd = d + weights[slot] * weight_factor
+                if stamp[v] != generation or nd < g[v]:
+                    g[v] = nd
+                    came_from[v] = slot
+                    stamp[v] = generation
+                    heapq.heappush(heap, (nd + bound(core_nodes[v]) * weight_factor, nd, v))
+
+        if stats is not None:
+            stats.record(expanded, skipped, len(heap), heap_peak)
+        if best_node == -1:
+            return (direct_path, best) if direct_path is not None else ([], math.inf)
+
+        # Core slots back to the seed, then unpack every piece into trackpoints
+        slots = []
+        u = best_node
+        while came_from[u] != -1:
+            slots.append(came_from[u])
+            u = targets[self.twins[came_from[u]]]
+        slots.reverse()
+        path = [start] if seed_partial[u] is None else [start] + self._from(*seed_partial[u])[2]
+        if seed_partial[u] is not None:
+            path.append(core_nodes[u])
+        for slot in slots:
+            path.extend(self._interior(slot))
+            path.append(core_nodes[targets[slot]])
+        partial = tails[best_node][1]
+        if partial is not None:
+            path.extend(self._to(*partial)[2])
+            path.append(goal)
+        return path, best
+
+    # --- edge-based query (least_turn) ---
+
+    def least_turn_path(self, start: int, goal: int, turn_penalty: float, bound: Callable[[int], float],
+                        stats=None) -> Tuple[List[int], float, int]:
+        """
+        Least-turn path between two full-graph indices as (full index path, cost, turn count), or ([], inf, 0).
+
+        A* over directed core slots. A slot's cost is its weight plus turn_penalty
+        for each sharp turn inside it and at the junction it is entered from,
+        which is exactly the per-trackpoint cost of the full graph. U-turns are
+        only allowed at the start, as in least_turn_astar.
+        """
+        with self._scratch.checkout():
+            return self._least_turn_path(start, goal, turn_penalty, bound, stats)
+
+    def _least_turn_path(self, start: int, goal: int, turn_penalty: float, bound: Callable[[int], float],
+                         stats=None) -> Tuple[List[int], float, int]:
+        if start == goal:
+            return [start], 0.0, 0
+
+        core_of, chain_of, pos_of = self.core_of, self.chain_of, self.pos_of
+        offsets, targets, weights, twins = self.offsets, self.targets, self.weights, self.twins
+        slot_turns, entry, exit_, first_hop, last_hop = (self.slot_turns, self.entry_heading, self.exit_heading,
+                                                          self.first_hop, self.last_hop)
+        core_nodes, sharp = self.core_nodes, self._sharp
+
+        best, best_state, best_tail, direct = math.inf, -1, None, None
+        # Routes that never reach a junction: both ends on one chain, or the start is one end of the goal's chain
+        if core_of[goal] == NOT_CORE:
+            k, q = chain_of[goal], pos_of[goal]
+            if core_of[start] == NOT_CORE and chain_of[start] == k:
+                weight, turns, nodes = self._between(k, pos_of[start], q)
+                direct = (weight + turn_penalty * turns, [start] + nodes + [goal], turns)
+            for end, forward in ((self.chain_start[k], True), (self.chain_end[k], False)):
+                if end == start:
+                    weight, turns, nodes = self._to(k, q, forward)
+                    if direct is None or weight + turn_penalty * turns < direct[0]:
+                        direct = (weight + turn_penalty * turns, [start] + nodes + [goal], turns)
+            if direct is not None:
+                best = direct[0]
+
+        # Seed states: core slots "arrived at their end", possibly entered mid-chain
+        state = self._state('edge_state', len(targets))
+        g, came_from, stamp, generation = state.g_score, state.came_from, state.stamp, state.generation
+        seed_partial: Dict[int, Optional[Partial]] = {}
+        if core_of[start] != NOT_CORE:
+            u = core_of[start]
+            seeds = [(f, weights[f] + turn_penalty * slot_turns[f], None) for f in range(offsets[u], offsets[u + 1])]
+        else:
+            k, p = chain_of[start], pos_of[start]
+            forward_slot = self.chain_slot[k]
+            seeds = []
+            for slot, forward in ((forward_slot, True), (twins[forward_slot], False)):
+                weight, turns, _ = self._from(k, p, forward)
+                seeds.append((slot, weight + turn_penalty * turns, (k, p, forward)))
+        heap = []
+        for f, d, partial in seeds:
+            if stamp[f] != generation or d < g[f]:
+                g[f] = d
+                came_from[f] = -1
+                stamp[f] = generation
+                seed_partial[f] = partial
+                heap.append((d + bound(core_nodes[targets[f]]), d, f))
+        heapq.heapify(heap)
+
+        # Ways to finish: arriving at the goal's core node, or entering its chain from either end
+        goal_core = core_of[goal]
+        tails: Dict[int, List[Tuple[int, float, int, Partial]]] = {}
+        if goal_core == NOT_CORE:
+            k, q = chain_of[goal], pos_of[goal]
+            forward_slot = self.chain_slot[k]
+            for slot, forward in ((forward_slot, True), (twins[forward_slot], False)):
+                weight, turns, _ = self._to(k, q, forward)
+                tails.setdefault(targets[twins[slot]], []).append((slot, weight + turn_penalty * turns, turns, (k, q, forward)))
+        expanded = skipped = heap_peak = 0
+
+        while heap:
+            if len(heap) > heap_peak: heap_peak = len(heap)
+            key, d, e = heapq.heappop(heap)
+            if key >= best:
+                skipped += 1
+                break
+            if d > g[e]:
+                skipped += 1
+                continue
+            expanded += 1
+            u = targets[e]
+            at_start = core_nodes[u] == start
+
+            if u == goal_core:
+                if d < best:
+                    best, best_state, best_tail = d, e, None
+                continue
+            for slot, extra, _, partial in tails.get(u, ()):
+                if first_hop[slot] == last_hop[e] and not at_start: continue
+                total = d + (turn_penalty if sharp(exit_[e], entry[slot]) else 0.0) + extra
+                if total < best:
+                    best, best_state, best_tail = total, e, partial
+
+            for f in range(offsets[u], offsets[u + 1]):
+                if first_hop[f] == last_hop[e] and not at_start: continue
+                nd = d + (turn_penalty if sharp(exit_[e], entry[f]) else 0.0) + weights[f] + turn_penalty * slot_turns[f]
+                if stamp[f] != generation or nd < g[f]:
+                    g[f] = nd
+                    came_from[f] = e
+                    stamp[f] = generation
+                    heapq.heappush(heap, (nd + bound(core_nodes[targets[f]]), nd, f))
+
+        if stats is not None:
+            stats.record(expanded, skipped, len(heap), heap_peak)
+        if best_state == -1:
+            if direct is not None:
+                return direct[1], direct[0], direct[2]
+            return [], math.inf, 0
+
+        states = [best_state]
+        while came_from[states[-1]] != -1:
+            states.append(came_from[states[-1]])
+        states.reverse()
+
+        first = states[0]
+        if seed_partial[first] is None:
+            turns = slot_turns[first]
+            path = [start] + self._interior(first)
+        else:
+            _, turns, nodes = self._from(*seed_partial[first])
+            path = [start] + nodes
+        path.append(core_nodes[targets[first]])
+        for e, f in zip(states, states[1:]):
+            turns += slot_turns[f] + (1 if sharp(exit_[e], entry[f]) else 0)
+            path.extend(self._interior(f))
+            path.append(core_nodes[targets[f]])
+        if best_tail is not None:
+            k, q, forward = best_tail
+            slot = self.chain_slot[k] if forward else twins[self.chain_slot[k]]
+            _, tail_turns, nodes = self._to(k, q, forward)
+            turns += tail_turns + (1 if sharp(exit_[states[-1]], entry[slot]) else 0)
+            path.extend(nodes)
+            path.append(goal)
+        return path, best, turns
+
+    def approx_bytes(self) -> int:
+        size = sum(
+            arr.itemsize * len(arr)
+            for arr in (self.core_nodes, self.core_of, self.chain_of, self.pos_of, self.offsets, self.targets,
+                        self.weights, self.twins, self.slot_chain, self.slot_turns, self.entry_heading,
+                        self.exit_heading, self.first_hop, self.last_hop, self.chain_start, self.chain_end,
+                        self.chain_weight, self.chain_slot, self.chain_offsets, self.chain_nodes, self.chain_dist)
+        )
+        if self.costs is not None:
+            size += sum(arr.itemsize * len(arr) for arr in (self.costs, self.chain_cost, self.chain_cost_back,
+                                                             self.chain_total_cost, self.chain_total_cost_back))
+        # Search scratch: a node state per core node and an edge state per core slot, per pooled set
+        size += self._scratch.limit * SearchState.BYTES_PER_ENTRY * (self.core_count + len(self.targets))
+        return size + len(self.slot_forward) + len(self.turn_fwd) + len(self.turn_bwd)
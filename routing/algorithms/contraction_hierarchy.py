@@ -0,0 +1,266 @@
+import heapq
+import math
+import sys
+from array import array
+from typing import Dict, List, Set, Tuple
+
+# Witness searches give up after settling this many nodes; a missed witness
+# only costs an unnecessary shortcut, never a wrong answer.
+WITNESS_SETTLE_LIMIT = 60
+
+NO_MIDDLE = -1
+
+
+class ContractionHierarchy:
+    """
+    Contraction Hierarchies (CH) overlay for one undirected routing graph.
+
+    Nodes are contracted one at a time in order of importance; whenever removing
+    a node would lengthen a shortest path between two of its neighbours, a
+    shortcut edge is added. Each node keeps only its edges to higher-ranked
+    nodes (the "upward" graph, stored CSR style), so a query is two small
+    Dijkstra searches that only go up the hierarchy and meet at the top.
+
+    All indices are the dense node indices of the GraphData it was built from.
+    """
+
+    def __init__(self, rank: array, up_offsets: array, up_targets: array, up_weights: array,
+                 up_middle: array, shortcut_count: int):
+        self.rank = rank
+        self.up_offsets = up_offsets
+        self.up_targets = up_targets
+        self.up_weights = up_weights
+        self.up_middle = up_middle
+        self.shortcut_count = shortcut_count
+
+        n = len(rank)
+        # (lower-ranked, higher-ranked) endpoint pair -> upward edge slot, for unpacking
+        self._slot_of: Dict[int, int] = {}
+        for u in range(n):
+            for slot in range(up_offsets[u], up_offsets[u + 1]):
+                self._slot_of[u * n + up_targets[slot]] = slot
+
+    # --- preprocessing ---
+
+    @classmethod
+    def build(cls, graph) -> "ContractionHierarchy":
+        """Contracts every node of graph (a GraphData) and returns the resulting hierarchy."""
+        n = graph.node_count
+        offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+
+        # Overlay graph of not-yet-contracted nodes: adj[u][v] = best known u-v weight
+        adj: List[Dict[int, float]] = [{} for _ in range(n)]
+        for u in range(n):
+            row = adj[u]
+            for slot in range(offsets[u], offsets[u + 1]):
+                v = targets[slot]
+                if v != u and weights[slot] < row.get(v, math.inf):
+                    row[v] = weights[slot]
+        middle: Dict[Tuple[int, int], int] = {}
+
+        contracted = bytearray(n)
+        deleted_neighbors = array('q', [0]) * n
+        rank = array('q', [0]) * n
+        up_edges: List[List[Tuple[int, float, int]]] = [[] for _ in range(n)]
+        shortcut_count = 0
+
+        def shortcuts_for(v: int) -> List[Tuple[int, int, float]]:
+            """Shortcuts (u, w, weight) needed if v were contracted now."""
+            neighbors = list(adj[v].items())
+            if len(neighbors) < 2:
+                return []
+            max_out = max(w for _, w in neighbors)
+            needed = []
+            for i, (u, w_uv) in enumerate(neighbors):
+                rest = neighbors[i + 1:]
+                dist = _witness_search(adj, u, v, w_uv + max_out, {x for x, _ in rest})
+                for x, w_vx in rest:
+                    via = w_uv + w_vx
+                    if dist.get(x, math.inf) > via:
+                        needed.append((u, x, via))
+            return needed
+
+        def priority(v: int, needed: List[Tuple[int, int, float]]) -> int:
+            # Edge difference (weighted double) plus the number of already-contracted
+            # neighbours, which spreads contraction evenly across the map
+            return 2 * (len(needed) - len(adj[v])) + deleted_neighbors[v]
+
+        queue = [(priority(v, shortcuts_for(v)), v) for v in range(n)]
+        heapq.heapify(queue)
+        next_rank = 0
+
+        while queue:
+            _, v = heapq.heappop(queue)
+            if contracted[v]:
+                continue
+            # Lazy update: re-evaluate and defer v if it is no longer the cheapest
+            needed = shortcuts_for(v)
+            current = priority(v, needed)
+            if queue and current > queue[0][0]:
+                heapq.heappush(queue, (current, v))
+                continue
+
+            for u, x, via in needed:
+                if via < adj[u].get(x, math.inf):
+                    adj[u][x] = via
+                    adj[x][u] = via
+                    middle[(u, x) if u < x else (x, u)] = v
+                    shortcut_count += 1
+
+            for u, w in adj[v].items():
+                up_edges[v].append((u, w, middle.get((u, v) if u < v else (v, u), NO_MIDDLE)))
+                del adj[u][v]
+                deleted_neighbors[u] += 1
+            adj[v] = {}
+
+            contracted[v] = 1
+            rank[v] = next_rank
+            next_rank += 1
+
+        up_offsets = array('q', [0]) * (n + 1)
+        up_targets = array('q')
+        up_weights = array('d')
+        up_middle = array('q')
+        for v in range(n):
+            for u, w, mid in up_edges[v]:
+                up_targets.append(u)
+                up_weights.append(w)
+                up_middle.append(mid)
+            up_offsets[v + 1] = len(up_targets)
+
+        return cls(rank, up_offsets, up_targets, up_weights, up_middle, shortcut_count)
+
+    # --- queries ---
+
+    def query(self, source: int, target: int, stats=None) -> Tuple[List[int], float]:
+        """
+        Shortest path between two dense node indices as (index path, cost); ([], inf) if unreachable.
+        stats (a SearchStats) receives the counters of both searches together.
+        """
+        if source == target:
+            return [source], 0.0
+
+        up_offsets, up_targets, up_weights = self.up_offsets, self.up_targets, self.up_weights
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: -1}, {target: -1})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        best, meet = math.inf, -1
+        expanded = skipped = heap_peak = 0
+
+        while heaps[0] or heaps[1]:
+            # Advance the direction with the smaller frontier key
+            if not heaps[1] or (heaps[0] and heaps[0][0][0] <= heaps[1][0][0]):
+                side = 0
+            else:
+                side = 1
+            heap, own_dist, own_parent, other_dist = heaps[side], dist[side], parent[side], dist[1 - side]
+
+            if len(heap) > heap_peak: heap_peak = len(heap)
+            d, u = heapq.heappop(heap)
+            if d >= best:
+                # Nothing left in this direction can improve the best meeting point
+                skipped += 1 + len(heap)
+                heap.clear()
+                continue
+            if d > own_dist[u]:
+                skipped += 1
+                continue
+            expanded += 1
+
+            total = d + other_dist.get(u, math.inf)
+            if total < best:
+                best, meet = total, u
+
+            # Stall-on-demand: if a higher-ranked neighbour already reaches u more
+            # cheaply, u is not on a shortest up-path and need not be expanded
+            stalled = False
+            for slot in range(up_offsets[u], up_offsets[u + 1]):
+                if own_dist.get(up_targets[slot], math.inf) + up_weights[slot] < d:
+                    stalled = True
+                    break
+            if stalled:
+                continue
+
+            for slot in range(up_offsets[u], up_offsets[u + 1]):
+                v = up_targets[slot]
+                nd = d + up_weights[slot]
+                if nd < own_dist.get(v, math.inf):
+                    own_dist[v] = nd
+                    own_parent[v] = u
+                    heapq.heappush(heap, (nd, v))
+                    total = nd + other_dist.get(v, math.inf)
+                    if total < best:
+                        best, meet = total, v
+
+        if stats is not None:
+            stats.record(expanded, skipped, 0, heap_peak)
+        if meet == -1:
+            return [], math.inf
+
+        # Up-path source..meet, then meet..target, with every shortcut expanded
+        forward = _walk(parent[0], meet)
+        forward.reverse()
+        up_path = forward + _walk(parent[1], meet)[1:]
+
+        path = [up_path[0]]
+        for a, b in zip(up_path, up_path[1:]):
+            self._unpack(a, b, path)
+        return path, best
+
+    def _unpack(self, a: int, b: int, out: List[int]) -> None:
+        """Appends the original-graph nodes after a on the a-b (possibly shortcut) edge, ending with b."""
+        stack = [(a, b)]
+        n = len(self.rank)
+        while stack:
+            x, y = stack.pop()
+            low, high = (x, y) if self.rank[x] < self.rank[y] else (y, x)
+            mid = self.up_middle[self._slot_of[low * n + high]]
+            if mid == NO_MIDDLE:
+                out.append(y)
+            else:
+                # Expand x-mid before mid-y (the stack is LIFO)
+                stack.append((mid, y))
+                stack.append((x, mid))
+
+    def approx_bytes(self) -> int:
+        size = sum(
+            arr.itemsize * len(arr)
+            for arr in (self.rank, self.up_offsets, self.up_targets, self.up_weights, self.up_middle)
+        )
+        size += sys.getsizeof(self._slot_of) + len(self._slot_of) * 2 * sys.getsizeof(0)
+        return size
+
+
+def _witness_search(adj: List[Dict[int, float]], source: int, skip: int, max_cost: float,
+                    targets: Set[int]) -> Dict[int, float]:
+    """Bounded Dijkstra from source over the overlay graph, never passing through skip."""
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = 0
+    remaining = len(targets)
+    while heap and settled < WITNESS_SETTLE_LIMIT and remaining:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        if d > max_cost:
+            break
+        settled += 1
+        if u in targets:
+            remaining -= 1
+        for v, w in adj[u].items():
+            if v == skip:
+                continue
+            nd = d + w
+            if nd < dist.get(v, math.inf):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+
+def _walk(parent: Dict[int, int], node: int) -> List[int]:
+    """Follows parent pointers from node back to the search root (node first)."""
+    path = [node]
+    while parent[node] != -1:
+        node = parent[node]
+        path.append(node)
+    return path
@@ -0,0 +1,15 @@
+import math
+from typing import Sequence
+
+TWO_PI = 2 * math.pi
+
+
+def turn_angle(heading_in: float, heading_out: float) -> float:
+    """Change of direction (radians, 0..pi) between two edge headings."""
+    change = abs(heading_out - heading_in)
+    return TWO_PI - change if change > math.pi else change
+
+
+def count_sharp_turns(edges: Sequence[int], headings: Sequence[float], sharp_turn_rad: float) -> int:
+    """Turns sharper than sharp_turn_rad along a route given as consecutive edge slots."""
+    return sum(1 for e, f in zip(edges, edges[1:]) if turn_angle(headings[e], headings[f]) > sharp_turn_rad)
@@ -1,36 +1,71 @@
 import math
-import heapq
+from typing import Callable, Sequence
 
-def elevation_cost(e1, e2):
-    if e2 > e1:
-        return (e2 - e1) ** 2
-    return 0
+import numpy as np
 
-def elevation_a_star(graph, points, start, goal):
-    pq = [(0, start)]
-    dist = {start: 0}
-    parent = {start: None}
+from .bidirectional import EARTH_DIAMETER_METERS
 
-    while pq:
-        cost, node = heapq.heappop(pq)
+# Grades steeper than this are treated as this steep: on very short edges GPS
+# elevation noise gives absurd grades, which would otherwise dominate the cost
+MAX_GRADE = 1.0
 
-        if node == goal:
-            break
 
-        for neigh in graph[node]:
-            ele1 = points[node][2]
-            ele2 = points[neigh][2]
+# --- Cost model ---
 
-            new_cost = cost + elevation_cost(ele1, ele2)
+def edge_energy_costs(weights: Sequence[float], targets: Sequence[int], twins: Sequence[int],
+                      elevation: Sequence[float], flat_factor: float, climb_cost: float,
+                      steep_cost: float) -> np.ndarray:
+    """
+    Energy cost of every directed edge slot, in one vectorized pass.
 
-            if neigh not in dist or new_cost < dist[neigh]:
-                dist[neigh] = new_cost
-                parent[neigh] = node
-                heapq.heappush(pq, (new_cost, neigh))
+    A slot of length d (its weight) rising by r meters costs
+    d * flat_factor + r * (climb_cost + steep_cost * grade), grade = r / d, so
+    climbing is paid for per meter of height and steep climbs more than
+    gentle ones (the squared rise / distance term). Descending costs the flat
+    rate. Slots touching a node without elevation (NaN) count as flat.
+    """
+    weights_np = np.frombuffer(weights, dtype=np.float64)
+    targets_np = np.frombuffer(targets, dtype=np.int64)
+    elevation_np = np.frombuffer(elevation, dtype=np.float64)
+    sources = targets_np[np.frombuffer(twins, dtype=np.int64)]
+    rise = elevation_np[targets_np] - elevation_np[sources]
+    rise = np.where(rise > 0, rise, 0.0)  # NaN compares False, so unknown elevations count as flat
+    grade = np.divide(rise, weights_np, out=np.full_like(rise, MAX_GRADE), where=weights_np > 0)
+    return weights_np * flat_factor + rise * (climb_cost + steep_cost * np.minimum(grade, MAX_GRADE))
+
+
+def energy_lower_bound(graph, target: int, origin: int, flat_factor: float, climb_cost: float,
+                       toward: bool = True) -> Callable[[int], float]:
+    """
+    Returns h(v), a consistent lower bound on the energy cost from v to target
+    (toward=True) or from target to v; origin is the query's other end.
+
+    Every slot costs at least its weight times flat_factor plus climb_cost per
+    meter it rises, so haversine times flat_factor plus climb_cost per meter
+    of net climb bounds any path (the climb part telescopes). Pass
+    climb_cost=0 when some nodes lack elevation. The graph's energy_landmarks,
+    if any, raise the bound further.
+    """
+    lat_rad, lon_rad, cos_lat, elevation = graph.lat_rad, graph.lon_rad, graph.cos_lat, graph.elevation
+    t_phi, t_lambda, t_cos, t_ele = lat_rad[target], lon_rad[target], cos_lat[target], elevation[target]
+    sin, sqrt, asin = math.sin, math.sqrt, math.asin
+    landmarks = graph.energy_landmarks
+    if landmarks is not None and not toward:
+        landmarks = landmarks.reversed()
+    alt_terms = landmarks.goal_terms(origin, target) if landmarks is not None else ()
+    sign = 1.0 if toward else -1.0
+
+    def bound(v: int) -> float:
+        a = sin((lat_rad[v] - t_phi) * 0.5) ** 2 + cos_lat[v] * t_cos * sin((lon_rad[v] - t_lambda) * 0.5) ** 2
+        h = EARTH_DIAMETER_METERS * asin(sqrt(a if a < 1.0 else 1.0)) * flat_factor
+        rise = (t_ele - elevation[v]) * sign
+        if rise > 0: h += rise * climb_cost
+        for d_from, from_goal, d_to, to_goal in alt_terms:
+            b = from_goal - d_from[v]
+            if b > h: h = b
+            b = d_to[v] - to_goal
+            if b > h: h = b
+        return h
+
+    return bound
 
-    path = []
-    cur = goal
-    while cur is not None:
-        path.append(cur)
-        cur = parent[cur]
-    return path[::-1]
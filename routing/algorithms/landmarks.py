@@ -0,0 +1,124 @@
+import heapq
+import math
+from array import array
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Landmarks consulted per query; the ones giving the best bound at the source are used.
+ACTIVE_LANDMARKS = 4
+
+
+class Landmarks:
+    """
+    ALT (A*, Landmarks, Triangle inequality) lower bounds for one routing graph.
+
+    For every landmark L we keep the exact graph distance from L to every node
+    (and to L from every node). The triangle inequality then gives
+    d(v, t) >= d(L, t) - d(L, v) and d(v, t) >= d(v, L) - d(t, L), which is
+    usually much tighter than straight-line distance when edge weights are
+    well above it (winding campus paths).
+
+    Loaded graphs are undirected, so for their weights dist_to is the same
+    array as dist_from. Landmarks over directed costs (energy, see build())
+    keep both.
+    """
+
+    def __init__(self, landmarks: List[int], dist_from: List[array], dist_to: List[array]):
+        self.landmarks = landmarks
+        self.dist_from = dist_from
+        self.dist_to = dist_to
+
+    @classmethod
+    def build(cls, graph, count: int, costs: Optional[Sequence[float]] = None,
+              reverse_costs: Optional[Sequence[float]] = None) -> "Landmarks":
+        """
+        Picks count landmarks on graph (a GraphData) by farthest-point selection and
+        stores their distances. costs / reverse_costs are directed per-slot costs
+        (and each slot's twin's) to use instead of the weights.
+        """
+        n = graph.node_count
+        count = min(count, n)
+        if count <= 0:
+            return cls([], [], [])
+
+        # Start from the node farthest from an arbitrary node, then keep adding the
+        # node farthest from all landmarks chosen so far. Nodes another landmark
+        # can't reach count as infinitely far, so every component gets covered.
+        seed_dist = np.frombuffer(dijkstra_all(graph, 0, costs), dtype=np.float64)
+        first = int(np.argmax(np.where(np.isinf(seed_dist), -1.0, seed_dist)))
+
+        landmarks: List[int] = []
+        dist_from: List[array] = []
+        dist_to: List[array] = []
+        closest = np.full(n, np.inf)
+        candidate = first
+        while len(landmarks) < count:
+            dist = dijkstra_all(graph, candidate, costs)
+            landmarks.append(candidate)
+            dist_from.append(dist)
+            # Costs to the landmark: a search from it over the reversed slots
+            dist_to.append(dist if costs is None else dijkstra_all(graph, candidate, reverse_costs))
+            closest = np.minimum(closest, np.frombuffer(dist, dtype=np.float64))
+            closest[landmarks] = -1.0
+            candidate = int(np.argmax(closest))
+            if closest[candidate] <= 0:
+                break
+
+        return cls(landmarks, dist_from, dist_from if costs is None else dist_to)
+
+    def reversed(self) -> "Landmarks":
+        """The same landmarks with the directions swapped: goal_terms() then bound the cost from goal to a node."""
+        return Landmarks(self.landmarks, self.dist_to, self.dist_from)
+
+    def goal_terms(self, start: int, goal: int, active: int = ACTIVE_LANDMARKS) -> List[Tuple[array, float, array, float]]:
+        """
+        Per-query terms (dist_from_L, d(L, goal), dist_to_L, d(goal, L)) for the
+        landmarks that give the best bound at start. Landmarks that can't reach
+        the goal give no information and are skipped.
+        """
+        scored = []
+        for d_from, d_to in zip(self.dist_from, self.dist_to):
+            from_goal, to_goal = d_from[goal], d_to[goal]
+            if math.isinf(from_goal) or math.isinf(to_goal):
+                continue
+            bound = max(from_goal - d_from[start], d_to[start] - to_goal)
+            scored.append((bound, d_from, from_goal, d_to, to_goal))
+        scored.sort(key=lambda term: term[0], reverse=True)
+        return [(d_from, from_goal, d_to, to_goal) for _, d_from, from_goal, d_to, to_goal in scored[:active]]
+
+    def lower_bound(self, node: int, terms) -> float:
+        """Triangle-inequality lower bound on d(node, goal) for terms from goal_terms()."""
+        best = 0.0
+        for d_from, from_goal, d_to, to_goal in terms:
+            b = from_goal - d_from[node]
+            if b > best: best = b
+            b = d_to[node] - to_goal
+            if b > best: best = b
+        return best
+
+    def approx_bytes(self) -> int:
+        size = sum(arr.itemsize * len(arr) for arr in self.dist_from)
+        if self.dist_to is not self.dist_from:
+            size += sum(arr.itemsize * len(arr) for arr in self.dist_to)
+        return size
+
+
+def dijkstra_all(graph, source: int, costs: Optional[Sequence[float]] = None) -> array:
+    """Distances (or costs) from source (dense index) to every node of graph; inf where unreachable."""
+    offsets, targets = graph.offsets, graph.targets
+    weights = graph.weights if costs is None else costs
+    dist = array('d', [math.inf]) * graph.node_count
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for slot in range(offsets[u], offsets[u + 1]):
+            v = targets[slot]
+            nd = d + weights[slot]
+            if nd < dist[v]:
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
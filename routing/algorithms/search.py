@@ -0,0 +1,225 @@
+"""
+The search core every routing mode runs on.
+
+A search is an expansion strategy (what a search state is and how it is
+relaxed), per-slot costs and an optional heuristic. Both strategies share the
+same machinery: generation-stamped state arrays from a scratch set checked out
+of the graph's pool (no clearing between queries), one heapq of (f, g, state)
+tuples with lazy deletion, a per-node heuristic cache, path reconstruction
+through came_from and the SearchStats bookkeeping.
+
+Searches take dense indices and one or several targets: with one target and
+a heuristic it is A*, with several it grows a Dijkstra tree until every
+target is settled. Bidirectional searches and the overlays (simplified
+chains, contraction hierarchy) are speed-ups modes put in front of these.
+"""
+import heapq
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .edge_turns import count_sharp_turns
+
+# Scratch state slots: the search states (node or edge ones) and the per-node heuristic cache.
+# Edge searches keep each node's first settled state in the node slot they leave free.
+STATE_SLOT, HEURISTIC_SLOT = 0, 1
+
+Heuristic = Callable[[int], float]
+# {target: (index path, cost, turn count)}; unreachable targets map to ([], inf, 0)
+SearchResults = Dict[int, Tuple[List[int], float, int]]
+
+
+def _no_heuristic(v: int) -> float:
+    return 0.0
+
+
+class NodeExpansion:
+    """
+    States are nodes. A node is relaxed along every edge slot leaving it, at
+    costs[slot] * factor (costs may differ by direction, like energy).
+    """
+
+    def __init__(self, costs: Sequence[float], factor: float = 1.0):
+        self.costs = costs
+        self.factor = factor
+
+    def search(self, graph, start: int, targets: Iterable[int], heuristic: Optional[Heuristic] = None,
+               stats=None) -> SearchResults:
+        """
+        Routes from start to every target. heuristic(v) must be a consistent
+        lower bound on the cost from v to the (single) target.
+        """
+        with graph.search_scratch():
+            return self._search(graph, start, targets, heuristic, stats)
+
+    def _search(self, graph, start: int, targets: Iterable[int], heuristic: Optional[Heuristic],
+                stats) -> SearchResults:
+        offsets, arcs = graph.offsets, graph.targets
+        costs, factor = self.costs, self.factor
+        bound = heuristic or _no_heuristic
+        pending = set(targets)
+        results: SearchResults = {}
+
+        state = graph.search_state(STATE_SLOT)
+        g, came_from, stamp, generation = state.g_score, state.came_from, state.stamp, state.generation
+        h_state = graph.search_state(HEURISTIC_SLOT)
+        h_values, h_stamp, h_gen = h_state.g_score, h_state.stamp, h_state.generation
+        g[start] = 0.0
+        came_from[start] = -1
+        stamp[start] = generation
+
+        heap = [(0.0, 0.0, start)]
+        expanded = skipped = heap_peak = 0
+
+        while heap:
+            if len(heap) > heap_peak: heap_peak = len(heap)
+            _, d, u = heapq.heappop(heap)
+            if d > g[u]: # Stale heap entry
+                skipped += 1
+                continue
+            expanded += 1
+            if u in pending:
+                pending.discard(u)
+                results[u] = (state.path_to(u), d, 0)
+                if not pending:
+                    break
+
+            for slot in range(offsets[u], offsets[u + 1]):
+                v = arcs[slot]
+                nd = d + costs[slot] * factor
+                if stamp[v] != generation or nd < g[v]:
+                    g[v] = nd
+                    came_from[v] = u
+                    stamp[v] = generation
+                    if h_stamp[v] == h_gen:
+                        h = h_values[v]
+                    else:
+                        h = h_values[v] = bound(v)
+                        h_stamp[v] = h_gen
+                    heapq.heappush(heap, (nd + h, nd, v))
+
+        if stats is not None:
+            stats.record(expanded, skipped, len(heap), heap_peak)
+        for target in pending:
+            results[target] = ([], math.inf, 0)
+        return results
+
+
+class EdgeExpansion:
+    """
+    States are directed edge slots (the line graph): the edge a node was
+    reached by, so each (node, incoming edge) pair keeps its own best cost.
+    Moving on from edge e to f costs costs[f], plus turn_penalty when the
+    turn between their headings is sharper than sharp_turn_rad. U-turns are
+    only allowed when passing back through the start.
+
+    A node's first settled state is its cheapest, and it has relaxed every
+    edge out of the node at most one turn penalty dearer than any later state
+    could; so a later state costing a full penalty more only has the edge the
+    first one couldn't take (its own U-turn) left to try. That keeps the
+    search exact while most states relax a single edge.
+    """
+
+    def __init__(self, costs: Sequence[float], headings: Sequence[float], turn_penalty: float,
+                 sharp_turn_rad: float):
+        self.costs = costs
+        self.headings = headings
+        self.turn_penalty = turn_penalty
+        self.sharp_turn_rad = sharp_turn_rad
+
+    def search(self, graph, start: int, targets: Iterable[int], heuristic: Optional[Heuristic] = None,
+               stats=None) -> SearchResults:
+        """
+        Routes from start to every target, with turn counts. heuristic(v) must
+        be a consistent lower bound on the cost from node v to the (single)
+        target; turn penalties only add cost, so distance bounds qualify.
+        """
+        with graph.search_scratch():
+            return self._search(graph, start, targets, heuristic, stats)
+
+    def _search(self, graph, start: int, targets: Iterable[int], heuristic: Optional[Heuristic],
+                stats) -> SearchResults:
+        offsets, arcs, twins = graph.offsets, graph.targets, graph.twins
+        costs, headings = self.costs, self.headings
+        penalty, sharp_turn_rad = self.turn_penalty, self.sharp_turn_rad
+        pi, two_pi = math.pi, 2 * math.pi
+        bound = heuristic or _no_heuristic
+        pending = set(targets)
+        results: SearchResults = {}
+        if start in pending:
+            pending.discard(start)
+            results[start] = ([start], 0.0, 0)
+
+        state = graph.edge_search_state(STATE_SLOT)
+        g, came_from, stamp, generation = state.g_score, state.came_from, state.stamp, state.generation
+        settled = graph.search_state(STATE_SLOT)
+        settled_g, settled_in, settled_stamp, settled_gen = (settled.g_score, settled.came_from, settled.stamp,
+                                                             settled.generation)
+        h_state = graph.search_state(HEURISTIC_SLOT)
+        h_values, h_stamp, h_gen = h_state.g_score, h_state.stamp, h_state.generation
+
+        # Roots: every edge leaving start, with no turn before it
+        heap = []
+        if pending:
+            for slot in range(offsets[start], offsets[start + 1]):
+                g[slot] = costs[slot]
+                came_from[slot] = -1
+                stamp[slot] = generation
+                heap.append((costs[slot] + bound(arcs[slot]), costs[slot], slot))
+            heapq.heapify(heap)
+        expanded = skipped = heap_peak = 0
+
+        while heap:
+            if len(heap) > heap_peak: heap_peak = len(heap)
+            _, d, e = heapq.heappop(heap)
+            if d > g[e]: # Stale heap entry
+                skipped += 1
+                continue
+            expanded += 1
+            current = arcs[e]
+
+            if current in pending:
+                # Consistent on the line graph too, so the first edge into a target is its best one
+                pending.discard(current)
+                edges = state.path_to(e)
+                results[current] = ([start] + [arcs[slot] for slot in edges], d,
+                                    count_sharp_turns(edges, headings, sharp_turn_rad))
+                if not pending:
+                    break
+
+            if settled_stamp[current] != settled_gen:
+                settled_stamp[current] = settled_gen
+                settled_g[current] = d
+                settled_in[current] = e
+                first, last = offsets[current], offsets[current + 1]
+            elif d >= settled_g[current] + penalty:
+                first = twins[settled_in[current]]
+                last = first + 1
+            else:
+                first, last = offsets[current], offsets[current + 1]
+
+            previous = arcs[twins[e]]
+            heading_in = headings[e]
+            for f in range(first, last):
+                neighbor = arcs[f]
+                # No U-turns, except when passing back through the start
+                if neighbor == previous and current != start: continue
+                change = headings[f] - heading_in
+                if change < 0: change = -change
+                if change > pi: change = two_pi - change
+                nd = d + costs[f] + penalty if change > sharp_turn_rad else d + costs[f]
+                if stamp[f] != generation or nd < g[f]:
+                    g[f] = nd
+                    came_from[f] = e
+                    stamp[f] = generation
+                    if h_stamp[neighbor] == h_gen:
+                        h = h_values[neighbor]
+                    else:
+                        h = h_values[neighbor] = bound(neighbor)
+                        h_stamp[neighbor] = h_gen
+                    heapq.heappush(heap, (nd + h, nd, f))
+
+        if stats is not None:
+            stats.record(expanded, skipped, len(heap), heap_peak)
+        for target in pending:
+            results[target] = ([], math.inf, 0)
+        return results
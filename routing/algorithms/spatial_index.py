@@ -0,0 +1,255 @@
+import heapq
+import math
+from array import array
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_METERS = 6371e3
+
+# Points per k-d tree leaf: leaves are scanned linearly, which beats descending further in Python.
+LEAF_SIZE = 24
+
+
+class EdgeSnap(NamedTuple):
+    """The closest point on an edge: fraction of the way from node u to node v (dense indices)."""
+    u: int
+    v: int
+    slot: int
+    fraction: float
+    lat: float
+    lon: float
+    distance: float
+
+
+class SpatialIndex:
+    """
+    Static k-d tree over the node coordinates of one routing graph.
+
+    Coordinates are projected to meters on a local equirectangular plane
+    (x = lon * cos(mean lat), y = lat), which is accurate to well under a
+    percent at city scale. The tree only ranks candidates; reported distances
+    are haversine meters. Nearest, k-nearest and radius queries all descend
+    in O(log n) and only scan the leaves that can still hold a closer point.
+    """
+
+    def __init__(self, graph, x: array, y: array, order: array, dims: bytearray, splits: array,
+                 leaf_bounds: array, cos_ref: float, max_edge_m: float):
+        self.graph = graph
+        self.cos_ref = cos_ref  # cos(reference latitude) of the projection
+        self.x = x            # projected coordinates, in tree (leaf) order
+        self.y = y
+        self.order = order    # tree position -> dense node index
+        # Complete binary tree in heap layout: node i has children 2i+1 and 2i+2.
+        # Internal nodes split on dims[i] (0 = x, 1 = y) at splits[i]; leaf j
+        # (node first_leaf + j) holds tree positions leaf_bounds[j]..leaf_bounds[j+1]-1.
+        self.dims = dims
+        self.splits = splits
+        self.leaf_bounds = leaf_bounds
+        self.first_leaf = len(dims)
+        self.max_edge_m = max_edge_m  # longest edge (projected), bounds the edge-snap search
+
+    @classmethod
+    def build(cls, graph) -> "SpatialIndex":
+        """
+        Builds the tree for graph (a GraphData), splitting every box at its median
+        along its wider axis.
+
+        Nodes are kept sorted by x and by y within each box; a level is built by
+        picking each box's median from the matching order and stably partitioning
+        both orders, all vectorized, so the whole build is O(n log n) in NumPy.
+        """
+        lat = np.frombuffer(graph.lat, dtype=np.float64)
+        lon = np.frombuffer(graph.lon, dtype=np.float64)
+        n = len(lat)
+        cos_ref = math.cos(math.radians(float(lat.mean()))) if n else 1.0
+        x, y = _project(lat, lon, cos_ref)
+
+        by_x = np.argsort(x, kind='stable')
+        by_y = np.argsort(y, kind='stable')
+        bounds = np.array([0, n], dtype=np.int64)
+        dims_parts, splits_parts = [], []
+        positions = np.arange(n, dtype=np.int64)
+        while n > LEAF_SIZE and bounds[1] - bounds[0] > LEAF_SIZE:
+            starts, ends = bounds[:-1], bounds[1:]
+            box_of = np.repeat(np.arange(len(starts)), ends - starts)
+            split_y = (y[by_y[ends - 1]] - y[by_y[starts]]) > (x[by_x[ends - 1]] - x[by_x[starts]])
+            mids = starts + (ends - starts) // 2
+
+            chosen = np.where(split_y[box_of], by_y, by_x)
+            median = chosen[mids]
+            dims_parts.append(split_y.astype(np.uint8))
+            splits_parts.append(np.where(split_y, y[median], x[median]))
+
+            box_start, box_mid = starts[box_of], mids[box_of]
+            goes_left = np.empty(n, dtype=bool)
+            goes_left[chosen] = positions < box_mid
+            offset_in_box = positions - box_start
+            by_x = _stable_partition(by_x, goes_left[by_x], box_start, box_mid, offset_in_box)
+            by_y = _stable_partition(by_y, goes_left[by_y], box_start, box_mid, offset_in_box)
+            bounds = np.empty(2 * len(starts) + 1, dtype=np.int64)
+            bounds[0:-1:2], bounds[1::2], bounds[-1] = starts, mids, n
+
+        order = by_x
+        dims = bytearray(np.concatenate(dims_parts).tobytes()) if dims_parts else bytearray()
+        splits = np.concatenate(splits_parts) if splits_parts else np.empty(0)
+
+        max_edge_m = 0.0
+        if graph.edge_count:
+            offsets = np.frombuffer(graph.offsets, dtype=np.int64)
+            sources = np.repeat(np.arange(n), np.diff(offsets))
+            targets = np.frombuffer(graph.targets, dtype=np.int64)
+            max_edge_m = float(np.hypot(x[targets] - x[sources], y[targets] - y[sources]).max())
+
+        return cls(graph, array('d', x[order].tolist()), array('d', y[order].tolist()), array('q', order.tolist()),
+                   dims, array('d', splits.tolist()), array('q', bounds.tolist()), cos_ref, max_edge_m)
+
+    def nearest(self, lat: float, lon: float, k: int = 1,
+                max_distance: Optional[float] = None) -> List[Tuple[int, float]]:
+        """Up to k (dense index, meters) pairs closest to (lat, lon), nearest first."""
+        if k <= 0 or not self.order:
+            return []
+        qx, qy = self._project_point(lat, lon)
+        limit = math.inf if max_distance is None else _pad(max_distance) ** 2
+        found = self._search(qx, qy, k, limit)
+        return self._finish(lat, lon, found, max_distance)
+
+    def within(self, lat: float, lon: float, radius: float, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Every (dense index, meters) pair within radius meters of (lat, lon), nearest first, at most limit."""
+        if not self.order:
+            return []
+        qx, qy = self._project_point(lat, lon)
+        found = self._search(qx, qy, len(self.order), _pad(radius) ** 2)
+        result = self._finish(lat, lon, found, radius)
+        return result if limit is None else result[:limit]
+
+    def nearest_edge(self, lat: float, lon: float, max_distance: Optional[float] = None) -> Optional[EdgeSnap]:
+        """
+        The closest point on any edge to (lat, lon), or None if the graph has no
+        edge within max_distance meters.
+
+        The closest edge point is never farther than the closest node, and one of
+        that edge's ends lies within half its length of the point, so only edges
+        touching a node within (nearest node + longest edge / 2) are checked.
+        """
+        graph = self.graph
+        closest = self.nearest(lat, lon)
+        if not closest or not graph.edge_count:
+            return None
+        qx, qy = self._project_point(lat, lon)
+        reach = _pad(closest[0][1]) + self.max_edge_m / 2
+        candidates = self._search(qx, qy, len(self.order), reach * reach)
+
+        offsets, targets = graph.offsets, graph.targets
+        cos_ref = self.cos_ref
+        best = None
+        best_d2 = math.inf
+        for _, u in candidates:
+            ux, uy = _project_one(graph.lat[u], graph.lon[u], cos_ref)
+            for slot in range(offsets[u], offsets[u + 1]):
+                v = targets[slot]
+                vx, vy = _project_one(graph.lat[v], graph.lon[v], cos_ref)
+                dx, dy = vx - ux, vy - uy
+                length_sq = dx * dx + dy * dy
+                t = 0.0 if length_sq == 0 else min(1.0, max(0.0, ((qx - ux) * dx + (qy - uy) * dy) / length_sq))
+                ex, ey = ux + t * dx - qx, uy + t * dy - qy
+                d2 = ex * ex + ey * ey
+                if d2 < best_d2:
+                    best, best_d2 = (u, v, slot, t), d2
+
+        if best is None:
+            return None
+        u, v, slot, t = best
+        snap_lat = graph.lat[u] + t * (graph.lat[v] - graph.lat[u])
+        snap_lon = graph.lon[u] + t * (graph.lon[v] - graph.lon[u])
+        distance = _haversine(lat, lon, snap_lat, snap_lon)
+        if max_distance is not None and distance > max_distance:
+            return None
+        return EdgeSnap(u, v, slot, t, snap_lat, snap_lon, distance)
+
+    def approx_bytes(self) -> int:
+        return (sum(arr.itemsize * len(arr) for arr in (self.x, self.y, self.order, self.splits, self.leaf_bounds))
+                + len(self.dims))
+
+    # --- internals ---
+
+    def _project_point(self, lat: float, lon: float) -> Tuple[float, float]:
+        return _project_one(lat, lon, self.cos_ref)
+
+    def _search(self, qx: float, qy: float, k: int, limit_sq: float) -> List[Tuple[float, int]]:
+        """Up to k (-squared projected distance, dense index) pairs within sqrt(limit_sq), as a max-heap."""
+        xs, ys, order = self.x, self.y, self.order
+        dims, splits, leaf_bounds, first_leaf = self.dims, self.splits, self.leaf_bounds, self.first_leaf
+        heap: List[Tuple[float, int]] = []
+        worst = limit_sq
+        stack = [(0, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if bound > worst:
+                continue
+            if node >= first_leaf:
+                leaf = node - first_leaf
+                for i in range(leaf_bounds[leaf], leaf_bounds[leaf + 1]):
+                    dx, dy = xs[i] - qx, ys[i] - qy
+                    d2 = dx * dx + dy * dy
+                    if d2 > worst:
+                        continue
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-d2, order[i]))
+                        if len(heap) == k:
+                            worst = -heap[0][0]
+                    else:
+                        heapq.heapreplace(heap, (-d2, order[i]))
+                        worst = -heap[0][0]
+                continue
+            diff = (qy if dims[node] else qx) - splits[node]
+            near, far = (2 * node + 1, 2 * node + 2) if diff < 0 else (2 * node + 2, 2 * node + 1)
+            # Far side first, so the near side is popped (and tightens worst) before it
+            stack.append((far, max(bound, diff * diff)))
+            stack.append((near, bound))
+        return heap
+
+    def _finish(self, lat: float, lon: float, found: List[Tuple[float, int]],
+                max_distance: Optional[float]) -> List[Tuple[int, float]]:
+        graph = self.graph
+        result = [(index, _haversine(lat, lon, graph.lat[index], graph.lon[index])) for _, index in found]
+        if max_distance is not None:
+            result = [item for item in result if item[1] <= max_distance]
+        result.sort(key=lambda item: item[1])
+        return result
+
+
+def _stable_partition(order: np.ndarray, goes_left: np.ndarray, box_start: np.ndarray, box_mid: np.ndarray,
+                      offset_in_box: np.ndarray) -> np.ndarray:
+    """
+    Moves the goes_left entries of every box of order to the front of the box
+    (the others from its mid on), keeping their relative order. box_start,
+    box_mid and offset_in_box are given per position.
+    """
+    left_rank = np.cumsum(goes_left)
+    # Left entries up to and including each position, counted from the start of its box
+    left_in_box = left_rank - (left_rank[box_start] - goes_left[box_start])
+    target = np.where(goes_left, box_start + left_in_box - 1, box_mid + offset_in_box - left_in_box)
+    out = np.empty_like(order)
+    out[target] = order
+    return out
+
+
+def _project(lat: np.ndarray, lon: np.ndarray, cos_ref: float) -> Tuple[np.ndarray, np.ndarray]:
+    return np.radians(lon) * cos_ref * EARTH_RADIUS_METERS, np.radians(lat) * EARTH_RADIUS_METERS
+
+
+def _project_one(lat: float, lon: float, cos_ref: float) -> Tuple[float, float]:
+    return math.radians(lon) * cos_ref * EARTH_RADIUS_METERS, math.radians(lat) * EARTH_RADIUS_METERS
+
+
+def _pad(meters: float) -> float:
+    """Projected and haversine distances differ slightly away from the reference latitude."""
+    return meters * 1.01 + 1.0
+
+
+def _haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(min(1.0, a)))
@@ -0,0 +1,14 @@
+"""
+Offline routing benchmarks.
+
+Each module can be run directly, e.g. ``python -m routing.benchmarks.csr_vs_dict``.
+They only need the project settings, not a running server or network access.
+"""
+import os
+
+
+def setup_django():
+    """Configures Django so routing modules can be imported from a plain script."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wayplot_project.settings')
+    import django
+    django.setup()
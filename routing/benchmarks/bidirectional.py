@@ -0,0 +1,72 @@
+"""
+Unidirectional vs bidirectional search on long cross-map routes.
+
+    python -m routing.benchmarks.bidirectional --rows 120 --cols 120 --queries 60
+
+Routes run between opposite edges of the grid, where a one-sided search
+explores the most.
+"""
+import argparse
+import math
+import random
+import time
+
+from . import setup_django
+from .generators import grid_graph
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def run(search, pairs, graph, SearchStats, **kwargs):
+    """Returns (costs, nodes expanded per query, latencies in ms)."""
+    costs, expanded, latencies = [], [], []
+    for s, t in pairs:
+        stats = SearchStats()
+        started = time.perf_counter()
+        result = search(s, t, graph, stats=stats, **kwargs)
+        latencies.append(1000 * (time.perf_counter() - started))
+        costs.append(result[1])
+        expanded.append(stats.nodes_expanded)
+    return costs, expanded, latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bidirectional search benchmark")
+    parser.add_argument('--rows', type=int, default=120)
+    parser.add_argument('--cols', type=int, default=120)
+    parser.add_argument('--detour', type=float, default=1.5)
+    parser.add_argument('--queries', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from routing.utils.routingUtil import build_graph_data, least_turn_astar, shortest_path_astar
+    from routing.utils.search_state import SearchStats
+
+    data = grid_graph(args.rows, args.cols, seed=args.seed, detour=args.detour)
+    graph = build_graph_data(data)
+    print(f"grid {args.rows}x{args.cols}: {graph.node_count} nodes")
+
+    # Left column to right column: long cross-campus routes
+    rnd = random.Random(args.seed)
+    pairs = [(rnd.randrange(args.rows) * args.cols, rnd.randrange(args.rows) * args.cols + args.cols - 1)
+             for _ in range(args.queries)]
+
+    for name, search in (("shortest", shortest_path_astar), ("least_turn", least_turn_astar)):
+        print(f"{name}:")
+        results = {}
+        for label, bidirectional in (("one-way", False), ("bidirectional", True)):
+            costs, expanded, latencies = run(search, pairs, graph, SearchStats, bidirectional=bidirectional)
+            results[label] = costs
+            print(f"  {label:14}{sum(expanded) / len(expanded):10.0f} nodes/query"
+                  f"{percentile(latencies, 0.5):10.2f} ms p50{percentile(latencies, 0.99):10.2f} ms p99")
+        worse = sum(1 for a, b in zip(results["one-way"], results["bidirectional"])
+                    if b > a and not math.isclose(a, b, rel_tol=1e-9))
+        print(f"  bidirectional costlier on {worse}/{len(pairs)} routes")
+
+
+if __name__ == '__main__':
+    main()
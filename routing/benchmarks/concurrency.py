@@ -0,0 +1,134 @@
+"""
+Stress test: many threads routing across several maps while they are reloaded.
+
+    python -m routing.benchmarks.concurrency --maps 4 --threads 8 --seconds 10
+
+Every thread picks a random map and mode, takes the graph from a shared
+GraphCache (smaller than the number of maps, so graphs are evicted and
+reloaded) and checks each route's cost against a single-threaded reference.
+A separate thread keeps invalidating maps mid-flight. Any mismatch or error
+means a search saw another request's graph or scratch state.
+"""
+import argparse
+import math
+import random
+import threading
+import time
+
+from . import setup_django
+from .bidirectional import percentile
+from .generators import grid_graph
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--maps', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=40)
+    parser.add_argument('--cols', type=int, default=40)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--pairs', type=int, default=20, help="route pairs per map")
+    parser.add_argument('--cache-entries', type=int, default=None, help="graph cache size (default: maps - 1)")
+    parser.add_argument('--invalidate-every', type=float, default=0.2, help="seconds between invalidations, 0 for none")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from routing.utils.graph_cache import GraphCache
+    from routing.utils.routingUtil import ROUTING_MODES, build_graph_data, prepare_graph, route_by_mode
+
+    # Maps of different sizes and places, so a route answered from the wrong map shows up as a wrong cost
+    maps = {}
+    for m in range(args.maps):
+        data = grid_graph(args.rows + 3 * m, args.cols + 2 * m, seed=args.seed + m, base_lat=12.97 + m, base_lon=77.59 + m)
+        maps[f"stress://map-{m}"] = data
+
+    loads = []
+    loads_lock = threading.Lock()
+
+    def loader(url):
+        graph = build_graph_data(maps[url], source_url=url)
+        prepare_graph(graph)
+        with loads_lock:
+            loads.append(url)
+        return graph.freeze()
+
+    rnd = random.Random(args.seed)
+    references = {}
+    for url, data in maps.items():
+        graph = loader(url)
+        ids = [node['id'] for node in data['nodes']]
+        for _ in range(args.pairs):
+            s, t = rnd.choice(ids), rnd.choice(ids)
+            for mode in ROUTING_MODES:
+                # Both search directions, which share no code with each other
+                for bidirectional in (False, True):
+                    references[(url, mode, s, t, bidirectional)] = route_by_mode(s, t, graph, mode,
+                                                                                bidirectional=bidirectional)[1]
+    cases = list(references)
+    print(f"{args.maps} maps ({', '.join(str(len(d['nodes'])) for d in maps.values())} nodes), "
+          f"{len(cases)} reference routes, {args.threads} threads for {args.seconds:g} s")
+    loads.clear()
+
+    cache = GraphCache(max_entries=args.cache_entries or max(1, args.maps - 1))
+    stop = threading.Event()
+    counters_lock = threading.Lock()
+    latencies, mismatches, errors = [], [], []
+
+    def worker(worker_seed):
+        wrnd = random.Random(worker_seed)
+        local_latencies = []
+        while not stop.is_set():
+            url, mode, s, t, bidirectional = case = wrnd.choice(cases)
+            started = time.perf_counter()
+            try:
+                # One graph reference for the whole "request", as the views do
+                graph = cache.get_or_load(url, loader)
+                path, cost, _ = route_by_mode(s, t, graph, mode, bidirectional=bidirectional)
+            except Exception as e:
+                with counters_lock:
+                    errors.append(f"{url} {mode} {s}->{t}: {e!r}")
+                continue
+            local_latencies.append(1000 * (time.perf_counter() - started))
+            expected = references[case]
+            ok = cost == expected or math.isclose(cost, expected, rel_tol=1e-9)
+            if ok and path:
+                ok = path[0] == s and path[-1] == t
+            if not ok:
+                with counters_lock:
+                    mismatches.append(f"{url} {mode} {s}->{t}: {cost} != {expected}")
+        with counters_lock:
+            latencies.extend(local_latencies)
+
+    def invalidator():
+        irnd = random.Random(args.seed + 1)
+        urls = list(maps)
+        while not stop.wait(args.invalidate_every):
+            cache.invalidate(irnd.choice(urls) if irnd.random() < 0.9 else None)
+
+    threads = [threading.Thread(target=worker, args=(args.seed + 100 + i,)) for i in range(args.threads)]
+    if args.invalidate_every > 0:
+        threads.append(threading.Thread(target=invalidator))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    stats = cache.stats()
+    print(f"routes: {len(latencies)} ({len(latencies) / elapsed:.0f}/s), "
+          f"{percentile(latencies, 0.5) if latencies else 0:.2f} ms p50, "
+          f"{percentile(latencies, 0.99) if latencies else 0:.2f} ms p99")
+    print(f"graph loads: {len(loads)}, cache hits {stats['hits']}, misses {stats['misses']}, "
+          f"coalesced {stats['coalesced']}, evictions {stats['evictions']}")
+    print(f"mismatches: {len(mismatches)}, errors: {len(errors)}")
+    for line in (mismatches + errors)[:10]:
+        print(f"  {line}")
+    return 1 if mismatches or errors else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
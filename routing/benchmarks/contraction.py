@@ -0,0 +1,64 @@
+"""
+Contraction Hierarchies: preprocessing cost and query speedup over plain A*.
+
+    python -m routing.benchmarks.contraction --rows 60 --cols 60 --queries 200
+"""
+import argparse
+import math
+import random
+import time
+
+from . import setup_django
+from .generators import grid_graph
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Contraction Hierarchies benchmark")
+    parser.add_argument('--rows', type=int, default=60)
+    parser.add_argument('--cols', type=int, default=60)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from routing.algorithms.contraction_hierarchy import ContractionHierarchy
+    from routing.utils.routingUtil import build_graph_data, shortest_path_astar
+
+    data = grid_graph(args.rows, args.cols, seed=args.seed)
+    graph = build_graph_data(data)
+    print(f"grid {args.rows}x{args.cols}: {graph.node_count} nodes, {graph.edge_count // 2} edges")
+
+    started = time.perf_counter()
+    ch = ContractionHierarchy.build(graph)
+    build_s = time.perf_counter() - started
+    print(f"preprocessing: {build_s:.2f} s, {ch.shortcut_count} shortcuts, "
+          f"{ch.approx_bytes() / 2**20:.1f} MiB")
+
+    rnd = random.Random(args.seed)
+    ids = [node['id'] for node in data['nodes']]
+    pairs = [(rnd.choice(ids), rnd.choice(ids)) for _ in range(args.queries)]
+
+    started = time.perf_counter()
+    astar = [shortest_path_astar(s, t, graph) for s, t in pairs]
+    astar_s = time.perf_counter() - started
+
+    graph.contraction_hierarchy = ch
+    started = time.perf_counter()
+    via_ch = [shortest_path_astar(s, t, graph) for s, t in pairs]
+    ch_s = time.perf_counter() - started
+
+    mismatches = sum(
+        1 for (_, a), (_, b) in zip(astar, via_ch)
+        if not (a == b or math.isclose(a, b, rel_tol=1e-9))
+    )
+    same_path = sum(1 for (a, _), (b, _) in zip(astar, via_ch) if a == b)
+
+    print(f"A*:  {1000 * astar_s / len(pairs):8.3f} ms/query")
+    print(f"CH:  {1000 * ch_s / len(pairs):8.3f} ms/query  ({astar_s / ch_s:.1f}x)")
+    print(f"cost mismatches: {mismatches}, identical paths: {same_path}/{len(pairs)}")
+    if ch_s < astar_s:
+        print(f"preprocessing pays off after ~{build_s / ((astar_s - ch_s) / len(pairs)):.0f} queries")
+
+
+if __name__ == '__main__':
+    main()
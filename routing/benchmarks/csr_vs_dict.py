@@ -0,0 +1,125 @@
+"""
+Memory and speed comparison of the CSR GraphData against the old dict-of-lists graph.
+
+    python -m routing.benchmarks.csr_vs_dict --rows 500 --cols 500 --queries 20
+"""
+import argparse
+import gc
+import heapq
+import math
+import random
+import time
+import tracemalloc
+
+from . import setup_django
+from .generators import grid_graph
+
+
+# --- Reference implementation: the dict-based graph this module replaced ---
+
+def build_dict_graph(data):
+    node_coords = {}
+    graph_adj = {}
+    for node in data['nodes']:
+        node_coords[node['id']] = (node['lat'], node['lon'])
+    for edge in data['edges']:
+        u, v, w = edge['u'], edge['v'], edge['weight']
+        graph_adj.setdefault(u, []).append((v, w))
+        graph_adj.setdefault(v, []).append((u, w))
+    return node_coords, graph_adj
+
+
+def dict_shortest_path(start_id, goal_id, node_coords, graph_adj, haversine_distance):
+    open_set = [(0, 0, start_id)]
+    came_from = {}
+    g_score = {node_id: math.inf for node_id in node_coords}
+    g_score[start_id] = 0
+    goal_lat, goal_lon = node_coords[goal_id]
+
+    while open_set:
+        _, current_g, current = heapq.heappop(open_set)
+        if current_g > g_score[current]:
+            continue
+        if current == goal_id:
+            path = [current]
+            while current in came_from:
+                current = came_from[current]
+                path.append(current)
+            return path[::-1], g_score[goal_id]
+        for neighbor, weight in graph_adj.get(current, []):
+            tentative_g = current_g + weight
+            if tentative_g < g_score[neighbor]:
+                came_from[neighbor] = current
+                g_score[neighbor] = tentative_g
+                lat, lon = node_coords[neighbor]
+                h = haversine_distance(lat, lon, goal_lat, goal_lon)
+                heapq.heappush(open_set, (tentative_g + h, tentative_g, neighbor))
+    return [], math.inf
+
+
+# --- Measurement helpers ---
+
+def measure_build(build, data):
+    """
+    Returns (result, seconds, bytes retained) for build(data).
+
+    Timing and memory come from separate runs because tracemalloc slows down
+    allocation-heavy code by an order of magnitude.
+    """
+    gc.collect()
+    started = time.perf_counter()
+    result = build(data)
+    elapsed = time.perf_counter() - started
+    del result
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(data)
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, elapsed, retained
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=300)
+    parser.add_argument('--cols', type=int, default=300)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from routing.utils.routingUtil import build_graph_data, haversine_distance, shortest_path_astar
+
+    data = grid_graph(args.rows, args.cols, seed=args.seed)
+    print(f"grid {args.rows}x{args.cols}: {len(data['nodes'])} nodes, {len(data['edges'])} edges")
+
+    (node_coords, graph_adj), dict_build_s, dict_bytes = measure_build(build_dict_graph, data)
+    csr, csr_build_s, csr_bytes = measure_build(build_graph_data, data)
+
+    rnd = random.Random(args.seed)
+    ids = [node['id'] for node in data['nodes']]
+    pairs = [(rnd.choice(ids), rnd.choice(ids)) for _ in range(args.queries)]
+
+    started = time.perf_counter()
+    dict_costs = [dict_shortest_path(s, t, node_coords, graph_adj, haversine_distance)[1] for s, t in pairs]
+    dict_query_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    csr_costs = [shortest_path_astar(s, t, csr)[1] for s, t in pairs]
+    csr_query_s = time.perf_counter() - started
+
+    mismatches = sum(1 for a, b in zip(dict_costs, csr_costs) if not math.isclose(a, b, rel_tol=1e-9))
+
+    directed = csr.edge_count or 1
+    print(f"{'':8}{'build s':>10}{'MiB':>10}{'B/edge':>10}{'query ms':>12}")
+    print(f"{'dict':8}{dict_build_s:>10.3f}{dict_bytes / 2**20:>10.1f}{dict_bytes / directed:>10.1f}"
+          f"{1000 * dict_query_s / len(pairs):>12.2f}")
+    print(f"{'csr':8}{csr_build_s:>10.3f}{csr_bytes / 2**20:>10.1f}{csr_bytes / directed:>10.1f}"
+          f"{1000 * csr_query_s / len(pairs):>12.2f}")
+    print(f"cost mismatches: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import math
+import random
+from typing import Any, Dict
+
+EARTH_RADIUS_METERS = 6371e3
+
+# Roughly 55 m between neighbouring grid nodes at campus latitudes.
+GRID_STEP_DEG = 0.0005
+
+
+def grid_graph(rows: int, cols: int, seed: int = 0, base_lat: float = 12.97, base_lon: float = 77.59,
+               keep_edge_prob: float = 0.9, detour: float = 1.3) -> Dict[str, Any]:
+    """
+    Builds a jittered rows x cols grid in the map JSON schema ({'nodes': [...], 'edges': [...]}).
+
+    Each edge weight is its straight-line length times a random detour factor in
+    [1, detour], so the haversine heuristic stays admissible.
+    """
+    rnd = random.Random(seed)
+    nodes = []
+    for r in range(rows):
+        for c in range(cols):
+            nodes.append({
+                'id': r * cols + c,
+                'lat': base_lat + r * GRID_STEP_DEG + rnd.uniform(-0.2, 0.2) * GRID_STEP_DEG,
+                'lon': base_lon + c * GRID_STEP_DEG + rnd.uniform(-0.2, 0.2) * GRID_STEP_DEG,
+            })
+
+    edges = []
+    for r in range(rows):
+        for c in range(cols):
+            u = r * cols + c
+            if c + 1 < cols and rnd.random() < keep_edge_prob:
+                edges.append(_edge(nodes, u, u + 1, rnd.uniform(1.0, detour)))
+            if r + 1 < rows and rnd.random() < keep_edge_prob:
+                edges.append(_edge(nodes, u, u + cols, rnd.uniform(1.0, detour)))
+
+    return {'nodes': nodes, 'edges': edges}
+
+
+def _edge(nodes, u: int, v: int, detour: float) -> Dict[str, Any]:
+    a, b = nodes[u], nodes[v]
+    return {'u': u, 'v': v, 'weight': _haversine(a['lat'], a['lon'], b['lat'], b['lon']) * detour}
+
+
+def _haversine(lat1, lon1, lat2, lon2) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_METERS * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def trail_network(rows: int, cols: int, points_per_edge: int = 20, seed: int = 0, base_lat: float = 12.97,
+                  base_lon: float = 77.59, keep_edge_prob: float = 0.9) -> Dict[str, Any]:
+    """
+    Builds a GPX-like trail map: a jittered rows x cols grid of junctions whose
+    edges are wiggly tracks of points_per_edge trackpoints each.
+
+    Nearly every node has degree 2, as in maps built from recorded tracks.
+    Edge weights are the haversine lengths between consecutive trackpoints.
+    """
+    rnd = random.Random(seed)
+    nodes = []
+    for r in range(rows):
+        for c in range(cols):
+            nodes.append({
+                'id': r * cols + c,
+                'lat': base_lat + r * GRID_STEP_DEG + rnd.uniform(-0.2, 0.2) * GRID_STEP_DEG,
+                'lon': base_lon + c * GRID_STEP_DEG + rnd.uniform(-0.2, 0.2) * GRID_STEP_DEG,
+            })
+
+    edges = []
+    wiggle = 0.3 * GRID_STEP_DEG / points_per_edge
+    for r in range(rows):
+        for c in range(cols):
+            u = r * cols + c
+            for v in (u + 1 if c + 1 < cols else None, u + cols if r + 1 < rows else None):
+                if v is None or rnd.random() >= keep_edge_prob:
+                    continue
+                a, b = nodes[u], nodes[v]
+                prev = u
+                for k in range(1, points_per_edge):
+                    t = k / points_per_edge
+                    point = len(nodes)
+                    nodes.append({
+                        'id': point,
+                        'lat': a['lat'] + t * (b['lat'] - a['lat']) + rnd.uniform(-1, 1) * wiggle,
+                        'lon': a['lon'] + t * (b['lon'] - a['lon']) + rnd.uniform(-1, 1) * wiggle,
+                    })
+                    edges.append(_edge(nodes, prev, point, 1.0))
+                    prev = point
+                edges.append(_edge(nodes, prev, v, 1.0))
+
+    return {'nodes': nodes, 'edges': edges}
+
+
+def random_geometric_graph(n: int, neighbors: int = 4, seed: int = 0, base_lat: float = 12.97,
+                           base_lon: float = 77.59) -> Dict[str, Any]:
+    """
+    Builds n nodes scattered uniformly over a square (about GRID_STEP_DEG apart
+    on average), each joined to its neighbors nearest nodes.
+
+    Unlike a grid, node degrees vary and edges cross at any angle, like an
+    irregular footpath network. Edge weights are haversine lengths. Nodes are
+    bucketed into cells, so building stays linear in n.
+    """
+    rnd = random.Random(seed)
+    side = math.sqrt(n) * GRID_STEP_DEG
+    nodes = [{'id': i, 'lat': base_lat + rnd.random() * side, 'lon': base_lon + rnd.random() * side}
+             for i in range(n)]
+
+    cells: Dict[Any, list] = {}
+    for node in nodes:
+        key = (int((node['lat'] - base_lat) / GRID_STEP_DEG), int((node['lon'] - base_lon) / GRID_STEP_DEG))
+        cells.setdefault(key, []).append(node['id'])
+
+    edges, seen = [], set()
+    for node in nodes:
+        ci, cj = int((node['lat'] - base_lat) / GRID_STEP_DEG), int((node['lon'] - base_lon) / GRID_STEP_DEG)
+        # Widen the search ring until it holds enough candidates
+        ring = 1
+        while True:
+            candidates = [v for di in range(-ring, ring + 1) for dj in range(-ring, ring + 1)
+                          for v in cells.get((ci + di, cj + dj), ()) if v != node['id']]
+            if len(candidates) >= neighbors or ring * GRID_STEP_DEG > side:
+                break
+            ring += 1
+        lat, lon = node['lat'], node['lon']
+        candidates.sort(key=lambda v: (nodes[v]['lat'] - lat) ** 2 + (nodes[v]['lon'] - lon) ** 2)
+        for v in candidates[:neighbors]:
+            pair = (min(node['id'], v), max(node['id'], v))
+            if pair not in seen:
+                seen.add(pair)
+                edges.append(_edge(nodes, pair[0], pair[1], 1.0))
+
+    return {'nodes': nodes, 'edges': edges}
+
+
+GPX_HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<gpx version="1.1" creator="wayplot-benchmark" xmlns="http://www.topografix.com/GPX/1/1">\n'
+              '<trk><name>synthetic</name>\n')
+GPX_FOOTER = '</trk>\n</gpx>\n'
+
+
+def trail_gpx(rows: int, cols: int, points_per_edge: int = 10, passes: int = 2, noise_m: float = 1.0,
+              seed: int = 0) -> bytes:
+    """
+    GPX recording of walks over the trail_network() map: every trail is
+    recorded passes times as its own track segment, with up to noise_m of GPS
+    noise per point (keep it under the snap tolerance so repeated passes merge).
+
+    Building a graph from it (graph_builder.build_graph) gives back roughly the
+    trail network: repeated points snap together and segments join at junctions.
+    """
+    data = trail_network(rows, cols, points_per_edge, seed=seed)
+    coords = [(node['lat'], node['lon']) for node in data['nodes']]
+    rnd = random.Random(seed + 1)
+    noise_deg = noise_m / 111_320.0
+    out = [GPX_HEADER]
+
+    # trail_network() emits each trail's edges in order: junction, points..., junction
+    trail = []
+    for edge in data['edges']:
+        if not trail:
+            trail.append(edge['u'])
+        trail.append(edge['v'])
+        if len(trail) == points_per_edge + 1:
+            for _ in range(passes):
+                out.append('<trkseg>\n')
+                for point in trail:
+                    lat, lon = coords[point]
+                    out.append(f'<trkpt lat="{lat + rnd.uniform(-noise_deg, noise_deg):.7f}" '
+                               f'lon="{lon + rnd.uniform(-noise_deg, noise_deg):.7f}"><ele>900.0</ele></trkpt>\n')
+                out.append('</trkseg>\n')
+            trail = []
+    out.append(GPX_FOOTER)
+    return ''.join(out).encode('utf-8')
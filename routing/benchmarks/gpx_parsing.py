@@ -0,0 +1,114 @@
+"""
+Peak memory and throughput of the streaming GPX parser against a full ElementTree parse.
+
+    python -m routing.benchmarks.gpx_parsing --points 2000000 --segments 20
+
+Each parser runs in its own child process so their peak RSS can't mix.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+from .generators import GPX_FOOTER, GPX_HEADER
+
+
+def write_synthetic_gpx(path, points, segments, seed=0):
+    """Writes a GPX file with points trackpoints (with elevation and time) split over segments."""
+    rnd = random.Random(seed)
+    per_segment = max(1, points // segments)
+    lat, lon, ele = 12.97, 77.59, 900.0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(GPX_HEADER)
+        written = 0
+        while written < points:
+            f.write('<trkseg>\n')
+            for _ in range(min(per_segment, points - written)):
+                lat += rnd.uniform(-1e-4, 1e-4)
+                lon += rnd.uniform(-1e-4, 1e-4)
+                ele += rnd.uniform(-0.5, 0.5)
+                f.write(f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}"><ele>{ele:.1f}</ele>'
+                        f'<time>2024-01-01T00:00:00Z</time></trkpt>\n')
+                written += 1
+            f.write('</trkseg>\n')
+        f.write(GPX_FOOTER)
+
+
+# --- Parsers under test (run in the child process) ---
+
+def parse_tree(path):
+    """The previous approach: read the whole file, build the full tree, then walk it."""
+    with open(path, 'rb') as f:
+        content = f.read()
+    root = ET.parse(io.BytesIO(content)).getroot()
+    ns = {'gpx': 'http://www.topografix.com/GPX/1/1'}
+    count = 0
+    for trk in root.findall('.//gpx:trk', ns):
+        for trkseg in trk.findall('.//gpx:trkseg', ns):
+            segment = [(float(p.get('lat')), float(p.get('lon'))) for p in trkseg.findall('.//gpx:trkpt', ns)]
+            count += len(segment)
+    return count
+
+
+def parse_streaming(path):
+    from routing.utils.gpx_parser import iter_gpx_segments
+    with open(path, 'rb') as f:
+        return sum(len(segment) for segment in iter_gpx_segments(f))
+
+
+PARSERS = {'tree': parse_tree, 'streaming': parse_streaming}
+
+
+def run_child(parser, path):
+    started = time.perf_counter()
+    points = PARSERS[parser](path)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    print(json.dumps({
+        'points': points,
+        'seconds': elapsed,
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+    }))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--points', type=int, default=1000000)
+    parser.add_argument('--segments', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--child', choices=sorted(PARSERS), help=argparse.SUPPRESS)
+    parser.add_argument('--file', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args.child, args.file)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'synthetic.gpx')
+        write_synthetic_gpx(path, args.points, args.segments, seed=args.seed)
+        size = os.path.getsize(path)
+        print(f"synthetic GPX: {args.points} points in {args.segments} segments, {size / 2**20:.1f} MiB")
+
+        print(f"{'':10}{'points':>10}{'seconds':>10}{'MiB/s':>10}{'pts/s':>12}{'peak RSS MiB':>14}")
+        for name in ('tree', 'streaming'):
+            output = subprocess.run(
+                [sys.executable, '-m', 'routing.benchmarks.gpx_parsing', '--child', name, '--file', path],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{name:10}{result['points']:>10}{result['seconds']:>10.2f}"
+                  f"{size / 2**20 / result['seconds']:>10.1f}{result['points'] / result['seconds']:>12.0f}"
+                  f"{result['peak_rss'] / 2**20:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Cold-load comparison of JSON maps against memory-mapped binary graph files.
+
+    python -m routing.benchmarks.graph_format --rows 500 --cols 500 --queries 20
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from . import setup_django
+from .generators import grid_graph
+
+
+def measure_load(load):
+    """Returns (graph, seconds, peak traced bytes) for load(); timing and memory use separate runs."""
+    gc.collect()
+    started = time.perf_counter()
+    graph = load()
+    elapsed = time.perf_counter() - started
+    del graph
+
+    gc.collect()
+    tracemalloc.start()
+    graph = load()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return graph, elapsed, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=300)
+    parser.add_argument('--cols', type=int, default=300)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from routing.utils.graph_format import encode_graph, map_graph_file, write_graph_file
+    from routing.utils.routingUtil import GraphData, build_graph_data, shortest_path_astar
+
+    data = grid_graph(args.rows, args.cols, seed=args.seed)
+    json_bytes = json.dumps(data).encode('utf-8')
+    bin_bytes = encode_graph(build_graph_data(data))
+    print(f"grid {args.rows}x{args.cols}: {len(data['nodes'])} nodes, {len(data['edges'])} edges")
+    print(f"file size: json {len(json_bytes) / 2**20:.1f} MiB, binary {len(bin_bytes) / 2**20:.1f} MiB")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'map.wpg')
+        write_graph_file(bin_bytes, path)
+
+        json_graph, json_s, json_peak = measure_load(lambda: build_graph_data(json.loads(json_bytes)))
+        bin_graph, bin_s, bin_peak = measure_load(lambda: GraphData(**map_graph_file(path)))
+
+        rnd = random.Random(args.seed)
+        ids = [node['id'] for node in data['nodes']]
+        pairs = [(rnd.choice(ids), rnd.choice(ids)) for _ in range(args.queries)]
+        timings = []
+        costs = []
+        for graph in (json_graph, bin_graph):
+            started = time.perf_counter()
+            costs.append([shortest_path_astar(s, t, graph)[1] for s, t in pairs])
+            timings.append(time.perf_counter() - started)
+
+    mismatches = sum(1 for a, b in zip(*costs) if not math.isclose(a, b, rel_tol=1e-12))
+    print(f"{'':8}{'load s':>10}{'peak MiB':>10}{'query ms':>12}")
+    print(f"{'json':8}{json_s:>10.3f}{json_peak / 2**20:>10.1f}{1000 * timings[0] / len(pairs):>12.2f}")
+    print(f"{'binary':8}{bin_s:>10.3f}{bin_peak / 2**20:>10.1f}{1000 * timings[1] / len(pairs):>12.2f}")
+    print(f"cost mismatches: {mismatches}")
+    print("binary peak is Python heap only: the mapped file is shared page cache, not counted.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Microbenchmark for the A* heuristic and the batch haversine helpers.
+
+    python -m routing.benchmarks.haversine --points 200000
+
+Compares the scalar haversine_distance() (what A* used to call per relaxed
+edge) with the precomputed radian/cosine form used by the searches now, and
+the per-pair Python loop with haversine_distance_batch().
+"""
+import argparse
+import math
+import random
+import time
+
+from . import setup_django
+
+
+def best_of(fn, repeat=3):
+    """Best wall time of repeat runs of fn()."""
+    best = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="A* heuristic / haversine microbenchmark")
+    parser.add_argument('--points', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    import numpy as np
+    from routing.utils.routingUtil import (
+        EARTH_DIAMETER_METERS, GraphData, haversine_distance, haversine_distance_batch,
+    )
+    from array import array
+
+    rnd = random.Random(args.seed)
+    n = args.points
+    lat = array('d', (12.9 + rnd.random() * 0.1 for _ in range(n)))
+    lon = array('d', (77.5 + rnd.random() * 0.1 for _ in range(n)))
+    graph = GraphData(array('q', range(n)), lat, lon, array('q', [0]) * (n + 1), array('q'), array('d'), array('q'))
+    goal = n // 2
+
+    # --- Heuristic: one node-to-goal distance per relaxed edge ---
+
+    def scalar():
+        goal_lat, goal_lon = lat[goal], lon[goal]
+        for i in range(n):
+            haversine_distance(lat[i], lon[i], goal_lat, goal_lon)
+
+    def precomputed():
+        lat_rad, lon_rad, cos_lat = graph.lat_rad, graph.lon_rad, graph.cos_lat
+        sin, sqrt, asin = math.sin, math.sqrt, math.asin
+        goal_phi, goal_lambda, goal_cos = lat_rad[goal], lon_rad[goal], cos_lat[goal]
+        for i in range(n):
+            a = (sin((lat_rad[i] - goal_phi) * 0.5) ** 2
+                 + cos_lat[i] * goal_cos * sin((lon_rad[i] - goal_lambda) * 0.5) ** 2)
+            EARTH_DIAMETER_METERS * asin(sqrt(a if a < 1.0 else 1.0))
+
+    # --- Batch: consecutive-pair distances (path length / edge weights) ---
+
+    def loop_pairs():
+        total = 0.0
+        for i in range(1, n):
+            total += haversine_distance(lat[i - 1], lon[i - 1], lat[i], lon[i])
+        return total
+
+    lat_np = np.frombuffer(lat, dtype=np.float64)
+    lon_np = np.frombuffer(lon, dtype=np.float64)
+
+    def batch_pairs():
+        return float(haversine_distance_batch(lat_np[:-1], lon_np[:-1], lat_np[1:], lon_np[1:]).sum())
+
+    assert math.isclose(loop_pairs(), batch_pairs(), rel_tol=1e-9)
+
+    rows = [
+        ("heuristic: haversine_distance()", best_of(scalar)),
+        ("heuristic: precomputed terms", best_of(precomputed)),
+        ("pairs: python loop", best_of(loop_pairs)),
+        ("pairs: haversine_distance_batch()", best_of(batch_pairs)),
+    ]
+    print(f"{n} points")
+    for label, seconds in rows:
+        print(f"{label:36}{1e9 * seconds / n:>10.1f} ns/point")
+
+
+if __name__ == '__main__':
+    main()
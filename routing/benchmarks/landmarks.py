@@ -0,0 +1,71 @@
+"""
+ALT landmarks: nodes expanded and query time with and without landmark bounds.
+
+    python -m routing.benchmarks.landmarks --rows 150 --cols 150 --detour 3 --landmarks 8
+
+Use a large --detour to mimic winding paths whose weights are well above the
+straight-line distance, which is where the haversine bound is weakest.
+"""
+import argparse
+import math
+import random
+import time
+
+from . import setup_django
+from .generators import grid_graph
+
+
+def run(graph, pairs, search, SearchStats):
+    """Returns (costs, total nodes expanded, seconds) for search over pairs."""
+    costs, expanded = [], 0
+    started = time.perf_counter()
+    for s, t in pairs:
+        stats = SearchStats()
+        costs.append(search(s, t, graph, stats=stats)[1])
+        expanded += stats.nodes_expanded
+    return costs, expanded, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ALT landmark benchmark")
+    parser.add_argument('--rows', type=int, default=150)
+    parser.add_argument('--cols', type=int, default=150)
+    parser.add_argument('--detour', type=float, default=3.0)
+    parser.add_argument('--landmarks', type=int, default=8)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from routing.algorithms.landmarks import Landmarks
+    from routing.utils.routingUtil import build_graph_data, least_turn_astar, shortest_path_astar
+    from routing.utils.search_state import SearchStats
+
+    data = grid_graph(args.rows, args.cols, seed=args.seed, detour=args.detour)
+    graph = build_graph_data(data)
+    print(f"grid {args.rows}x{args.cols}, detour <= {args.detour}: {graph.node_count} nodes")
+
+    rnd = random.Random(args.seed)
+    ids = [node['id'] for node in data['nodes']]
+    pairs = [(rnd.choice(ids), rnd.choice(ids)) for _ in range(args.queries)]
+
+    started = time.perf_counter()
+    landmarks = Landmarks.build(graph, args.landmarks)
+    print(f"preprocessing: {len(landmarks.landmarks)} landmarks in {time.perf_counter() - started:.2f} s, "
+          f"{landmarks.approx_bytes() / 2**20:.1f} MiB")
+
+    for name, search in (("shortest", shortest_path_astar), ("least_turn", least_turn_astar)):
+        graph.landmarks = None
+        base_costs, base_expanded, base_s = run(graph, pairs, search, SearchStats)
+        graph.landmarks = landmarks
+        alt_costs, alt_expanded, alt_s = run(graph, pairs, search, SearchStats)
+
+        mismatches = sum(1 for a, b in zip(base_costs, alt_costs) if not (a == b or math.isclose(a, b, rel_tol=1e-9)))
+        print(f"{name}:")
+        print(f"  haversine: {base_expanded / len(pairs):10.0f} nodes/query {1000 * base_s / len(pairs):8.2f} ms/query")
+        print(f"  ALT:       {alt_expanded / len(pairs):10.0f} nodes/query {1000 * alt_s / len(pairs):8.2f} ms/query")
+        print(f"  cost mismatches: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Full graph vs degree-2 chain simplification on a GPX-like trail network.
+
+    python -m routing.benchmarks.simplification --rows 30 --cols 30 --points-per-edge 20
+
+Both sides use plain A* (no contraction hierarchy, no landmarks), so the
+difference is only the number of nodes the search has to go through.
+"""
+import argparse
+import math
+import random
+import time
+
+from . import setup_django
+from .bidirectional import percentile, run
+from .generators import trail_network
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=30)
+    parser.add_argument('--cols', type=int, default=30)
+    parser.add_argument('--points-per-edge', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from routing.algorithms.chain_simplification import SimplifiedGraph
+    from routing.utils.routingUtil import (SHARP_TURN_THRESHOLD_DEG, build_graph_data, edge_headings,
+                                           least_turn_astar, shortest_path_astar)
+    from routing.utils.search_state import SearchStats
+
+    data = trail_network(args.rows, args.cols, args.points_per_edge, seed=args.seed)
+    full = build_graph_data(data)
+    simple = build_graph_data(data)
+    started = time.perf_counter()
+    simple.simplified = SimplifiedGraph.build(simple, edge_headings(simple), math.radians(SHARP_TURN_THRESHOLD_DEG))
+    build_s = time.perf_counter() - started
+    print(f"trails {args.rows}x{args.cols}, {args.points_per_edge} points/edge: {full.node_count} nodes, "
+          f"{simple.simplified.core_count} core nodes after simplification ({build_s:.2f} s to build, "
+          f"{simple.simplified.approx_bytes() / 2**20:.1f} MiB)")
+
+    rnd = random.Random(args.seed)
+    ids = [node['id'] for node in data['nodes']]
+    pairs = [(rnd.choice(ids), rnd.choice(ids)) for _ in range(args.queries)]
+
+    for name, search in (("shortest", shortest_path_astar), ("least_turn", least_turn_astar)):
+        print(f"{name}:")
+        results = {}
+        for label, graph in (("full", full), ("simplified", simple)):
+            costs, expanded, latencies = run(search, pairs, graph, SearchStats)
+            results[label] = costs
+            print(f"  {label:14}{sum(expanded) / len(expanded):10.0f} nodes/query"
+                  f"{percentile(latencies, 0.5):10.2f} ms p50{percentile(latencies, 0.99):10.2f} ms p99")
+        if name == "shortest":
+            mismatches = sum(1 for a, b in zip(results["full"], results["simplified"])
+                             if not math.isclose(a, b, rel_tol=1e-9))
+            print(f"  cost mismatches: {mismatches}/{len(pairs)}")
+        else:
+            # The full-graph least_turn search prunes by node and can miss the cheapest route
+            better = sum(1 for a, b in zip(results["full"], results["simplified"])
+                         if b < a and not math.isclose(a, b, rel_tol=1e-9))
+            print(f"  simplified cheaper on {better}/{len(pairs)} routes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Nearest-node lookup by coordinates: k-d tree against a linear scan.
+
+    python -m routing.benchmarks.spatial_index --rows 300 --cols 300 --queries 500
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from . import setup_django
+from .bidirectional import percentile
+from .generators import GRID_STEP_DEG, grid_graph
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=300)
+    parser.add_argument('--cols', type=int, default=300)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from routing.algorithms.spatial_index import SpatialIndex
+    from routing.utils.routingUtil import build_graph_data, haversine_distance_batch
+
+    graph = build_graph_data(grid_graph(args.rows, args.cols, seed=args.seed))
+    started = time.perf_counter()
+    index = SpatialIndex.build(graph)
+    build_s = time.perf_counter() - started
+    print(f"grid {args.rows}x{args.cols}: {graph.node_count} nodes, index built in {build_s:.3f} s "
+          f"({index.approx_bytes() / 2**20:.1f} MiB)")
+
+    lat = np.frombuffer(graph.lat, dtype=np.float64)
+    lon = np.frombuffer(graph.lon, dtype=np.float64)
+    rnd = random.Random(args.seed)
+    # GPS fixes anywhere over the map, plus a margin around it
+    margin = 5 * GRID_STEP_DEG
+    points = [(rnd.uniform(lat.min() - margin, lat.max() + margin), rnd.uniform(lon.min() - margin, lon.max() + margin))
+              for _ in range(args.queries)]
+
+    lookups = (
+        ("linear scan", lambda la, lo: int(np.argmin(haversine_distance_batch(la, lo, lat, lon)))),
+        ("nearest", lambda la, lo: index.nearest(la, lo)[0][0]),
+        ("nearest k=10", lambda la, lo: index.nearest(la, lo, 10)[0][0]),
+        ("within 100 m", lambda la, lo: index.within(la, lo, 100.0)),
+        ("nearest edge", lambda la, lo: index.nearest_edge(la, lo)),
+    )
+    answers = {}
+    for name, lookup in lookups:
+        latencies = []
+        answers[name] = []
+        for la, lo in points:
+            started = time.perf_counter()
+            answers[name].append(lookup(la, lo))
+            latencies.append(1e6 * (time.perf_counter() - started))
+        print(f"  {name:14}{percentile(latencies, 0.5):10.1f} us p50{percentile(latencies, 0.99):10.1f} us p99")
+
+    mismatches = sum(1 for a, b in zip(answers["linear scan"], answers["nearest"]) if a != b)
+    print(f"  nearest differs from the linear scan on {mismatches}/{len(points)} points")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+"""
+Routing benchmark suite: searches, map loading and GPX ingestion on synthetic data.
+
+    python manage.py routing_benchmark --preset small
+    python -m routing.benchmarks.suite --preset medium --kinds grid,trail
+
+Every graph kind (a jittered grid, a random geometric network and a GPX-like
+trail network) is generated at the preset's size with a fixed seed, served
+from a local HTTP server and loaded with load_and_prepare_graph(), both cold
+(JSON) and from the binary disk cache. The three searches then run on the
+same random pairs, and a synthetic GPX recording goes through
+parse_gpx_content() and build_graph(). Nothing touches the network.
+
+Each case reports wall time, nodes expanded, throughput and peak traced
+memory (tracemalloc, measured in a separate run as it slows allocation down).
+Results are compared against baselines/<preset>.json when it exists; times
+vary between machines, so record a baseline on the machine you compare on
+(--save-baseline).
+"""
+import argparse
+import functools
+import gc
+import http.server
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from . import setup_django
+from .bidirectional import percentile
+from .generators import grid_graph, random_geometric_graph, trail_gpx, trail_network
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+
+# nodes: size of each generated map; queries: routes per search;
+# gpx_side: trail grid side of the GPX recording (about 36 * side**2 points)
+PRESETS = {
+    'small': {'nodes': 1_000, 'queries': 200, 'repeat': 5, 'gpx_side': 24},
+    'medium': {'nodes': 100_000, 'queries': 40, 'repeat': 3, 'gpx_side': 120},
+    'large': {'nodes': 1_000_000, 'queries': 8, 'repeat': 1, 'gpx_side': 240},
+}
+GRAPH_KINDS = ('grid', 'geometric', 'trail')
+TRAIL_POINTS_PER_EDGE = 10
+
+# Metrics where a lower value is better; for the rest (throughputs) higher is better
+LOWER_IS_BETTER = ('seconds', 'ms_p50', 'ms_p99', 'nodes_expanded', 'peak_mib')
+
+
+def generate(kind: str, nodes: int, seed: int) -> Dict[str, Any]:
+    """A map of about nodes nodes in the map JSON schema."""
+    if kind == 'grid':
+        side = max(2, round(nodes ** 0.5))
+        return grid_graph(side, side, seed=seed)
+    if kind == 'geometric':
+        return random_geometric_graph(nodes, seed=seed)
+    if kind == 'trail':
+        # Each junction brings about 1.8 trails of TRAIL_POINTS_PER_EDGE - 1 inner points
+        side = max(2, round((nodes / (1 + 1.8 * (TRAIL_POINTS_PER_EDGE - 1))) ** 0.5))
+        return trail_network(side, side, TRAIL_POINTS_PER_EDGE, seed=seed)
+    raise ValueError(f"Unknown graph kind: {kind}")
+
+
+def measure(fn: Callable[[], Any], repeat: int):
+    """Runs fn repeat times, then once more under tracemalloc: (last result, median seconds, peak MiB)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        result = None
+        gc.collect()
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    result = None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, statistics.median(times), peak / 2**20
+
+
+# --- Cases ---
+
+def bench_load(url: str, repeat: int, warm: bool) -> Dict[str, float]:
+    from routing.utils.routingUtil import graph_cache, invalidate_graph, load_and_prepare_graph
+
+    def load():
+        if warm:
+            graph_cache.invalidate(url)  # keeps the disk cache
+        else:
+            invalidate_graph(url)
+        return load_and_prepare_graph(url)
+
+    if warm:
+        load_and_prepare_graph(url)  # fills the disk cache
+    graph, seconds, peak = measure(load, repeat)
+    return {'seconds': seconds, 'nodes_per_s': graph.node_count / seconds, 'peak_mib': peak}
+
+
+def bench_search(search: Callable, graph, pairs) -> Dict[str, float]:
+    from routing.utils.search_state import SearchStats
+
+    latencies, expanded = [], 0
+    for s, t in pairs:
+        stats = SearchStats()
+        started = time.perf_counter()
+        search(s, t, graph, stats=stats)
+        latencies.append(1000 * (time.perf_counter() - started))
+        expanded += stats.nodes_expanded
+
+    sample = pairs[:max(1, len(pairs) // 10)]
+    _, _, peak = measure(lambda: [search(s, t, graph) for s, t in sample], 1)
+    return {
+        'ms_p50': percentile(latencies, 0.5),
+        'ms_p99': percentile(latencies, 0.99),
+        'queries_per_s': 1000 * len(latencies) / sum(latencies),
+        'nodes_expanded': expanded / len(pairs),
+        'peak_mib': peak,
+    }
+
+
+def bench_gpx(side: int, seed: int, repeat: int):
+    """Parses and builds a synthetic GPX recording: ({case: metrics}, description of the input)."""
+    from routing.utils.graph_builder import build_graph
+    from routing.utils.routingUtil import parse_gpx_content
+
+    content = trail_gpx(side, side, TRAIL_POINTS_PER_EDGE, seed=seed)
+    segments, seconds, peak = measure(lambda: list(parse_gpx_content(io.BytesIO(content))), repeat)
+    points = sum(len(segment) for segment in segments)
+    parse = {'seconds': seconds, 'points_per_s': points / seconds, 'mib_per_s': len(content) / 2**20 / seconds,
+             'peak_mib': peak}
+    graph, seconds, peak = measure(lambda: build_graph(segments), repeat)
+    build = {'seconds': seconds, 'points_per_s': points / seconds, 'peak_mib': peak}
+    info = f"{points} points, {len(content) / 2**20:.1f} MiB, {len(graph['nodes'])} nodes built"
+    return {'gpx/parse': parse, 'gpx/build': build}, info
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def run_suite(preset: str = 'small', kinds=GRAPH_KINDS, queries: Optional[int] = None, repeat: Optional[int] = None,
+              seed: int = 0, out: Callable[[str], None] = print) -> Dict[str, Any]:
+    """Runs every case of preset; returns {'preset', 'seed', 'config', 'results': {case: {metric: value}}}."""
+    from django.conf import settings
+    from django.test.utils import override_settings
+    from routing.utils.routingUtil import ROUTING_MODES, load_and_prepare_graph, route_by_mode
+
+    params = PRESETS[preset]
+    queries = queries or params['queries']
+    repeat = repeat or params['repeat']
+    config = {name: getattr(settings, name, None) for name in (
+        'ROUTING_SIMPLIFY_CHAINS', 'ROUTING_CONTRACTION_HIERARCHIES', 'ROUTING_ALT_LANDMARKS', 'ROUTING_JSON_BACKEND')}
+    out(f"preset {preset}: {params['nodes']} nodes/map, {queries} queries, {repeat} repeats, seed {seed}")
+    out(f"settings: {', '.join(f'{k}={v}' for k, v in config.items())}")
+    results: Dict[str, Dict[str, float]] = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        maps_dir = os.path.join(directory, 'maps')
+        os.makedirs(maps_dir)
+        handler = functools.partial(_QuietHandler, directory=maps_dir)
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            with override_settings(ROUTING_GRAPH_DISK_CACHE_DIR=os.path.join(directory, 'graph_cache')):
+                for kind in kinds:
+                    data = generate(kind, params['nodes'], seed)
+                    name = f"{kind}-{preset}-{seed}.json"
+                    with open(os.path.join(maps_dir, name), 'w') as f:
+                        json.dump(data, f, separators=(',', ':'))
+                    url = f"http://127.0.0.1:{server.server_address[1]}/{name}"
+                    out(f"{kind}: {len(data['nodes'])} nodes, {len(data['edges'])} edges")
+
+                    results[f"load/{kind}/json"] = _report(out, f"load/{kind}/json", bench_load(url, repeat, warm=False))
+                    results[f"load/{kind}/cached"] = _report(out, f"load/{kind}/cached", bench_load(url, repeat, warm=True))
+
+                    graph = load_and_prepare_graph(url)
+                    rnd = random.Random(seed)
+                    ids = [node['id'] for node in data['nodes']]
+                    pairs = [(rnd.choice(ids), rnd.choice(ids)) for _ in range(queries)]
+                    for mode in ROUTING_MODES:
+                        case = f"route/{kind}/{mode}"
+                        search = functools.partial(route_by_mode, mode=mode)
+                        results[case] = _report(out, case, bench_search(search, graph, pairs))
+                    del graph, data
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    gpx, info = bench_gpx(params['gpx_side'], seed, repeat)
+    out(f"gpx: {info}")
+    for case, metrics in gpx.items():
+        results[case] = _report(out, case, metrics)
+
+    return {
+        'preset': preset,
+        'seed': seed,
+        'queries': queries,
+        'config': config,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def _report(out, case: str, metrics: Dict[str, float]) -> Dict[str, float]:
+    out(f"  {case:34}" + "  ".join(f"{name}={_format(value)}" for name, value in metrics.items()))
+    return metrics
+
+
+def _format(value: float) -> str:
+    return f"{value:.0f}" if abs(value) >= 100 else f"{value:.3g}"
+
+
+# --- Baselines ---
+
+def baseline_path(preset: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{preset}.json")
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+            out: Callable[[str], None] = print) -> List[str]:
+    """Prints each metric against the baseline; returns the regressions beyond tolerance (a fraction)."""
+    if baseline.get('config') != report['config'] or baseline.get('queries') != report['queries']:
+        out("note: baseline was recorded with other settings or query counts; differences may not be regressions")
+    regressions = []
+    out(f"{'case':34}{'metric':16}{'baseline':>12}{'now':>12}{'change':>9}")
+    for case, metrics in report['results'].items():
+        before = baseline.get('results', {}).get(case)
+        if before is None:
+            out(f"{case:34}(not in baseline)")
+            continue
+        for metric, value in metrics.items():
+            old = before.get(metric)
+            if not old:
+                continue
+            change = (value - old) / old
+            worse = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+            flag = "  REGRESSION" if worse else ""
+            out(f"{case:34}{metric:16}{_format(old):>12}{_format(value):>12}{100 * change:>+8.1f}%{flag}")
+            if worse:
+                regressions.append(f"{case} {metric}: {_format(old)} -> {_format(value)} ({100 * change:+.1f}%)")
+    return regressions
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Options shared by the module entry point and the routing_benchmark management command."""
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--kinds', default=','.join(GRAPH_KINDS), help="comma-separated graph kinds")
+    parser.add_argument('--queries', type=int, default=None, help="routes per search (default: the preset's)")
+    parser.add_argument('--repeat', type=int, default=None, help="timed runs per load/GPX case (default: the preset's)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=None, help="baseline JSON to compare with (default: baselines/<preset>.json)")
+    parser.add_argument('--no-baseline', action='store_true', help="don't compare with a baseline")
+    parser.add_argument('--save-baseline', nargs='?', const='', default=None, metavar='PATH',
+                        help="write the results as a baseline (default path: baselines/<preset>.json)")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown before a regression (fraction)")
+    parser.add_argument('--fail-on-regression', action='store_true')
+
+
+def run_from_options(options: Dict[str, Any], out: Callable[[str], None] = print) -> List[str]:
+    """Runs the suite as the command-line options say; returns the regressions found."""
+    kinds = [kind.strip() for kind in options['kinds'].split(',') if kind.strip()]
+    for kind in kinds:
+        if kind not in GRAPH_KINDS:
+            raise ValueError(f"Unknown graph kind: {kind} (choose from {', '.join(GRAPH_KINDS)})")
+    report = run_suite(options['preset'], kinds, options['queries'], options['repeat'], options['seed'], out)
+
+    regressions = []
+    path = options['baseline'] or baseline_path(options['preset'])
+    if not options['no_baseline'] and os.path.exists(path):
+        with open(path) as f:
+            baseline = json.load(f)
+        out(f"\ncompared with {path}:")
+        regressions = compare(report, baseline, options['tolerance'], out)
+        out(f"{len(regressions)} regression(s) beyond {100 * options['tolerance']:.0f}%")
+    elif options['baseline']:
+        raise FileNotFoundError(f"No baseline at {path}")
+
+    if options['save_baseline'] is not None:
+        save_path = options['save_baseline'] or baseline_path(options['preset'])
+        os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok=True)
+        with open(save_path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        out(f"baseline written to {save_path}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    regressions = run_from_options(vars(args))
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
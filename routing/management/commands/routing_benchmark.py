@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from routing.benchmarks import suite
+
+
+class Command(BaseCommand):
+    help = "Runs the offline routing benchmark suite and compares it with the stored baseline (see routing.benchmarks.suite)."
+
+    def add_arguments(self, parser):
+        suite.add_arguments(parser)
+
+    def handle(self, *args, **options):
+        try:
+            regressions = suite.run_from_options(options, out=self.stdout.write)
+        except (ValueError, FileNotFoundError) as e:
+            raise CommandError(str(e))
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} regression(s):\n" + "\n".join(regressions))
@@ -0,0 +1,102 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.urls import Resolver404, resolve
+
+from routing.utils.profiling import ProfileCapture, load_capture
+from routing.utils.routingUtil import graph_cache, load_and_prepare_graph, load_disk_cached_graph, route_cache
+
+
+class Command(BaseCommand):
+    help = ("Replays a slow request captured by the ProfilingMiddleware against the disk-cached graph, "
+            "printing its timings (and a cProfile report with --profile).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('capture', nargs='?', default='latest', help="capture id, file or 'latest' (default)")
+        parser.add_argument('--dir', default=None, help="capture directory (default: ROUTING_PROFILING_DIR)")
+        parser.add_argument('--list', action='store_true', help="list the stored captures and exit")
+        parser.add_argument('--repeat', type=int, default=1, help="times to run the request")
+        parser.add_argument('--profile', action='store_true', help="run under cProfile and print the top functions")
+        parser.add_argument('--limit', type=int, default=25, help="functions in the cProfile report")
+        parser.add_argument('--online', action='store_true',
+                            help="fetch the map when it isn't in the disk cache (default: fail)")
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or settings.ROUTING_PROFILING_DIR
+        if options['list']:
+            for path in ProfileCapture(directory).list():
+                with open(path) as f:
+                    capture = json.load(f)
+                self.stdout.write(f"{capture['id']}  {capture['duration_ms']:9.1f} ms  {capture['path']}  "
+                                  f"{json.dumps(capture['params'])}")
+            return
+
+        try:
+            capture = load_capture(directory, options['capture'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Can't read capture {options['capture']}: {e}")
+        body = capture.get('body')
+        if not isinstance(body, dict):
+            raise CommandError("The capture has no JSON body to replay (uploads and oversized bodies aren't stored).")
+        try:
+            match = resolve(capture['path'])
+        except Resolver404:
+            raise CommandError(f"No view for {capture['path']}")
+
+        # The graph goes into the in-memory cache first, so the view finds it without a fetch
+        map_url = body.get('map_url')
+        if map_url:
+            graph = load_disk_cached_graph(map_url)
+            if graph is None:
+                if not options['online']:
+                    raise CommandError(f"{map_url} isn't in the disk cache ({settings.ROUTING_GRAPH_DISK_CACHE_DIR}); "
+                                       "pass --online to fetch it.")
+                graph = load_and_prepare_graph(map_url)
+            graph_cache.put(map_url, graph)
+            self.stdout.write(f"{map_url}: {graph.node_count} nodes, {graph.edge_count} edges")
+
+        self.stdout.write(f"Replaying {capture['id']} ({capture['path']}, {capture['duration_ms']:.1f} ms when captured): "
+                          f"{json.dumps(capture['params'])}")
+        body = {**body, "debug_timings": True}
+        path = capture['path'] + (f"?{capture['query']}" if capture.get('query') else "")
+        factory = RequestFactory()
+        profile = cProfile.Profile() if options['profile'] else None
+
+        for run in range(1, options['repeat'] + 1):
+            if map_url:
+                route_cache.invalidate(map_url)  # search again rather than answer from the route cache
+            request = factory.generic(capture['method'], path, data=json.dumps(body), content_type='application/json')
+            started = time.perf_counter()
+            if profile is not None:
+                profile.enable()
+            try:
+                response = match.func(request, *match.args, **match.kwargs)
+                content = b''.join(response.streaming_content) if response.streaming else response.content
+            finally:
+                if profile is not None:
+                    profile.disable()
+            elapsed = 1000 * (time.perf_counter() - started)
+
+            line = f"run {run}: {response.status_code} in {elapsed:.1f} ms"
+            if response.get('Content-Type', '').startswith('application/json'):
+                data = json.loads(content)
+                stages = data.get('debug_timings', {}).get('stages_ms')
+                if stages:
+                    line += "  " + ", ".join(f"{name} {ms:.1f}" for name, ms in stages.items())
+                for search in data.get('debug_timings', {}).get('searches', []):
+                    line += f"\n    {search['mode']}: " + ", ".join(f"{key} {value}" for key, value in search.items()
+                                                                    if key != 'mode')
+                if 'error' in data:
+                    line += f"  error: {data['error']}"
+            self.stdout.write(line)
+
+        if profile is not None:
+            report = io.StringIO()
+            pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(options['limit'])
+            self.stdout.write(report.getvalue())
@@ -0,0 +1,234 @@
+import cProfile
+import logging
+import random
+import threading
+import time
+import zlib
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, get_resolver
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+from .utils.profiling import ProfileCapture, StackSampler, request_info
+from .utils.response_encoding import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # optional: responses are gzipped only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Content types worth compressing; map files and images are served as they are
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'application/gpx+xml', 'application/xml', 'text/')
+BROTLI_QUALITY = 5  # brotli's sweet spot for on-the-fly compression: smaller than gzip -6 at similar speed
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compresses JSON and text responses with brotli (when the brotli module is
+    installed and the client accepts it) or gzip.
+
+    Responses under ROUTING_COMPRESSION_MIN_BYTES are sent as they are;
+    streamed responses (batch routing, map files) are compressed chunk by
+    chunk, so they still reach the client as they are produced.
+    """
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        if not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES):
+            return response
+        if not response.streaming and len(response.content) < getattr(settings, 'ROUTING_COMPRESSION_MIN_BYTES', 1024):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in accepted:
+            coding = 'br'
+        elif 'gzip' in accepted:
+            coding = 'gzip'
+        else:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = _compress_async(response.streaming_content, coding)
+            elif coding == 'br':
+                response.streaming_content = _brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            content = (brotli.compress(response.content, quality=BROTLI_QUALITY) if coding == 'br'
+                       else compress_string(response.content))
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers['Content-Length'] = str(len(content))
+
+        # The representation changed, so a strong ETag becomes weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = coding
+        return response
+
+
+def _brotli_sequence(chunks):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def _compress_async(chunks, coding):
+    if coding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        async for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+        async for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+# One cProfile'd request at a time: Python 3.12+ allows a single active profiler per process
+_profile_lock = threading.Lock()
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    """
+    Opt-in profiling of the routing views (ROUTING_PROFILING_ENABLED), to
+    catch slow requests that can't be reproduced on demand.
+
+    Every request to a view marked with metrics.instrumented() is timed and
+    has its stack sampled every ROUTING_PROFILING_INTERVAL_MS, which costs
+    the request nothing (the sampler runs in its own thread); a
+    ROUTING_PROFILING_SAMPLE_RATE fraction of them also runs under cProfile,
+    when no other request holds the profiler. Any request that takes
+    ROUTING_PROFILING_SLOW_MS or longer is written to ROUTING_PROFILING_DIR
+    with its parameters (see profiling.ProfileCapture); replay it with
+    "manage.py routing_replay". Streamed responses are watched until their
+    last chunk. Async views (uploads, whose work runs in worker processes)
+    aren't profiled.
+
+    The watch is around get_response, so the view still runs through the rest
+    of the middleware chain (process_view, process_exception); placed last in
+    MIDDLEWARE, it times the view alone.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'ROUTING_PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.sample_rate = getattr(settings, 'ROUTING_PROFILING_SAMPLE_RATE', 0.01)
+        self.slow_seconds = getattr(settings, 'ROUTING_PROFILING_SLOW_MS', 1000) / 1000
+        self.sampler = StackSampler(getattr(settings, 'ROUTING_PROFILING_INTERVAL_MS', 10) / 1000)
+        self.captures = ProfileCapture(settings.ROUTING_PROFILING_DIR,
+                                       getattr(settings, 'ROUTING_PROFILING_MAX_CAPTURES', 100))
+
+    def __call__(self, request):
+        # Under ASGI the chain is async and MiddlewareMixin passes requests through unwatched
+        if iscoroutinefunction(self) or not _is_routing_endpoint(request):
+            return super().__call__(request)
+
+        profile = None
+        if random.random() < self.sample_rate and _profile_lock.acquire(blocking=False):
+            profile = cProfile.Profile()
+        started = time.perf_counter()
+        samples = self.sampler.start()
+        streaming = False
+        try:
+            if profile is not None:
+                profile.enable()
+            response = self.get_response(request)
+            streaming = response.streaming and not response.is_async
+        finally:
+            if profile is not None:
+                profile.disable()
+            self.sampler.stop()
+            if not streaming:
+                self._finish(request, started, samples, profile)
+
+        if streaming:
+            response.streaming_content = _WatchedStream(self, response.streaming_content, request, started,
+                                                        samples, profile)
+        return response
+
+    def _finish(self, request, started, samples, profile):
+        seconds = time.perf_counter() - started
+        try:
+            if seconds >= self.slow_seconds:
+                path = self.captures.write(request_info(request), seconds, samples, profile)
+                logger.warning("Slow request %s (%.0f ms) captured in %s", request.path, 1000 * seconds, path)
+        except Exception:  # profiling must never break the request
+            logger.exception("Profile capture failed")
+        finally:
+            if profile is not None:
+                _profile_lock.release()
+
+
+def _is_routing_endpoint(request) -> bool:
+    """Whether request goes to a sync view marked with metrics.instrumented()."""
+    try:
+        view = get_resolver(getattr(request, 'urlconf', None)).resolve(request.path_info).func
+    except Resolver404:
+        return False
+    return getattr(view, 'routing_endpoint', None) is not None and not iscoroutinefunction(view)
+
+
+class _WatchedStream:
+    """
+    A streamed response's chunks, sampled (and profiled) while each is
+    produced. close() ends the watch, so it also ends for streams the
+    server stops reading early.
+    """
+
+    def __init__(self, middleware: ProfilingMiddleware, chunks, request, started, samples, profile):
+        self._middleware = middleware
+        self._chunks = chunks
+        self._iterator = iter(chunks)
+        self._request = request
+        self._started = started
+        self._samples = samples
+        self._profile = profile
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            self._middleware.sampler.start(self._samples)
+            if self._profile is not None:
+                self._profile.enable()
+            try:
+                return next(self._iterator)
+            finally:
+                if self._profile is not None:
+                    self._profile.disable()
+                self._middleware.sampler.stop()
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if hasattr(self._chunks, 'close'):
+            self._chunks.close()
+        self._middleware._finish(self._request, self._started, self._samples, self._profile)
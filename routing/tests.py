@@ -1,3 +1,2211 @@
-from django.test import TestCase
+import functools
+import gzip
+import heapq
+import http.server
+import io
+import json
+import math
+import os
+import random
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock, skipIf
 
-# Create your tests here.
+import numpy as np
+import requests
+from django.forms import ValidationError
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from .algorithms.bidirectional import lower_bound_to
+from .algorithms.contraction_hierarchy import ContractionHierarchy
+from .algorithms.energy_path import MAX_GRADE, edge_energy_costs
+from .algorithms.landmarks import dijkstra_all
+from .benchmarks import generators, suite
+from .middleware import CompressionMiddleware, ProfilingMiddleware
+from .utils import http_session, metrics, routingUtil, upload_pipeline
+from .utils.graph_builder import build_graph
+from .utils.graph_cache import GraphCache
+from .utils.graph_format import HEADER_SIZE, encode_graph, map_graph_file, read_graph_arrays, write_graph_file
+from .utils.gpx_parser import iter_gpx_segments, parse_gpx_from_url
+from .utils.metrics import MetricsRegistry, registry, render_metrics
+from .utils.response_encoding import dumps, encode_polyline, iter_json
+from .utils.route_cache import RouteCache
+from .utils.routingUtil import (ENERGY_CLIMB_COST, ENERGY_PENALTY_FACTOR, ENERGY_STEEP_COST, SHARP_TURN_THRESHOLD_DEG,
+                                TURN_PENALTY_METERS, GraphData, build_graph_data, graph_cache, haversine_distance,
+                                haversine_distance_batch, invalidate_graph, load_and_prepare_graph, nearest_edge,
+                                nearest_nodes, one_to_many_routes, parse_gpx_content, path_physical_distance,
+                                prepare_graph, route_by_mode, routing_mode, shortest_path_astar)
+from .utils.search_state import ScratchPool, SearchState, SearchStats
+from .utils.storage import LocalStorage
+from .utils.upload_pipeline import RetryableUploadError, UploadError, UploadJobs, process_gpx_upload, spool_upload
+
+try:
+    import brotli
+except ImportError:  # optional, like in the middleware
+    brotli = None
+
+
+class _Sized:
+    """Stands in for a graph of a given approx_bytes()."""
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def approx_bytes(self) -> int:
+        return self.size
+
+
+def _grid_map(rows: int, cols: int, seed: int = 0, elevation: bool = False):
+    """A jittered grid map payload with a few edges missing; weights are at least the haversine length."""
+    rnd = random.Random(seed)
+    nodes = []
+    for i in range(rows):
+        for j in range(cols):
+            node = {"id": 100 + i * cols + j, "lat": 12.97 + i * 0.0005 + rnd.uniform(-1e-4, 1e-4),
+                    "lon": 77.59 + j * 0.0005 + rnd.uniform(-1e-4, 1e-4)}
+            if elevation:
+                node["ele"] = 900 + 15 * math.sin(i / 2) + 10 * math.cos(j / 3) + rnd.uniform(0, 2)
+            nodes.append(node)
+    coords = {node["id"]: (node["lat"], node["lon"]) for node in nodes}
+    edges = []
+    for i in range(rows):
+        for j in range(cols):
+            u = 100 + i * cols + j
+            for v, ok in ((u + 1, j + 1 < cols), (u + cols, i + 1 < rows)):
+                if ok and rnd.random() < 0.9:
+                    length = haversine_distance(*coords[u], *coords[v])
+                    edges.append({"u": u, "v": v, "weight": length * rnd.uniform(1.0, 1.3)})
+    return {"nodes": nodes, "edges": edges}
+
+
+
+def _chain_map(seed: int = 0):
+    """
+    A map payload that is mostly degree-2 chains: a 3x3 grid of junctions joined
+    by wiggling trackpoint runs, plus a parallel chain, a loop chain, two dead-end
+    chains and a separate cycle with no junction at all.
+    """
+    rnd = random.Random(seed)
+    nodes, edges = [], []
+
+    def node(lat, lon):
+        nodes.append({"id": 100 + len(nodes), "lat": lat, "lon": lon,
+                      "ele": 900 + 20 * math.sin(lat * 2000) + 15 * math.cos(lon * 1500) + rnd.uniform(0, 3)})
+        return nodes[-1]["id"]
+
+    def edge(u, v):
+        a, b = nodes[u - 100], nodes[v - 100]
+        length = haversine_distance(a["lat"], a["lon"], b["lat"], b["lon"])
+        edges.append({"u": u, "v": v, "weight": length * rnd.uniform(1.0, 1.2)})
+
+    def chain(u, v, points=6, bow=0.0):
+        """Trackpoints from junction u to v, zigzagging enough for some sharp turns, bowed sideways by bow."""
+        a, b = nodes[u - 100], nodes[v - 100]
+        previous = u
+        for i in range(1, points + 1):
+            t = i / (points + 1)
+            side = bow * math.sin(math.pi * t) + rnd.uniform(-4e-4, 4e-4)
+            current = node(a["lat"] + t * (b["lat"] - a["lat"]) - side * (b["lon"] - a["lon"]) / 0.004,
+                           a["lon"] + t * (b["lon"] - a["lon"]) + side * (b["lat"] - a["lat"]) / 0.004)
+            edge(previous, current)
+            previous = current
+        edge(previous, v)
+
+    def ring(lat, lon, points, radius):
+        """Trackpoints around (lat, lon); returns them in order, not closed."""
+        return [node(lat + radius * math.cos(2 * math.pi * i / points), lon + radius * math.sin(2 * math.pi * i / points))
+                for i in range(points)]
+
+    junctions = [[node(12.97 + i * 0.004, 77.59 + j * 0.004) for j in range(3)] for i in range(3)]
+    for i in range(3):
+        for j in range(3):
+            if j + 1 < 3:
+                chain(junctions[i][j], junctions[i][j + 1])
+            if i + 1 < 3:
+                chain(junctions[i][j], junctions[i + 1][j])
+    # A parallel chain: a longer second way between two junctions already joined
+    chain(junctions[0][0], junctions[0][1], points=8, bow=1.5e-3)
+    # A loop chain leaving and re-entering the same junction
+    centre = nodes[junctions[1][1] - 100]
+    loop = ring(centre["lat"] + 1.2e-3, centre["lon"] + 1.2e-3, 7, 1e-3)
+    for u, v in zip([junctions[1][1]] + loop, loop + [junctions[1][1]]):
+        edge(u, v)
+    # Dead ends: runs from a junction to a degree-1 tip
+    for junction, direction in ((junctions[2][2], 1), (junctions[0][2], -1)):
+        start = nodes[junction - 100]
+        tip = node(start["lat"] + direction * 0.003, start["lon"] + 0.003)
+        chain(junction, tip, points=5)
+    # A cycle of trackpoints only, unreachable from the rest
+    cycle = ring(12.99, 77.62, 6, 1e-3)
+    for u, v in zip(cycle, cycle[1:] + cycle[:1]):
+        edge(u, v)
+    return {"nodes": nodes, "edges": edges, "junctions": [j for row in junctions for j in row],
+            "loop": loop, "cycle": cycle}
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class _MapServerTestCase(SimpleTestCase):
+    """Serves MAPS ({name: map payload}) over local HTTP for the class; map_url(name) is where one is."""
+
+    MAPS = {}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        for name, data in cls.MAPS.items():
+            with open(os.path.join(cls.directory.name, f"{name}.json"), "w") as f:
+                json.dump(data, f)
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0),
+                                                     functools.partial(_QuietHandler, directory=cls.directory.name))
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.directory.cleanup()
+        invalidate_graph(None)
+        super().tearDownClass()
+
+    def setUp(self):
+        invalidate_graph(None)
+
+    @classmethod
+    def map_url(cls, name: str) -> str:
+        return f"http://127.0.0.1:{cls.server.server_address[1]}/{name}.json"
+
+    def post(self, path, body):
+        return self.client_class().post(path, data=json.dumps(body), content_type="application/json")
+
+    def batch(self, body):
+        response = self.post("/routing/calculate/batch/", body)
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+
+# --- GRAPH CACHE ---
+
+class GraphCacheTests(SimpleTestCase):
+    def test_evicts_least_recently_used_over_max_entries(self):
+        cache = GraphCache(max_entries=2)
+        cache.put("a", _Sized(1))
+        cache.put("b", _Sized(1))
+        cache.get("a")
+        cache.put("c", _Sized(1))
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_evicts_over_max_bytes_but_keeps_the_new_entry(self):
+        cache = GraphCache(max_entries=0, max_bytes=100)
+        cache.put("a", _Sized(60))
+        cache.put("b", _Sized(60))
+        self.assertEqual(list(cache._entries), ["b"])
+        self.assertEqual(cache.current_bytes, 60)
+        cache.put("huge", _Sized(500))  # over budget alone, still cached
+        self.assertIn("huge", cache)
+        self.assertEqual(len(cache), 1)
+
+    def test_concurrent_misses_load_once(self):
+        cache = GraphCache()
+        calls = []
+        release = threading.Event()
+
+        def loader(key):
+            calls.append(key)
+            release.wait(5)
+            return _Sized(1)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(cache.get_or_load, "map", loader) for _ in range(8)]
+            # Let every caller reach the cache before the load finishes
+            while cache.stats()["misses"] < 8:
+                time.sleep(0.001)
+            release.set()
+            graphs = [future.result(5) for future in futures]
+
+        self.assertEqual(calls, ["map"])
+        self.assertTrue(all(graph is graphs[0] for graph in graphs))
+        self.assertEqual(cache.stats()["coalesced"], 7)
+
+    def test_failed_load_reaches_every_waiter_and_is_not_cached(self):
+        cache = GraphCache()
+        release = threading.Event()
+
+        def loader(key):
+            release.wait(5)
+            raise ValueError("bad map")
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(cache.get_or_load, "map", loader) for _ in range(4)]
+            while cache.stats()["misses"] < 4:
+                time.sleep(0.001)
+            release.set()
+            for future in futures:
+                with self.assertRaises(ValueError):
+                    future.result(5)
+        self.assertNotIn("map", cache)
+        self.assertEqual(cache.get_or_load("map", lambda key: _Sized(1)).size, 1)
+
+    def test_invalidate_during_load_does_not_cache_the_stale_graph(self):
+        cache = GraphCache()
+        started, release = threading.Event(), threading.Event()
+
+        def loader(key):
+            started.set()
+            release.wait(5)
+            return _Sized(1)
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(cache.get_or_load, "map", loader)
+            started.wait(5)
+            cache.invalidate("map")
+            release.set()
+            self.assertEqual(future.result(5).size, 1)
+        self.assertNotIn("map", cache)
+
+
+@override_settings(ROUTING_ADMIN_TOKEN="secret", ROUTING_GRAPH_DISK_CACHE_DIR="")
+class InvalidateEndpointTests(SimpleTestCase):
+    def post(self, body, token="secret"):
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"} if token else {}
+        return self.client.post("/routing/cache/invalidate/", data=json.dumps(body),
+                                content_type="application/json", **headers)
+
+    def test_requires_the_admin_token(self):
+        self.assertEqual(self.post({"all": True}, token=None).status_code, 403)
+        self.assertEqual(self.post({"all": True}, token="wrong").status_code, 403)
+        with override_settings(ROUTING_ADMIN_TOKEN=""):
+            self.assertEqual(self.post({"all": True}, token="").status_code, 403)
+
+    def test_requires_an_explicit_target(self):
+        self.assertEqual(self.post({}).status_code, 400)
+        self.assertEqual(self.post({"all": "true"}).status_code, 400)
+        self.assertEqual(self.post({"map_url": "http://example.com/map.json"}).status_code, 200)
+        self.assertEqual(self.post({"all": True}).status_code, 200)
+
+
+# --- MAP LOADING ---
+
+class MapLoadingTests(_MapServerTestCase):
+    """Loading maps through the disk cache (ROUTING_GRAPH_DISK_CACHE_DIR) and its fallbacks."""
+
+    MAPS = {"grid": _grid_map(5, 5)}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(ROUTING_GRAPH_DISK_CACHE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        super().setUp()
+        self.url = self.map_url("grid")
+
+    def reload(self):
+        graph_cache.invalidate(self.url)
+        return load_and_prepare_graph(self.url)
+
+    def test_unreachable_server_falls_back_to_the_cached_copy(self):
+        first = load_and_prepare_graph(self.url)
+        with mock.patch("routing.utils.routingUtil.http_get", side_effect=requests.ConnectionError("down")), \
+                self.assertLogs("routing.utils.routingUtil", "WARNING") as logs:
+            graph = self.reload()
+        self.assertIsNot(graph, first)
+        self.assertEqual(bytes(graph.targets), bytes(first.targets))
+        self.assertIn("Using the cached copy", logs.output[0])
+
+    def test_unreadable_cached_copy_is_fetched_again(self):
+        expected = bytes(load_and_prepare_graph(self.url).targets)
+        # Replaced rather than overwritten in place: the first graph still maps the old file
+        write_graph_file(b"not a graph", routingUtil._disk_cache_path(self.url))
+        # The server answers the revalidation with 304, so the cached copy is read first
+        with self.assertLogs("routing.utils.routingUtil", "WARNING") as logs:
+            graph = self.reload()
+        self.assertEqual(bytes(graph.targets), expected)
+        self.assertIn("Ignoring unreadable cached graph", logs.output[0])
+
+
+
+# --- HTTP SESSION ---
+
+class _ScriptedHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves server.documents ({path: (body, headers)}) with
+    conditional GET support over keep-alive connections, after failing with
+    the statuses queued in server.failures; server.delay stalls every answer.
+    Each request is recorded in server.seen as (client port, path, headers).
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.seen.append((self.client_address[1], self.path, dict(self.headers)))
+        time.sleep(server.delay)
+        if server.failures:
+            self.reply(server.failures.pop(0), {"Retry-After": "0"})
+            return
+        if self.path not in server.documents:
+            self.reply(404)
+            return
+        body, headers = server.documents[self.path]
+        etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+        if ((etag and self.headers.get("If-None-Match") == etag)
+                or (not etag and last_modified and self.headers.get("If-Modified-Since") == last_modified)):
+            self.reply(304, headers)
+        else:
+            self.reply(200, headers, body)
+
+    def reply(self, status, headers=(), body=b""):
+        self.send_response(status)
+        for key, value in dict(headers).items():
+            self.send_header(key, value)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(ROUTING_HTTP_BACKOFF_SECONDS=0, ROUTING_HTTP_RETRIES=3)
+class HttpSessionTests(SimpleTestCase):
+    """The shared session (http_session) and the conditional map fetches built on it, against a local server."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _ScriptedHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.documents, self.server.failures, self.server.seen, self.server.delay = {}, [], [], 0.0
+        # A session built under these tests' settings, dropped afterwards
+        patcher = mock.patch.object(http_session, "_session", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(ROUTING_GRAPH_DISK_CACHE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        invalidate_graph(None)
+        self.addCleanup(invalidate_graph, None)
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+    def publish(self, path, data, etag=None, last_modified=None):
+        headers = {key: value for key, value in (("ETag", etag), ("Last-Modified", last_modified)) if value}
+        self.server.documents[path] = (json.dumps(data).encode(), headers)
+
+    def reload(self, url):
+        graph_cache.invalidate(url)
+        return load_and_prepare_graph(url)
+
+    def test_connections_are_kept_alive(self):
+        self.publish("/a.json", {})
+        for _ in range(3):
+            self.assertEqual(http_session.http_get(self.url("/a.json")).status_code, 200)
+        self.assertEqual(len({port for port, _, _ in self.server.seen}), 1)
+
+    def test_retries_transient_statuses(self):
+        self.publish("/a.json", {"ok": True})
+        self.server.failures = [429, 503, 500]
+        response = http_session.http_get(self.url("/a.json"))
+        self.assertEqual((response.status_code, response.json()), (200, {"ok": True}))
+        self.assertEqual(len(self.server.seen), 4)
+
+    def test_gives_up_after_the_retries(self):
+        self.server.failures = [502] * 4
+        with self.assertRaisesMessage(ValidationError, "Failed to fetch graph data from URL"):
+            load_and_prepare_graph(self.url("/a.json"))
+        self.assertEqual(len(self.server.seen), 4)
+
+    def test_other_errors_are_not_retried(self):
+        with self.assertRaisesMessage(ValidationError, "404"):
+            load_and_prepare_graph(self.url("/missing.json"))
+        self.assertEqual(len(self.server.seen), 1)
+
+    @override_settings(ROUTING_HTTP_RETRIES=0, ROUTING_HTTP_READ_TIMEOUT_SECONDS=0.1)
+    def test_read_timeout(self):
+        self.assertEqual(http_session.default_timeout(), (5.0, 0.1))
+        self.publish("/a.json", {})
+        self.server.delay = 0.5
+        started = time.perf_counter()
+        # With no retries left urllib3 reports the timeout as MaxRetryError, a ConnectionError to requests
+        with self.assertRaisesRegex(requests.RequestException, "Read timed out"):
+            http_session.http_get(self.url("/a.json"))
+        self.assertLess(time.perf_counter() - started, 0.45)
+        with self.assertRaisesMessage(ValidationError, "Read timed out"):
+            load_and_prepare_graph(self.url("/a.json"))
+
+    def test_session_is_rebuilt_after_fork(self):
+        session = http_session.get_session()
+        self.assertIs(http_session.get_session(), session)
+        with mock.patch("routing.utils.http_session.os.getpid", return_value=os.getpid() + 1):
+            forked = http_session.get_session()
+            self.assertIsNot(forked, session)
+            self.assertIs(http_session.get_session(), forked)
+
+    @skipIf(not hasattr(os, "fork"), "needs fork")
+    def test_forked_child_fetches_on_its_own_session(self):
+        self.publish("/a.json", {})
+        parent = http_session.get_session()
+        http_session.http_get(self.url("/a.json"))
+        pid = os.fork()
+        if pid == 0:
+            ok = False
+            try:
+                ok = http_session.get_session() is not parent and http_session.http_get(
+                    self.url("/a.json")).status_code == 200
+            finally:
+                os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertEqual(len({port for port, _, _ in self.server.seen}), 2)
+
+    def test_revalidates_with_etag(self):
+        url = self.url("/etag.json")
+        self.publish("/etag.json", _grid_map(4, 4), etag='"v1"', last_modified="Mon, 05 Oct 2026 10:00:00 GMT")
+        first = load_and_prepare_graph(url)
+        self.assertNotIn("If-None-Match", self.server.seen[-1][2])
+
+        with mock.patch("routing.utils.routingUtil.build_graph_data", wraps=build_graph_data) as build:
+            graph = self.reload(url)
+            build.assert_not_called()  # the 304 reused the disk-cached graph
+        self.assertEqual(self.server.seen[-1][2]["If-None-Match"], '"v1"')
+        self.assertEqual(bytes(graph.targets), bytes(first.targets))
+
+        self.publish("/etag.json", _grid_map(5, 5), etag='"v2"')
+        self.assertEqual(self.reload(url).node_count, 25)
+        self.assertEqual(self.server.seen[-1][2]["If-None-Match"], '"v1"')
+        self.reload(url)
+        self.assertEqual(self.server.seen[-1][2]["If-None-Match"], '"v2"')
+
+    def test_revalidates_with_last_modified(self):
+        url = self.url("/dated.json")
+        self.publish("/dated.json", _grid_map(4, 4), last_modified="Mon, 05 Oct 2026 10:00:00 GMT")
+        load_and_prepare_graph(url)
+        with mock.patch("routing.utils.routingUtil.build_graph_data", wraps=build_graph_data) as build:
+            self.assertEqual(self.reload(url).node_count, 16)
+            build.assert_not_called()
+        self.assertEqual(self.server.seen[-1][2]["If-Modified-Since"], "Mon, 05 Oct 2026 10:00:00 GMT")
+        self.assertNotIn("If-None-Match", self.server.seen[-1][2])
+
+        self.publish("/dated.json", _grid_map(5, 5), last_modified="Tue, 06 Oct 2026 10:00:00 GMT")
+        self.assertEqual(self.reload(url).node_count, 25)
+
+
+# --- SEARCH SCRATCH ---
+
+class ScratchPoolTests(SimpleTestCase):
+    def test_checkouts_are_reentrant_and_reuse_sets(self):
+        pool = ScratchPool(2)
+        with pool.checkout() as outer:
+            with pool.checkout() as inner:
+                self.assertIs(inner, outer)
+            self.assertIs(pool.current(), outer)
+        with pool.checkout() as again:
+            self.assertIs(again, outer)
+        with self.assertRaises(RuntimeError):
+            pool.current()
+
+    def test_searches_wait_for_a_free_set(self):
+        pool = ScratchPool(1)
+        taken, release = threading.Event(), threading.Event()
+
+        def hold():
+            with pool.checkout():
+                taken.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        taken.wait(5)
+        def take():
+            with pool.checkout() as scratch:
+                return scratch
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            waiting = executor.submit(take)
+            time.sleep(0.05)
+            self.assertFalse(waiting.done())
+            release.set()
+            self.assertIsNotNone(waiting.result(5))
+        holder.join()
+
+    def test_graph_size_counts_the_pooled_scratch(self):
+        data = _grid_map(6, 6)
+        with mock.patch("routing.utils.routingUtil.SEARCH_SCRATCH_SETS", 1):
+            graph = build_graph_data(data)
+        with mock.patch("routing.utils.routingUtil.SEARCH_SCRATCH_SETS", 2):
+            bigger = build_graph_data(data)
+        per_set = 24 * (3 * graph.node_count + 2 * graph.edge_count)
+        self.assertEqual(bigger.approx_bytes() - graph.approx_bytes(), per_set)
+
+        # However many threads route on it, no more sets than the pool allows are made
+        search_graph = build_graph_data(data)
+        search_graph._scratch = ScratchPool(2)
+        ids = list(search_graph.node_ids)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda k: shortest_path_astar(ids[k % 36], ids[-1 - k % 36], search_graph),
+                              range(64)))
+        self.assertLessEqual(search_graph._scratch._created, 2)
+
+
+
+class SearchStateTests(SimpleTestCase):
+    def test_a_new_generation_forgets_the_last_search_without_clearing(self):
+        state = SearchState(5)
+        generation = state.begin()
+        state.g_score[2], state.came_from[2], state.stamp[2] = 3.0, 4, generation
+        state.g_score[4], state.came_from[4], state.stamp[4] = 1.0, -1, generation
+        self.assertEqual((state.g(2), state.g(1), state.path_to(2)), (3.0, math.inf, [4, 2]))
+        self.assertEqual(state.begin(), generation + 1)
+        self.assertEqual(state.g(2), math.inf)
+        self.assertEqual(state.g_score[2], 3.0)
+
+    def test_short_routes_cost_what_they_explore_not_the_map_size(self):
+        graph = build_graph_data(_grid_map(120, 120, seed=29, elevation=True)).freeze()
+        middle = 100 + 60 * 120 + 60
+        original = SearchState.__init__
+        allocated = []
+
+        def counting(state, size):
+            allocated.append(size)
+            original(state, size)
+
+        for mode in ("shortest", "energy_efficient", "least_turn"):
+            for bidirectional in (False, True):
+                route_by_mode(middle, middle + 2, graph, mode, bidirectional=bidirectional)  # allocates the states
+                stats = SearchStats()
+                with self.subTest(mode=mode, bidirectional=bidirectional), \
+                        mock.patch.object(SearchState, "__init__", counting):
+                    path, cost, _ = route_by_mode(middle, middle + 2, graph, mode, stats=stats,
+                                                  bidirectional=bidirectional)
+                    self.assertEqual(allocated, [])
+                    self.assertTrue(path and math.isfinite(cost))
+                    # A few dozen of the 14,400 nodes (or 57,000 edge slots)
+                    self.assertLess(stats.nodes_expanded, 100)
+
+
+# --- CONCURRENT ROUTING ---
+
+@override_settings(ROUTING_GRAPH_DISK_CACHE_DIR="")
+class ConcurrentRoutingTests(_MapServerTestCase):
+    """Loads and routes from many threads at once must answer exactly as one thread does."""
+
+    MAPS = {"flat": _grid_map(12, 12, seed=4), "hilly": _grid_map(12, 12, seed=5, elevation=True)}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.map_urls = [cls.map_url("flat"), cls.map_url("hilly")]
+
+    def route(self, body):
+        response = self.post("/routing/calculate/", body)
+        data = response.json()
+        return response.status_code, data.get("path_node_ids"), data.get("total_cost"), data.get("turn_count")
+
+    def in_threads(self, function, items):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            return list(executor.map(function, items))
+
+    def test_loader_builds_each_map_once(self):
+        expected = {url: load_and_prepare_graph(url) for url in self.map_urls}
+        invalidate_graph(None)
+
+        fetch = routingUtil._fetch_and_build_graph
+        with mock.patch.object(routingUtil, "_fetch_and_build_graph", side_effect=fetch) as loader:
+            graphs = self.in_threads(load_and_prepare_graph, self.map_urls * 8)
+        self.assertEqual(loader.call_count, len(self.map_urls))
+        for url, graph in zip(self.map_urls * 8, graphs):
+            self.assertIs(graph, graphs[self.map_urls.index(url)])
+            self.assertEqual(bytes(graph.targets), bytes(expected[url].targets))
+            self.assertEqual(bytes(graph.weights), bytes(expected[url].weights))
+
+    def test_routes_match_single_threaded_ones(self):
+        rnd = random.Random(3)
+        requests = [
+            {"map_url": url, "mode": mode, "source_id": rnd.randrange(100, 244),
+             "target_id": rnd.randrange(100, 244), "bidirectional": rnd.random() < 0.5}
+            for url in self.map_urls for mode in ("shortest", "energy_efficient", "least_turn") for _ in range(6)
+        ]
+        expected = [self.route(body) for body in requests]
+        self.assertTrue(all(status in (200, 404) for status, *_ in expected))
+        invalidate_graph(None)
+
+        self.assertEqual(self.in_threads(self.route, requests * 3), expected * 3)
+
+    def test_batches_match_single_threaded_ones(self):
+        requests = [{"map_url": url, "mode": mode, "sources": [100, 150, 200], "targets": [120, 180, 243]}
+                    for url in self.map_urls for mode in ("shortest", "energy_efficient", "least_turn")]
+        expected = [self.batch(body) for body in requests]
+        invalidate_graph(None)
+
+        self.assertEqual(self.in_threads(self.batch, requests * 3), expected * 3)
+
+
+# --- PROFILING ---
+
+class ProfilingMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings = override_settings(ROUTING_PROFILING_ENABLED=True, ROUTING_PROFILING_SAMPLE_RATE=1.0,
+                                          ROUTING_PROFILING_SLOW_MS=0, ROUTING_PROFILING_DIR=directory.name)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+    def middleware(self, get_response=lambda request: JsonResponse({})):
+        return ProfilingMiddleware(get_response)
+
+    def test_profiles_sampled_routing_requests_around_the_chain(self):
+        with self.assertLogs("routing.middleware", "WARNING"):
+            response = self.client.post("/routing/calculate/", data="{}", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        captures = self.middleware().captures.list()
+        self.assertEqual(len(captures), 1)
+        with open(captures[0]) as f:
+            self.assertIsNotNone(json.load(f)["profile"])
+
+    def test_stack_samples_unsampled_routing_requests(self):
+        with override_settings(ROUTING_PROFILING_SAMPLE_RATE=0.0), self.assertLogs("routing.middleware", "WARNING"):
+            middleware = self.middleware()
+            middleware(RequestFactory().post("/routing/calculate/", data='{"mode": "shortest"}',
+                                             content_type="application/json"))
+        captures = middleware.captures.list()
+        self.assertEqual(len(captures), 1)
+        with open(captures[0]) as f:
+            capture = json.load(f)
+        self.assertIsNone(capture["profile"])
+        self.assertEqual(capture["params"], {"mode": "shortest"})
+
+    def test_skips_other_views(self):
+        calls = []
+        middleware = self.middleware(lambda request: calls.append(request) or JsonResponse({}))
+        middleware(RequestFactory().get("/"))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(middleware.captures.list(), [])
+
+    def test_fast_requests_are_not_captured(self):
+        with override_settings(ROUTING_PROFILING_SLOW_MS=60_000):
+            middleware = self.middleware()
+            middleware(RequestFactory().post("/routing/calculate/"))
+        self.assertEqual(middleware.captures.list(), [])
+
+    def test_streamed_responses_are_watched_to_the_end(self):
+        middleware = self.middleware(lambda request: StreamingHttpResponse(iter([b"a\n", b"b\n"])))
+        response = middleware(RequestFactory().post("/routing/calculate/batch/"))
+        self.assertEqual(middleware.captures.list(), [])
+        with self.assertLogs("routing.middleware", "WARNING"):
+            self.assertEqual(b"".join(response.streaming_content), b"a\nb\n")
+        response.close()
+        self.assertEqual(len(middleware.captures.list()), 1)
+
+
+# --- DISTANCES AND HEURISTICS ---
+
+class HaversineTests(SimpleTestCase):
+    def test_batch_matches_the_scalar_version(self):
+        rnd = random.Random(31)
+        points = [(rnd.uniform(-89, 89), rnd.uniform(-180, 180), rnd.uniform(-89, 89), rnd.uniform(-180, 180))
+                  for _ in range(200)]
+        # Identical, nearly identical and antipodal points (where rounding can push the term past 1)
+        points += [(12.97, 77.59, 12.97, 77.59), (12.97, 77.59, 12.97, 77.590001), (10.0, 20.0, -10.0, -160.0)]
+        lat1, lon1, lat2, lon2 = (np.array(column) for column in zip(*points))
+        batch = haversine_distance_batch(lat1, lon1, lat2, lon2)
+        for distance, point in zip(batch, points):
+            self.assertAlmostEqual(distance, haversine_distance(*point), delta=1e-6 * max(distance, 1.0))
+        self.assertEqual(batch[-3], 0.0)
+        self.assertAlmostEqual(batch[-1], math.pi * 6371e3, delta=1.0)  # asin is ill-conditioned there
+        # Scalars broadcast against arrays
+        self.assertEqual(list(haversine_distance_batch(12.97, 77.59, lat2[:3], lon2[:3])),
+                         list(haversine_distance_batch(np.full(3, 12.97), np.full(3, 77.59), lat2[:3], lon2[:3])))
+
+    def test_path_physical_distance(self):
+        coords = [(12.97, 77.59), (12.971, 77.5905), (12.9705, 77.592), (12.9705, 77.592)]
+        self.assertEqual(path_physical_distance([]), 0.0)
+        self.assertEqual(path_physical_distance(coords[:1]), 0.0)
+        self.assertAlmostEqual(path_physical_distance(coords),
+                               sum(haversine_distance(*a, *b) for a, b in zip(coords, coords[1:])), places=6)
+
+
+class HeuristicTermsTests(SimpleTestCase):
+    def setUp(self):
+        self.graph = build_graph_data(_grid_map(10, 10, seed=37)).freeze()
+
+    def test_precomputed_terms(self):
+        graph = self.graph
+        for i in range(graph.node_count):
+            self.assertAlmostEqual(graph.lat_rad[i], math.radians(graph.lat[i]), places=15)
+            self.assertAlmostEqual(graph.lon_rad[i], math.radians(graph.lon[i]), places=15)
+            self.assertAlmostEqual(graph.cos_lat[i], math.cos(math.radians(graph.lat[i])), places=15)
+
+    def test_bound_is_the_haversine_distance_to_the_goal(self):
+        graph = self.graph
+        for goal in (0, 37, graph.node_count - 1):
+            bound = lower_bound_to(graph, goal, 5)
+            goal_coords = graph.node_coords[graph.node_ids[goal]]
+            for v in range(graph.node_count):
+                expected = haversine_distance(*graph.node_coords[graph.node_ids[v]], *goal_coords)
+                self.assertAlmostEqual(bound(v), expected, delta=1e-6)
+
+    def test_goal_terms_are_read_once_per_query(self):
+        class Counting(list):
+            reads = 0
+
+            def __getitem__(self, index):
+                Counting.reads += 1
+                return super().__getitem__(index)
+
+        graph = build_graph_data(_grid_map(4, 4))
+        for name in ("lat_rad", "lon_rad", "cos_lat"):
+            object.__setattr__(graph, name, Counting(getattr(graph, name)))
+        bound = lower_bound_to(graph, 3, 0)
+        setup = Counting.reads
+        for v in range(graph.node_count):
+            bound(v)
+        # Per node: its own three terms, none of the goal's
+        self.assertEqual(Counting.reads - setup, 3 * graph.node_count)
+
+
+# --- ROUTING MODES ---
+
+def _bearing(a, b) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    y = math.sin(lon2 - lon1) * math.cos(lat2)
+    x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(lon2 - lon1)
+    return math.atan2(y, x)
+
+
+class _BruteForce:
+    """Textbook Dijkstra over a map payload, costed from the mode definitions rather than the graph's arrays."""
+
+    def __init__(self, data):
+        self.coords = {node["id"]: (node["lat"], node["lon"]) for node in data["nodes"]}
+        self.ele = {node["id"]: node.get("ele") for node in data["nodes"]}
+        self.adjacent = {node_id: {} for node_id in self.coords}
+        for edge in data["edges"]:
+            self.adjacent[edge["u"]][edge["v"]] = self.adjacent[edge["v"]][edge["u"]] = edge["weight"]
+
+    def cost(self, mode, u, v) -> float:
+        weight = self.adjacent[u][v]
+        if mode == "shortest":
+            return weight
+        rise = max(self.ele[v] - self.ele[u], 0.0)
+        return weight * ENERGY_PENALTY_FACTOR + rise * (ENERGY_CLIMB_COST + ENERGY_STEEP_COST * min(rise / weight, MAX_GRADE))
+
+    def sharp(self, a, b, c) -> bool:
+        change = abs(_bearing(self.coords[b], self.coords[c]) - _bearing(self.coords[a], self.coords[b]))
+        return min(change, 2 * math.pi - change) > math.radians(SHARP_TURN_THRESHOLD_DEG)
+
+    def distances(self, mode, source):
+        """{node: cost} from source; least_turn searches (previous, node) states, U-turns only at the source."""
+        if mode != "least_turn":
+            best, heap = {}, [(0.0, source)]
+            while heap:
+                d, u = heapq.heappop(heap)
+                if u not in best:
+                    best[u] = d
+                    for v in self.adjacent[u]:
+                        heapq.heappush(heap, (d + self.cost(mode, u, v), v))
+            return best
+
+        best, settled = {source: 0.0}, set()
+        heap = [(weight, source, v) for v, weight in self.adjacent[source].items()]
+        heapq.heapify(heap)
+        while heap:
+            d, previous, u = heapq.heappop(heap)
+            if (previous, u) in settled:
+                continue
+            settled.add((previous, u))
+            best.setdefault(u, d)
+            for v, weight in self.adjacent[u].items():
+                if v != previous or u == source:
+                    heapq.heappush(heap, (d + weight + (TURN_PENALTY_METERS if self.sharp(previous, u, v) else 0), u, v))
+        return best
+
+    def path_cost(self, mode, path):
+        """(cost, sharp turns) of a route as mode charges it."""
+        turns = sum(self.sharp(a, b, c) for a, b, c in zip(path, path[1:], path[2:]))
+        if mode == "least_turn":
+            return sum(self.adjacent[u][v] for u, v in zip(path, path[1:])) + TURN_PENALTY_METERS * turns, turns
+        return sum(self.cost(mode, u, v) for u, v in zip(path, path[1:])), turns
+
+
+class RoutingModeTests(SimpleTestCase):
+    """Every mode, with and without its speed-ups, finds the optimum a brute-force Dijkstra does."""
+
+    MODES = ("shortest", "energy_efficient", "least_turn")
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        data = _grid_map(9, 9, seed=5, elevation=True)
+        cls.reference = _BruteForce(data)
+        cls.plain = build_graph_data(data).freeze()
+        cls.prepared = build_graph_data(data)
+        with override_settings(ROUTING_CONTRACTION_HIERARCHIES=True, ROUTING_ALT_LANDMARKS=4):
+            prepare_graph(cls.prepared)
+        cls.prepared.freeze()
+        rnd = random.Random(7)
+        ids = list(cls.reference.coords)
+        cls.sources = rnd.sample(ids, 6)
+        cls.targets = rnd.sample(ids, 8)
+
+        # Chain-heavy map, without the overlay, with it, and with it plus landmarks (ALT over the chains)
+        chains = _chain_map(seed=3)
+        cls.chain_reference = _BruteForce(chains)
+        cls.chain_graphs = {}
+        for name, options in (("unsimplified", {"ROUTING_SIMPLIFY_CHAINS": False}),
+                              ("simplified", {"ROUTING_SIMPLIFY_CHAINS": True}),
+                              ("simplified+alt", {"ROUTING_SIMPLIFY_CHAINS": True, "ROUTING_ALT_LANDMARKS": 4})):
+            graph = build_graph_data(chains)
+            with override_settings(**{"ROUTING_CONTRACTION_HIERARCHIES": False, "ROUTING_ALT_LANDMARKS": 0, **options}):
+                prepare_graph(graph)
+            cls.chain_graphs[name] = graph.freeze()
+        # Junctions, trackpoints along chains (parallel, loop, dead ends) and the detached cycle
+        ids = list(cls.chain_reference.coords)
+        picks = [chains["junctions"][0], chains["junctions"][4], chains["loop"][3], chains["cycle"][2], ids[-7], ids[-14]]
+        cls.chain_sources = picks + rnd.sample(ids, 4)
+        cls.chain_targets = picks[::-1] + rnd.sample(ids, 6)
+
+    def check_route(self, mode, source, target, distances, path, cost, turns, reference=None):
+        reference = reference or self.reference
+        expected = distances.get(target, math.inf)
+        if math.isinf(expected):
+            self.assertEqual((path, cost), ([], math.inf))
+            return
+        self.assertAlmostEqual(cost, expected, delta=1e-6 * expected)
+        self.assertEqual((path[0], path[-1]), (source, target))
+        path_cost, path_turns = reference.path_cost(mode, path)
+        self.assertAlmostEqual(path_cost, cost, delta=1e-6 * max(cost, 1.0))
+        if mode == "least_turn":
+            self.assertEqual(turns, path_turns)
+
+    def test_point_to_point_routes_are_optimal(self):
+        for mode in self.MODES:
+            for source in self.sources:
+                distances = self.reference.distances(mode, source)
+                for target in self.targets:
+                    for graph in (self.plain, self.prepared):
+                        for bidirectional in (False, True):
+                            with self.subTest(mode=mode, source=source, target=target, prepared=graph is self.prepared,
+                                              bidirectional=bidirectional):
+                                self.check_route(mode, source, target, distances,
+                                                 *route_by_mode(source, target, graph, mode,
+                                                                bidirectional=bidirectional))
+
+    def test_one_to_many_routes_are_optimal(self):
+        for mode in self.MODES:
+            for source in self.sources:
+                distances = self.reference.distances(mode, source)
+                for graph in (self.plain, self.prepared):
+                    routes = one_to_many_routes(source, self.targets, graph, mode)
+                    for target in self.targets:
+                        with self.subTest(mode=mode, source=source, target=target, prepared=graph is self.prepared):
+                            self.check_route(mode, source, target, distances, *routes[target])
+
+
+    def test_chain_simplification_keeps_routes_optimal(self):
+        self.assertIsNone(self.chain_graphs["unsimplified"].simplified)
+        self.assertIsNotNone(self.chain_graphs["simplified"].simplified)
+        self.assertLess(self.chain_graphs["simplified"].simplified.core_count,
+                        self.chain_graphs["simplified"].node_count // 4)
+        for mode in self.MODES:
+            for source in self.chain_sources:
+                distances = self.chain_reference.distances(mode, source)
+                for name, graph in self.chain_graphs.items():
+                    routes = one_to_many_routes(source, self.chain_targets, graph, mode)
+                    for target in self.chain_targets:
+                        with self.subTest(mode=mode, source=source, target=target, graph=name):
+                            self.check_route(mode, source, target, distances, *routes[target],
+                                             reference=self.chain_reference)
+                            for bidirectional in (False, True):
+                                self.check_route(mode, source, target, distances,
+                                                 *route_by_mode(source, target, graph, mode,
+                                                                bidirectional=bidirectional),
+                                                 reference=self.chain_reference)
+
+
+
+class ContractionHierarchyTests(SimpleTestCase):
+    """CH queries answer exactly what Dijkstra does, over original-graph paths."""
+
+    def check_all_pairs(self, graph):
+        ch = ContractionHierarchy.build(graph)
+        self.assertEqual(sorted(ch.rank), list(range(graph.node_count)))
+        for u in range(graph.node_count):
+            for slot in range(ch.up_offsets[u], ch.up_offsets[u + 1]):
+                self.assertGreater(ch.rank[ch.up_targets[slot]], ch.rank[u])
+        best_weight = {}
+        for u in range(graph.node_count):
+            for slot in graph.neighbors(u):
+                key = (u, graph.targets[slot])
+                best_weight[key] = min(best_weight.get(key, math.inf), graph.weights[slot])
+        for source in range(graph.node_count):
+            distances = dijkstra_all(graph, source)
+            for target in range(graph.node_count):
+                path, cost = ch.query(source, target)
+                with self.subTest(source=source, target=target):
+                    if math.isinf(distances[target]):
+                        self.assertEqual((path, cost), ([], math.inf))
+                        continue
+                    self.assertAlmostEqual(cost, distances[target], delta=1e-9 * max(cost, 1.0))
+                    self.assertEqual((path[0], path[-1]), (source, target))
+                    self.assertAlmostEqual(sum(best_weight[u, v] for u, v in zip(path, path[1:])), cost,
+                                           delta=1e-9 * max(cost, 1.0))
+        return ch
+
+    def test_matches_dijkstra_on_a_map_with_shortcuts(self):
+        data = _grid_map(8, 8, seed=41)
+        rnd = random.Random(43)
+        for edge in data["edges"]:
+            edge["weight"] *= rnd.choice((1.0, 1.0, 3.0))  # detours make witnesses fail, so shortcuts are kept
+        ch = self.check_all_pairs(build_graph_data(data))
+        self.assertGreater(ch.shortcut_count, 0)
+        self.assertTrue(any(middle != -1 for middle in ch.up_middle))
+
+    def test_parallel_edges_self_loops_and_separate_components(self):
+        nodes = [{"id": i, "lat": 12.97 + 1e-3 * (i % 3), "lon": 77.59 + 1e-3 * (i // 3)} for i in range(8)]
+        edges = [(0, 1, 5.0), (0, 1, 2.0), (1, 2, 2.0), (1, 1, 0.5), (2, 3, 9.0), (0, 3, 4.0), (3, 4, 1.0),
+                 (4, 2, 1.0), (6, 7, 3.0), (7, 6, 1.0)]
+        graph = build_graph_data({"nodes": nodes, "edges": [{"u": u, "v": v, "weight": w} for u, v, w in edges]})
+        ch = self.check_all_pairs(graph)
+        self.assertEqual(ch.query(0, 2), ([0, 1, 2], 4.0))
+        self.assertEqual(ch.query(6, 7), ([6, 7], 1.0))
+        self.assertEqual(ch.query(5, 5), ([5], 0.0))
+
+
+
+class AltLandmarksTests(SimpleTestCase):
+    """ALT bounds stay admissible and consistent while beating straight-line distance on winding maps."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        data = _grid_map(10, 10, seed=47, elevation=True)
+        for edge in data["edges"]:
+            edge["weight"] *= 3  # winding paths: weights well above the straight line
+        cls.plain = build_graph_data(data).freeze()
+        cls.graph = build_graph_data(data)
+        with override_settings(ROUTING_ALT_LANDMARKS=4, ROUTING_CONTRACTION_HIERARCHIES=False,
+                               ROUTING_SIMPLIFY_CHAINS=False):
+            prepare_graph(cls.graph)
+        cls.graph.freeze()
+        cls.queries = [(0, 99), (5, 60), (42, 7), (93, 11), (31, 68)]
+
+    def check_bound(self, bound, exact, costs, toward=True):
+        """bound(v) <= exact[v] for every node, and consistent along every slot (costs) in the search's direction."""
+        graph = self.graph
+        for v in range(graph.node_count):
+            self.assertLessEqual(bound(v), exact[v] + 1e-6)
+        for u in range(graph.node_count):
+            for slot in graph.neighbors(u):
+                v = graph.targets[slot]
+                near, far = (v, u) if toward else (u, v)
+                self.assertLessEqual(bound(far), costs[slot] + bound(near) + 1e-6)
+
+    def test_distance_bound(self):
+        self.assertEqual(len(self.graph.landmarks.landmarks), 4)
+        tighter = 0
+        for origin, goal in self.queries:
+            with self.subTest(origin=origin, goal=goal):
+                bound, straight = lower_bound_to(self.graph, goal, origin), lower_bound_to(self.plain, goal, origin)
+                self.check_bound(bound, dijkstra_all(self.graph, goal), self.graph.weights)
+                tighter += sum(bound(v) > 1.5 * straight(v) for v in range(self.graph.node_count))
+        self.assertGreater(tighter, len(self.queries) * self.graph.node_count // 2)
+
+    def test_energy_bound_in_both_directions(self):
+        graph, energy = self.graph, routing_mode("energy_efficient")
+        self.assertIsNotNone(graph.energy_landmarks)
+        for origin, goal in self.queries:
+            with self.subTest(origin=origin, goal=goal):
+                # Costs from every node to goal: a search from goal over the reversed slots
+                self.check_bound(energy.heuristic(graph, goal, origin),
+                                 dijkstra_all(graph, goal, graph.reverse_energy_weights), graph.energy_weights)
+                self.check_bound(energy.heuristic(graph, goal, origin, toward=False),
+                                 dijkstra_all(graph, goal, graph.energy_weights), graph.energy_weights, toward=False)
+
+    def test_landmarks_cut_the_nodes_expanded(self):
+        for mode in ("shortest", "energy_efficient"):
+            expanded = {}
+            for name, graph in (("plain", self.plain), ("alt", self.graph)):
+                stats = SearchStats()
+                for origin, goal in self.queries:
+                    route_by_mode(graph.node_ids[origin], graph.node_ids[goal], graph, mode, stats=stats)
+                expanded[name] = stats.nodes_expanded
+            with self.subTest(mode=mode):
+                self.assertLess(expanded["alt"], expanded["plain"])
+
+
+class EnergyCostTests(SimpleTestCase):
+    """Grade-aware edge costs, worked out by hand, and the elevation they come from."""
+
+    # A hill on the direct way from 1 to 4, and a longer flat detour through 5 and 6
+    HILL = {
+        "nodes": [{"id": 1, "lat": 12.97, "lon": 77.59, "ele": 900},
+                  {"id": 2, "lat": 12.9703, "lon": 77.59075, "ele": 960},
+                  {"id": 4, "lat": 12.97, "lon": 77.5915, "ele": 900},
+                  {"id": 5, "lat": 12.969, "lon": 77.5903, "ele": 900},
+                  {"id": 6, "lat": 12.969, "lon": 77.5912, "ele": 900}],
+        "edges": [{"u": 1, "v": 2, "weight": 100.0}, {"u": 2, "v": 4, "weight": 100.0}, {"u": 1, "v": 5, "weight": 120.0},
+                  {"u": 5, "v": 6, "weight": 100.0}, {"u": 6, "v": 4, "weight": 120.0}],
+    }
+
+    def slot_costs(self, graph):
+        """{(u_id, v_id): (energy cost, reverse energy cost)} of every slot."""
+        costs = {}
+        for u in range(graph.node_count):
+            for slot in graph.neighbors(u):
+                key = (graph.node_ids[u], graph.node_ids[graph.targets[slot]])
+                costs[key] = (graph.energy_weights[slot], graph.reverse_energy_weights[slot])
+        return costs
+
+    def test_hand_computed_costs(self):
+        graph = build_graph_data({
+            "nodes": [{"id": 1, "lat": 12.97, "lon": 77.59, "ele": 900},
+                      {"id": 2, "lat": 12.9709, "lon": 77.59, "ele": 910},
+                      {"id": 3, "lat": 12.97092, "lon": 77.59, "ele": 960},
+                      {"id": 4, "lat": 12.97, "lon": 77.591}],
+            "edges": [{"u": 1, "v": 2, "weight": 100.0}, {"u": 2, "v": 3, "weight": 20.0},
+                      {"u": 1, "v": 4, "weight": 110.0}],
+        })
+        self.assertTrue(graph.has_elevation)
+        self.assertFalse(graph.complete_elevation)
+        costs = self.slot_costs(graph)
+        flat, climb, steep = ENERGY_PENALTY_FACTOR, ENERGY_CLIMB_COST, ENERGY_STEEP_COST
+        self.assertEqual((flat, climb, steep, MAX_GRADE), (1.2, 10, 50, 1.0))
+        expected = {
+            (1, 2): 100 * flat + 10 * (climb + steep * 0.1),  # 270
+            (2, 1): 100 * flat,  # descending costs the flat rate
+            (2, 3): 20 * flat + 50 * (climb + steep * MAX_GRADE),  # a grade of 2.5, clamped to 1: 3024
+            (3, 2): 20 * flat,
+            (1, 4): 110 * flat,  # node 4 has no elevation: flat both ways
+            (4, 1): 110 * flat,
+        }
+        self.assertEqual(costs.keys(), expected.keys())
+        for (u, v), cost in expected.items():
+            with self.subTest(edge=(u, v)):
+                self.assertAlmostEqual(costs[u, v][0], cost, places=9)
+                # A slot's reverse cost is its twin's: the same edge walked the other way
+                self.assertAlmostEqual(costs[u, v][1], expected[v, u], places=9)
+        self.assertAlmostEqual(costs[1, 2][0], 270.0, places=9)
+        self.assertAlmostEqual(costs[2, 3][0], 3024.0, places=9)
+
+    def test_zero_length_edges_climb_at_the_steepest_grade(self):
+        # One edge between nodes 0 and 1 (slot 0: 0 -> 1, slot 1: 1 -> 0), 5 m apart in height
+        costs = edge_energy_costs(array("d", [0.0, 0.0]), array("q", [1, 0]), array("q", [1, 0]),
+                                  array("d", [900.0, 905.0]), ENERGY_PENALTY_FACTOR, ENERGY_CLIMB_COST,
+                                  ENERGY_STEEP_COST)
+        self.assertEqual(list(costs), [5 * (ENERGY_CLIMB_COST + ENERGY_STEEP_COST * MAX_GRADE), 0.0])
+
+    def test_maps_without_elevation_route_as_scaled_shortest(self):
+        data = _grid_map(6, 6, seed=11)
+        graph = build_graph_data(data)
+        self.assertFalse(graph.has_elevation)
+        self.assertIsNone(graph.energy_weights)
+        for source, target in ((100, 135), (105, 130)):
+            path, cost, _ = route_by_mode(source, target, graph, "shortest")
+            energy_path, energy_cost, _ = route_by_mode(source, target, graph, "energy_efficient")
+            with self.subTest(source=source, target=target):
+                self.assertEqual(energy_path, path)
+                self.assertAlmostEqual(energy_cost, cost * ENERGY_PENALTY_FACTOR, places=6)
+
+    def test_energy_routes_go_around_the_hill(self):
+        graph = build_graph_data(self.HILL).freeze()
+        self.assertEqual(route_by_mode(1, 4, graph, "shortest")[:2], ([1, 2, 4], 200.0))
+        climb = 100 * ENERGY_PENALTY_FACTOR + 60 * (ENERGY_CLIMB_COST + ENERGY_STEEP_COST * 0.6)
+        detour = 340 * ENERGY_PENALTY_FACTOR
+        self.assertLess(detour, climb)
+        for bidirectional in (False, True):
+            with self.subTest(bidirectional=bidirectional):
+                for source, target, path in ((1, 4, [1, 5, 6, 4]), (4, 1, [4, 6, 5, 1])):
+                    found, cost, _ = route_by_mode(source, target, graph, "energy_efficient",
+                                                   bidirectional=bidirectional)
+                    self.assertEqual(found, path)
+                    self.assertAlmostEqual(cost, detour, places=9)
+
+        # From the hilltop, going down directly is cheapest
+        found, cost, _ = route_by_mode(2, 4, graph, "energy_efficient")
+        self.assertEqual(found, [2, 4])
+        self.assertAlmostEqual(cost, 100 * ENERGY_PENALTY_FACTOR, places=9)
+
+    def test_elevation_flows_from_gpx_to_the_graph(self):
+        document = b"""<gpx><trk><trkseg>
+            <trkpt lat="12.97" lon="77.59"><ele>900</ele></trkpt>
+            <trkpt lat="12.9709" lon="77.59"><ele>910.5</ele></trkpt>
+            <trkpt lat="12.9718" lon="77.59"/>
+            </trkseg></trk></gpx>"""
+        data = build_graph(parse_gpx_content(document))
+        self.assertEqual([node.get("ele") for node in data["nodes"]], [900.0, 910.5, None])
+        graph = build_graph_data(data)
+        self.assertEqual(list(graph.elevation[:2]), [900.0, 910.5])
+        self.assertTrue(math.isnan(graph.elevation[2]))
+
+        first, second = graph.neighbors(0)[0], graph.neighbors(1)
+        weight = graph.weights[first]
+        self.assertAlmostEqual(graph.energy_weights[first],
+                               weight * ENERGY_PENALTY_FACTOR
+                               + 10.5 * (ENERGY_CLIMB_COST + ENERGY_STEEP_COST * 10.5 / weight), places=9)
+        # The edge to the point without elevation is flat both ways
+        for slot in second:
+            if graph.targets[slot] == 2:
+                self.assertAlmostEqual(graph.energy_weights[slot], graph.weights[slot] * ENERGY_PENALTY_FACTOR,
+                                       places=9)
+
+
+# --- REQUEST PARSING ---
+
+class CalculateRoutesParamsTests(SimpleTestCase):
+    def test_bidirectional_must_be_a_json_boolean(self):
+        for value in ("false", 1, "yes", None):
+            response = self.client.post("/routing/calculate/", content_type="application/json", data=json.dumps({
+                "map_url": "http://example.com/map.json", "source_id": 1, "target_id": 2, "bidirectional": value,
+            }))
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn("bidirectional", response.json()["error"])
+
+    def test_unknown_mode_is_rejected_before_the_map_loads(self):
+        with mock.patch("routing.views.load_and_prepare_graph") as load:
+            response = self.client.post("/routing/calculate/", content_type="application/json", data=json.dumps({
+                "map_url": "http://example.com/map.json", "source_id": 1, "target_id": 2, "mode": "fastest",
+            }))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "Invalid routing mode: fastest")
+        load.assert_not_called()
+
+
+# --- BATCH ROUTING ---
+
+def _with_isolated_node(data):
+    """data plus node 99, which no edge reaches."""
+    return {"nodes": data["nodes"] + [{"id": 99, "lat": 12.96, "lon": 77.58}], "edges": data["edges"]}
+
+
+class BatchRoutesTests(_MapServerTestCase):
+    MAPS = {"grid": _with_isolated_node(_grid_map(8, 8, seed=2, elevation=True))}
+    SOURCES, TARGETS = [100, 127, 163], [109, 150, 99]
+
+    def body(self, **fields):
+        return {"map_url": self.map_url("grid"), **fields}
+
+    def test_pairs_and_matrix_forms_agree(self):
+        pairs = [[s, t] for s in self.SOURCES for t in self.TARGETS]
+        by_pairs = self.batch(self.body(pairs=pairs))
+        by_matrix = self.batch(self.body(sources=self.SOURCES, targets=self.TARGETS))
+        self.assertEqual(by_pairs, by_matrix)
+        self.assertEqual([line["index"] for line in by_pairs], list(range(len(pairs))))
+
+    def test_pair_lines(self):
+        lines = self.batch(self.body(pairs=[[100, 163], [100, 99]], mode="least_turn"))
+        routed, unreachable = lines
+        self.assertEqual(set(routed), {"index", "source_id", "target_id", "total_cost", "units", "path_node_ids",
+                                       "path_coords", "total_physical_distance", "turn_count"})
+        self.assertEqual((routed["source_id"], routed["target_id"], routed["units"]), (100, 163, "Weighted-Units"))
+        self.assertEqual(len(routed["path_coords"]), len(routed["path_node_ids"]))
+        self.assertEqual(unreachable, {"index": 1, "source_id": 100, "target_id": 99, "total_cost": None,
+                                       "units": "Weighted-Units", "error": "No path found between selected nodes."})
+
+        polyline = self.batch(self.body(pairs=[[100, 163]], path_encoding="polyline"))[0]
+        self.assertIn("path_polyline", polyline)
+        self.assertNotIn("path_coords", polyline)
+
+    def test_costs_only_matrix(self):
+        lines = self.batch(self.body(sources=self.SOURCES, targets=self.TARGETS, costs_only=True))
+        self.assertEqual([line["source_id"] for line in lines], self.SOURCES)
+        full = {(line["source_id"], line["target_id"]): line["total_cost"]
+                for line in self.batch(self.body(sources=self.SOURCES, targets=self.TARGETS))}
+        for line in lines:
+            self.assertEqual(set(line), {"source_id", "costs", "units"})
+            self.assertEqual(line["costs"], [full[line["source_id"], t] for t in self.TARGETS])
+            self.assertIsNone(line["costs"][-1])
+
+    def test_costs_match_single_routes(self):
+        for mode in ("shortest", "energy_efficient", "least_turn"):
+            lines = self.batch(self.body(mode=mode, sources=self.SOURCES, targets=self.TARGETS[:2]))
+            for line in lines:
+                single = self.post("/routing/calculate/", self.body(
+                    mode=mode, source_id=line["source_id"], target_id=line["target_id"])).json()
+                with self.subTest(mode=mode, source=line["source_id"], target=line["target_id"]):
+                    self.assertAlmostEqual(line["total_cost"], single["total_cost"], places=6)
+                    self.assertEqual(line["turn_count"], single["turn_count"])
+
+    @override_settings(ROUTING_BATCH_MAX_PAIRS=4)
+    def test_rejects_too_many_pairs_before_building_them(self):
+        with mock.patch("routing.views.load_and_prepare_graph") as load:
+            response = self.post("/routing/calculate/batch/",
+                                 self.body(sources=["x"] * 100_000, targets=["y"] * 100_000))
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("10000000000", response.json()["error"])
+            response = self.post("/routing/calculate/batch/", self.body(pairs=[[100, 109]] * 5))
+            self.assertEqual(response.status_code, 400)
+        load.assert_not_called()
+
+    def test_rejects_bad_requests(self):
+        for body in (self.body(pairs=[[100]]), self.body(sources=[100]), self.body(pairs=[["a", 109]]),
+                     self.body(pairs=[[100, 109]], costs_only="false"), self.body(pairs=[[100, 109]], mode="fastest")):
+            with self.subTest(body=body):
+                self.assertEqual(self.post("/routing/calculate/batch/", body).status_code, 400)
+
+        response = self.post("/routing/calculate/batch/", self.body(pairs=[[100, 5], [7, 109]]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["node_ids"], [5, 7])
+
+
+
+# --- COORDINATE LOOKUPS ---
+
+def _scan_nodes(data, lat, lon):
+    """(meters, node_id) of every node, nearest first."""
+    return sorted((haversine_distance(lat, lon, node["lat"], node["lon"]), node["id"]) for node in data["nodes"])
+
+
+def _scan_edges(data, lat, lon):
+    """(meters, u, v, fraction from u) of the closest point on any edge, on a plane local to (lat, lon)."""
+    coords = {node["id"]: (node["lat"], node["lon"]) for node in data["nodes"]}
+    scale = math.cos(math.radians(lat))
+    best = (math.inf, None, None, 0.0)
+    for edge in data["edges"]:
+        (ulat, ulon), (vlat, vlon) = coords[edge["u"]], coords[edge["v"]]
+        dx, dy = (vlon - ulon) * scale, vlat - ulat
+        t = min(1.0, max(0.0, ((lon - ulon) * scale * dx + (lat - ulat) * dy) / (dx * dx + dy * dy)))
+        distance = haversine_distance(lat, lon, ulat + t * (vlat - ulat), ulon + t * (vlon - ulon))
+        best = min(best, (distance, edge["u"], edge["v"], t))
+    return best
+
+
+class SpatialIndexTests(SimpleTestCase):
+    """Node and edge lookups agree with a linear scan, on a map big enough for a multi-level tree."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.data = _grid_map(30, 30, seed=11)
+        cls.graph = build_graph_data(cls.data).freeze()
+        rnd = random.Random(13)
+        # Inside the map, on its edge and well outside it
+        cls.points = [(12.97 + rnd.uniform(-0.003, 0.018), 77.59 + rnd.uniform(-0.003, 0.018)) for _ in range(40)]
+
+    def test_k_nearest_nodes(self):
+        for lat, lon in self.points:
+            expected = _scan_nodes(self.data, lat, lon)
+            for k in (1, 5, 30):
+                with self.subTest(lat=lat, lon=lon, k=k):
+                    found = nearest_nodes(self.graph, lat, lon, k=k)
+                    self.assertEqual([node_id for node_id, _ in found], [node_id for _, node_id in expected[:k]])
+                    for (_, distance), (expected_distance, _) in zip(found, expected):
+                        self.assertAlmostEqual(distance, expected_distance, places=6)
+
+    def test_nodes_within_radius(self):
+        for lat, lon in self.points:
+            for radius in (0.0, 40.0, 150.0):
+                expected = [node_id for distance, node_id in _scan_nodes(self.data, lat, lon) if distance <= radius]
+                with self.subTest(lat=lat, lon=lon, radius=radius):
+                    self.assertEqual([node_id for node_id, _ in nearest_nodes(self.graph, lat, lon, k=10_000,
+                                                                               radius=radius)], expected)
+                    self.assertEqual([node_id for node_id, _ in nearest_nodes(self.graph, lat, lon, k=3,
+                                                                               radius=radius)], expected[:3])
+
+    def test_nearest_edge(self):
+        for lat, lon in self.points:
+            distance, u, v, fraction = _scan_edges(self.data, lat, lon)
+            snap = nearest_edge(self.graph, lat, lon)
+            with self.subTest(lat=lat, lon=lon):
+                self.assertAlmostEqual(snap.distance, distance, delta=0.01)
+                self.assertAlmostEqual(haversine_distance(lat, lon, snap.lat, snap.lon), snap.distance, places=6)
+                self.assertIsNone(nearest_edge(self.graph, lat, lon, max_distance=distance - 0.5))
+                if 1e-3 < fraction < 1 - 1e-3:  # at a node, any edge through it is as close
+                    ends = (self.graph.node_ids[snap.u], self.graph.node_ids[snap.v])
+                    self.assertEqual(set(ends), {u, v})
+                    self.assertAlmostEqual(snap.fraction if ends == (u, v) else 1 - snap.fraction, fraction, places=4)
+
+class CoordinateEndpointTests(_MapServerTestCase):
+    MAPS = {"grid": _grid_map(12, 12, seed=17)}
+    SOURCE, TARGET = (12.9712, 77.5913), (12.9748, 77.5941)
+
+    def setUp(self):
+        super().setUp()
+        self.reference = _BruteForce(self.MAPS["grid"])
+
+    def route(self, **fields):
+        return self.post("/routing/calculate/", {"map_url": self.map_url("grid"), **fields})
+
+    def test_nearest_view(self):
+        data = self.MAPS["grid"]
+        lat, lon = self.SOURCE
+        response = self.post("/routing/nearest/", {"map_url": self.map_url("grid"), "lat": lat, "lon": lon, "k": 4})
+        self.assertEqual(response.status_code, 200)
+        nodes = response.json()["nodes"]
+        self.assertEqual([node["node_id"] for node in nodes], [node_id for _, node_id in _scan_nodes(data, lat, lon)[:4]])
+        self.assertEqual(set(nodes[0]), {"node_id", "coords", "distance_m"})
+
+        within = self.post("/routing/nearest/", {"map_url": self.map_url("grid"), "lat": lat, "lon": lon,
+                                                 "k": 100, "radius": 80}).json()["nodes"]
+        self.assertEqual([node["node_id"] for node in within],
+                         [node_id for distance, node_id in _scan_nodes(data, lat, lon) if distance <= 80])
+
+        for body in ({"lat": lat, "lon": lon}, {"map_url": self.map_url("grid"), "lat": lat, "lon": lon, "k": 0},
+                     {"map_url": self.map_url("grid"), "lat": lat, "lon": lon, "radius": -1}):
+            with self.subTest(body=body):
+                self.assertEqual(self.post("/routing/nearest/", body).status_code, 400)
+
+    def test_coordinates_snap_to_the_nearest_nodes(self):
+        source = _scan_nodes(self.MAPS["grid"], *self.SOURCE)[0][1]
+        target = _scan_nodes(self.MAPS["grid"], *self.TARGET)[0][1]
+        response = self.route(source_coords=self.SOURCE, target_coords=self.TARGET)
+        self.assertEqual(response.status_code, 200)
+        route = response.json()
+        self.assertEqual((route["source_snap"]["node_id"], route["target_snap"]["node_id"]), (source, target))
+        self.assertAlmostEqual(route["total_cost"], self.reference.distances("shortest", source)[target], places=6)
+        self.assertEqual(route["total_cost"], self.route(source_id=source, target_id=target).json()["total_cost"])
+
+    def test_coordinates_snap_onto_edges(self):
+        ends = []
+        for point in (self.SOURCE, self.TARGET):
+            _, u, v, fraction = _scan_edges(self.MAPS["grid"], *point)
+            weight = self.reference.adjacent[u][v]
+            ends.append([(u, fraction * weight), (v, (1 - fraction) * weight)])
+        expected = min(head + self.reference.distances("shortest", a)[b] + tail
+                       for a, head in ends[0] for b, tail in ends[1])
+
+        route = self.route(source_coords=self.SOURCE, target_coords=self.TARGET, snap="edge").json()
+        self.assertAlmostEqual(route["total_cost"], expected, delta=1e-3)
+        self.assertEqual(route["path_coords"][0], list(route["source_snap"]["coords"]))
+        self.assertEqual(route["path_coords"][-1], list(route["target_snap"]["coords"]))
+        self.assertEqual(set(route["source_snap"]), {"edge", "fraction", "coords", "distance_m"})
+
+    def test_rejects_coordinates_beyond_max_distance(self):
+        far = (self.SOURCE[0] + 0.05, self.SOURCE[1])
+        for snap in ("node", "edge"):
+            with self.subTest(snap=snap):
+                response = self.route(source_coords=far, target_coords=self.TARGET, snap=snap)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("No part of the map within 500 m", response.json()["error"])
+        with override_settings(ROUTING_MAX_SNAP_DISTANCE_METERS=1.0):
+            self.assertEqual(self.route(source_coords=self.SOURCE, target_id=100).status_code, 400)
+        self.assertEqual(self.route(source_coords=self.SOURCE, target_id=100).status_code, 200)
+
+
+
+# --- METRICS ---
+
+_SAMPLE = re.compile(r'([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)')
+_LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"(?:,|$)')
+
+
+def _parse_prometheus(text):
+    """({(name, ((label, value), ...)): value}, {name: type}) from the text format, failing on malformed lines."""
+    samples, types = {}, {}
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert name not in types, f"{name} declared twice"
+            types[name] = kind
+            continue
+        if line.startswith("#"):
+            continue
+        match = _SAMPLE.fullmatch(line)
+        assert match, f"malformed sample line: {line!r}"
+        name, labels, value = match.groups()
+        assert re.sub(r"_(count|sum)$", "", name) in types or name in types, f"{name} has no TYPE line"
+        pairs = tuple(_LABEL.findall(labels)) if labels else ()
+        assert not labels or "".join(f'{k}="{v}",' for k, v in pairs)[:-1] == labels, f"malformed labels: {labels!r}"
+        samples[name, pairs] = float(value)
+    return samples, types
+
+
+class MetricsRenderTests(SimpleTestCase):
+    def test_render_is_valid_exposition_text(self):
+        metrics = MetricsRegistry()
+        self.assertEqual(metrics.render(), "")
+        metrics.inc("hits_total", help="Hits.", endpoint="calculate", status="200")
+        metrics.inc("hits_total", 2, endpoint="calculate", status="200")
+        metrics.inc("hits_total", endpoint='we"ird\\path', status="404")
+        metrics.observe("latency_seconds", 0.25, help="Latency.", endpoint="calculate")
+        metrics.observe("latency_seconds", 0.5, endpoint="calculate")
+        metrics.set_max("peak", 7, mode="shortest")
+        metrics.set_max("peak", 3, mode="shortest")
+
+        samples, types = _parse_prometheus(metrics.render())
+        self.assertEqual(types, {"hits_total": "counter", "latency_seconds": "summary", "peak": "gauge"})
+        self.assertEqual(samples, {
+            ("hits_total", (("endpoint", "calculate"), ("status", "200"))): 3,
+            ("hits_total", (("endpoint", 'we\\"ird\\\\path'), ("status", "404"))): 1,
+            ("latency_seconds_count", (("endpoint", "calculate"),)): 2,
+            ("latency_seconds_sum", (("endpoint", "calculate"),)): 0.75,
+            ("peak", (("mode", "shortest"),)): 7,
+        })
+        self.assertIn("# HELP hits_total Hits.", metrics.render())
+
+    def test_render_metrics_adds_cache_counters(self):
+        with mock.patch.object(registry, "render", return_value=""):
+            text = render_metrics({"graph_cache": {"hits": 4, "entries": 2, "max_bytes": None}})
+        samples, types = _parse_prometheus(text)
+        self.assertEqual(types, {"routing_graph_cache_hits_total": "counter", "routing_graph_cache_entries": "gauge"})
+        self.assertEqual(samples, {("routing_graph_cache_hits_total", ()): 4, ("routing_graph_cache_entries", ()): 2})
+
+
+@override_settings(ROUTING_METRICS_ENABLED=True)
+class MetricsEndpointTests(_MapServerTestCase):
+    MAPS = {"grid": _grid_map(8, 8, seed=19, elevation=True)}
+
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        self.addCleanup(registry.reset)
+
+    def scrape(self):
+        response = self.client.get("/routing/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        return _parse_prometheus(response.content.decode())[0]
+
+    def test_requests_stages_and_searches_are_counted(self):
+        body = {"map_url": self.map_url("grid"), "source_id": 100, "target_id": 163}
+        misses = graph_cache.stats()["misses"]
+        for mode in ("shortest", "least_turn", "shortest"):
+            self.assertEqual(self.post("/routing/calculate/", {**body, "mode": mode}).status_code, 200)
+        self.post("/routing/calculate/", {**body, "mode": "fastest"})
+
+        samples = self.scrape()
+        calculate = ("endpoint", "calculate")
+        self.assertEqual(samples["routing_requests_total", (calculate, ("status", "200"))], 3)
+        self.assertEqual(samples["routing_requests_total", (calculate, ("status", "400"))], 1)
+        self.assertEqual(samples["routing_request_seconds_count", (calculate,)], 4)
+        # The second shortest route came from the route cache
+        self.assertEqual(samples["routing_searches_total", (("mode", "shortest"),)], 1)
+        self.assertEqual(samples["routing_searches_total", (("mode", "least_turn"),)], 1)
+        self.assertGreater(samples["routing_search_nodes_expanded_total", (("mode", "least_turn"),)], 0)
+        self.assertEqual(samples["routing_stage_seconds_count", (calculate, ("stage", "graph_load"))], 4 - 1)
+        # Cache counters aren't reset with the registry: they cover the whole process
+        self.assertEqual(samples["routing_graph_cache_misses_total", ()], misses + 1)
+
+    def test_streamed_requests_are_counted_once_consumed(self):
+        response = self.post("/routing/calculate/batch/", {"map_url": self.map_url("grid"), "pairs": [[100, 163]]})
+        self.assertNotIn(("routing_requests_total", (("endpoint", "batch"), ("status", "200"))), self.scrape())
+        b"".join(response.streaming_content)
+        samples = self.scrape()
+        self.assertEqual(samples["routing_requests_total", (("endpoint", "batch"), ("status", "200"))], 1)
+        self.assertEqual(samples["routing_searches_total", (("mode", "shortest"),)], 1)
+
+
+class DebugTimingsTests(_MapServerTestCase):
+    MAPS = {"grid": _grid_map(8, 8, seed=19, elevation=True)}
+
+    def test_debug_timings_block_and_server_timing_header(self):
+        for metrics_on in (False, True):
+            with self.subTest(metrics=metrics_on), override_settings(ROUTING_METRICS_ENABLED=metrics_on):
+                invalidate_graph(None)
+                response = self.post("/routing/calculate/", {"map_url": self.map_url("grid"), "source_id": 100,
+                                                             "target_id": 163, "mode": "energy_efficient",
+                                                             "debug_timings": True})
+                timings = response.json()["debug_timings"]
+                # The map isn't cached yet, so its loading stages show up inside graph_load
+                stages = ["fetch", "parse", "index", "graph_load", "snap", "search", "postprocess"]
+                self.assertEqual(list(timings["stages_ms"]), stages)
+                self.assertEqual(len(timings["searches"]), 1)
+                self.assertEqual(set(timings["searches"][0]),
+                                 {"mode", "nodes_expanded", "nodes_popped", "pushes", "heap_peak"})
+                self.assertGreater(timings["searches"][0]["nodes_expanded"], 0)
+                self.assertEqual([part.split(";")[0] for part in response["Server-Timing"].split(", ")],
+                                 stages + ["encode"])
+                self.assertTrue(all(re.fullmatch(r"\w+;dur=\d+\.\d{3}", part)
+                                    for part in response["Server-Timing"].split(", ")))
+
+        response = self.post("/routing/calculate/", {"map_url": self.map_url("grid"), "source_id": 100,
+                                                     "target_id": 162})
+        self.assertNotIn("debug_timings", response.json())
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    def test_timed_stream_keeps_the_request_timings(self):
+        timings = metrics.RequestTimings("batch", debug=True)
+
+        def chunks():
+            with metrics.stage("search"):
+                yield b"a"
+            yield repr(metrics.current_timings() is timings).encode()
+
+        with override_settings(ROUTING_METRICS_ENABLED=True), \
+                mock.patch("routing.utils.metrics._count_request") as count:
+            stream = metrics._timed_stream(chunks(), timings, "batch", time.perf_counter(), 200)
+            self.assertEqual(next(stream), b"a")
+            count.assert_not_called()
+            self.assertEqual(b"".join(stream), b"True")
+        self.assertIn("search", timings.stages)
+        self.assertIsNone(metrics.current_timings())
+        count.assert_called_once()
+        self.assertEqual(count.call_args.args[:2], ("batch", 200))
+
+
+class ContractionHierarchyStatsTests(SimpleTestCase):
+    def test_one_to_many_counts_every_query(self):
+        graph = build_graph_data(_grid_map(8, 8, seed=19))
+        with override_settings(ROUTING_CONTRACTION_HIERARCHIES=True, ROUTING_SIMPLIFY_CHAINS=False,
+                               ROUTING_ALT_LANDMARKS=0):
+            prepare_graph(graph)
+        graph.freeze()
+        shortest = routing_mode("shortest")
+        source, targets = 0, [9, 30, 63]
+
+        together = SearchStats()
+        shortest.one_to_many(graph, source, targets, stats=together)
+        separate = SearchStats()
+        for target in targets:
+            graph.contraction_hierarchy.query(source, target, stats=separate)
+        self.assertGreater(together.nodes_expanded, 0)
+        self.assertEqual(together.as_dict(), separate.as_dict())
+
+
+
+# --- RESPONSE ENCODING ---
+
+class ResponseEncodingTests(SimpleTestCase):
+    def test_encode_polyline_reference_vector(self):
+        # The worked example of Google's Encoded Polyline Algorithm Format documentation
+        self.assertEqual(encode_polyline([(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]),
+                         "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+        self.assertEqual(encode_polyline([]), "")
+        self.assertEqual(encode_polyline([(0.0, 0.0), (0.0, 0.0)]), "????")
+        self.assertEqual(encode_polyline([(38.5, -120.2)], precision=6), "_izlhA~rlgdF")
+
+    def test_dumps_backends_agree(self):
+        data = {"path": [[12.97, 77.59], [12.975, 77.595]], "cost": math.inf, "ele": [math.nan, -math.inf, 1.5],
+                "name": "Überweg", 3: (1, 2), "nested": {"ok": True, "none": None}}
+        outputs = {}
+        for backend in ("json", "orjson"):
+            with self.subTest(backend=backend), override_settings(ROUTING_JSON_BACKEND=backend):
+                outputs[backend] = dumps(data)
+                self.assertEqual(json.loads(outputs[backend]), {
+                    "path": [[12.97, 77.59], [12.975, 77.595]], "cost": None, "ele": [None, None, 1.5],
+                    "name": "Überweg", "3": [1, 2], "nested": {"ok": True, "none": None}})
+        self.assertEqual(outputs["json"], outputs["orjson"])
+        self.assertNotIn(b" ", outputs["json"])
+
+    def test_iter_json_streams_compact_chunks(self):
+        data = {"nodes": [{"id": i, "lat": 12.97 + i * 1e-5, "lon": 77.59} for i in range(500)], "edges": []}
+        with override_settings(ROUTING_JSON_BACKEND="json"):
+            whole = dumps(data)
+        chunks = list(iter_json(data, chunk_bytes=1024))
+        self.assertGreater(len(chunks), 5)
+        self.assertTrue(all(len(chunk) >= 1024 for chunk in chunks[:-1]))
+        self.assertTrue(all(len(chunk) < 2048 for chunk in chunks))
+        self.assertEqual(b"".join(chunks), whole)
+        self.assertEqual(list(iter_json([])), [b"[]"])
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    BODY = json.dumps([[12.97 + i * 1e-5, 77.59] for i in range(300)]).encode()
+
+    def respond(self, accept_encoding=None, response=None):
+        headers = {"HTTP_ACCEPT_ENCODING": accept_encoding} if accept_encoding is not None else {}
+        request = RequestFactory().get("/routing/calculate/", **headers)
+        response = response or JsonResponse(json.loads(self.BODY), safe=False)
+        return CompressionMiddleware(lambda request: response).process_response(request, response)
+
+    def test_gzip_negotiation(self):
+        for accept, coding in (("gzip, deflate", "gzip"), ("br;q=0, gzip;q=0.5", "gzip"),
+                               ("gzip;q=0", None), ("identity", None), ("", None)):
+            with self.subTest(accept=accept), mock.patch("routing.middleware.brotli", None):
+                response = self.respond(accept)
+                self.assertIn("Accept-Encoding", response["Vary"])
+                self.assertEqual(response.get("Content-Encoding"), coding)
+                body = gzip.decompress(response.content) if coding else response.content
+                self.assertEqual(json.loads(body), json.loads(self.BODY))
+                if coding:
+                    self.assertEqual(response["Content-Length"], str(len(response.content)))
+
+    def test_brotli_is_preferred_when_installed(self):
+        fake = mock.Mock()
+        fake.compress.side_effect = lambda data, quality: b"br" + data[:10]
+        with mock.patch("routing.middleware.brotli", fake):
+            self.assertEqual(self.respond("gzip, br")["Content-Encoding"], "br")
+            self.assertEqual(self.respond("gzip, br;q=0")["Content-Encoding"], "gzip")
+        with mock.patch("routing.middleware.brotli", None):
+            response = self.respond("br")
+            self.assertFalse(response.has_header("Content-Encoding"))
+            self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_small_and_binary_responses_are_left_alone(self):
+        small = self.respond("gzip", JsonResponse({"status": "Success"}))
+        self.assertFalse(small.has_header("Content-Encoding"))
+        self.assertFalse(small.has_header("Vary"))
+        binary = self.respond("gzip", HttpResponse(self.BODY, content_type="application/octet-stream"))
+        self.assertFalse(binary.has_header("Content-Encoding"))
+
+    def test_streamed_body_is_compressed_chunk_by_chunk(self):
+        lines = [json.dumps({"index": i, "path": [[12.97, 77.59]] * 20}).encode() + b"\n" for i in range(50)]
+        produced = []
+
+        def chunks():
+            for line in lines:
+                produced.append(line)
+                yield line
+
+        response = StreamingHttpResponse(chunks(), content_type="application/x-ndjson")
+        response["ETag"] = '"v1"'
+        with mock.patch("routing.middleware.brotli", None):
+            response = self.respond("gzip", response)
+        self.assertEqual((response["Content-Encoding"], response["ETag"]), ("gzip", 'W/"v1"'))
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertFalse(response.has_header("Content-Length"))
+        stream = iter(response.streaming_content)
+        first = next(stream)
+        self.assertLess(len(produced), len(lines))  # not buffered up front
+        self.assertEqual(gzip.decompress(first + b"".join(stream)), b"".join(lines))
+
+    @skipIf(brotli is None, "brotli isn't installed")
+    def test_streamed_body_with_brotli(self):
+        lines = [json.dumps({"index": i}).encode() + b"\n" for i in range(50)]
+        response = self.respond("br, gzip", StreamingHttpResponse(iter(lines), content_type="application/x-ndjson"))
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(b"".join(response.streaming_content)), b"".join(lines))
+
+# --- ROUTE CACHE ---
+
+def _route(*node_ids):
+    return {"path_node_ids": list(node_ids), "path_coords": [(float(i), 0.0) for i in node_ids], "total_cost": 1.0}
+
+
+class RouteCacheTests(SimpleTestCase):
+    def test_graph_version_is_part_of_the_key(self):
+        cache = RouteCache()
+        cache.put("map", 1, "shortest", 1, 2, _route(1, 2))
+        self.assertIsNotNone(cache.get("map", 1, "shortest", 1, 2))
+        self.assertIsNone(cache.get("map", 2, "shortest", 1, 2))
+        self.assertIsNone(cache.get("map", 1, "least_turn", 1, 2))
+
+    def test_entries_expire_after_ttl(self):
+        cache = RouteCache(ttl_seconds=10)
+        with mock.patch("routing.utils.route_cache.time.monotonic", return_value=100.0):
+            cache.put("map", 1, "shortest", 1, 2, _route(1, 2))
+        with mock.patch("routing.utils.route_cache.time.monotonic", return_value=109.0):
+            self.assertIsNotNone(cache.get("map", 1, "shortest", 1, 2))
+        with mock.patch("routing.utils.route_cache.time.monotonic", return_value=111.0):
+            self.assertIsNone(cache.get("map", 1, "shortest", 1, 2))
+        self.assertEqual(cache.stats()["expirations"], 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_reverse_pair_hits_only_for_symmetric_modes(self):
+        cache = RouteCache()
+        cache.put("map", 1, "shortest", 1, 3, _route(1, 2, 3))
+        reverse = cache.get("map", 1, "shortest", 3, 1, symmetric=True)
+        self.assertEqual(reverse["path_node_ids"], [3, 2, 1])
+        self.assertEqual(reverse["path_coords"], [(3.0, 0.0), (2.0, 0.0), (1.0, 0.0)])
+        self.assertEqual(cache.stats()["reverse_hits"], 1)
+        self.assertIsNone(cache.get("map", 1, "shortest", 3, 1, symmetric=False))
+        # The stored route itself is untouched
+        self.assertEqual(cache.get("map", 1, "shortest", 1, 3)["path_node_ids"], [1, 2, 3])
+
+    def test_invalidate_drops_one_map(self):
+        cache = RouteCache()
+        cache.put("a", 1, "shortest", 1, 2, _route(1, 2))
+        cache.put("b", 1, "shortest", 1, 2, _route(1, 2))
+        self.assertEqual(cache.invalidate("a"), 1)
+        self.assertIsNone(cache.get("a", 1, "shortest", 1, 2))
+        self.assertIsNotNone(cache.get("b", 1, "shortest", 1, 2))
+
+    def test_evicts_least_recently_used(self):
+        cache = RouteCache(max_entries=2)
+        cache.put("map", 1, "shortest", 1, 2, _route(1, 2))
+        cache.put("map", 1, "shortest", 2, 3, _route(2, 3))
+        cache.get("map", 1, "shortest", 1, 2)
+        cache.put("map", 1, "shortest", 3, 4, _route(3, 4))
+        self.assertIsNotNone(cache.get("map", 1, "shortest", 1, 2))
+        self.assertIsNone(cache.get("map", 1, "shortest", 2, 3))
+
+
+
+# --- GRAPH LAYOUT ---
+
+class GraphLayoutTests(SimpleTestCase):
+    """build_graph_data's compressed-sparse-row arrays against the payload they came from."""
+
+    def test_small_map(self):
+        graph = build_graph_data({
+            "nodes": [{"id": 7, "lat": 12.97, "lon": 77.59}, {"id": 3, "lat": 0.0, "lon": 0.0},
+                      {"id": 42, "lat": 12.971, "lon": 77.59, "ele": 905}, {"id": 9, "lat": 12.972, "lon": 77.59},
+                      {"id": 3, "lat": 12.97, "lon": 77.591}],
+            "edges": [{"u": 7, "v": 3, "weight": 10.0}, {"u": 3, "v": 42, "weight": 5.0}, {"u": 7, "v": 42},
+                      {"u": 7, "v": 1000, "weight": 1.0}],
+        })
+        self.assertEqual(list(graph.node_ids), [7, 3, 42, 9])
+        self.assertEqual(graph.index_of, {7: 0, 3: 1, 42: 2, 9: 3})
+        # A repeated id keeps its index but takes the later coordinates
+        self.assertEqual(graph.node_coords[3], (12.97, 77.591))
+        self.assertEqual(dict(graph.node_coords), {7: (12.97, 77.59), 3: (12.97, 77.591), 42: (12.971, 77.59),
+                                                   9: (12.972, 77.59)})
+        self.assertEqual(list(graph.offsets), [0, 2, 4, 6, 6])
+        self.assertEqual((graph.node_count, graph.edge_count), (4, 6))
+
+        def edges(node_id):
+            return [(graph.node_ids[graph.targets[slot]], graph.weights[slot])
+                    for slot in graph.neighbors(graph.index_of[node_id])]
+
+        # Slots keep the input edge order; a missing weight is the haversine length; unknown ends are dropped
+        (to_3, weight_3), (to_42, weight_42) = edges(7)
+        self.assertEqual((to_3, weight_3, to_42), (3, 10.0, 42))
+        self.assertAlmostEqual(weight_42, haversine_distance(12.97, 77.59, 12.971, 77.59), places=6)
+        self.assertEqual(edges(3), [(7, 10.0), (42, 5.0)])
+        self.assertEqual(edges(9), [])
+        self.assertTrue(math.isnan(graph.elevation[0]))
+        self.assertEqual(graph.elevation[2], 905)
+
+    def test_twins_pair_up_both_directions_of_every_edge(self):
+        data = _grid_map(12, 12, seed=23)
+        graph = build_graph_data(data)
+        self.assertEqual(graph.edge_count, 2 * len(data["edges"]))
+        offsets, targets, weights, twins = graph.offsets, graph.targets, graph.weights, graph.twins
+        self.assertEqual(len(offsets), graph.node_count + 1)
+        self.assertTrue(all(a <= b for a, b in zip(offsets, offsets[1:])))
+        source = {slot: u for u in range(graph.node_count) for slot in graph.neighbors(u)}
+        for slot in range(graph.edge_count):
+            twin = twins[slot]
+            self.assertNotEqual(twin, slot)
+            self.assertEqual(twins[twin], slot)
+            self.assertEqual((targets[twin], source[twin]), (source[slot], targets[slot]))
+            self.assertEqual(weights[twin], weights[slot])
+        self.assertEqual(sorted((graph.node_ids[source[s]], graph.node_ids[targets[s]], weights[s])
+                                for s in range(graph.edge_count) if source[s] < targets[s]),
+                         sorted((min(e["u"], e["v"]), max(e["u"], e["v"]), e["weight"]) for e in data["edges"]))
+
+    def test_frozen_graphs_are_read_only(self):
+        graph = build_graph_data(_grid_map(3, 3)).freeze()
+        self.assertTrue(graph.frozen)
+        with self.assertRaises(TypeError):
+            graph.targets[0] = 1
+        with self.assertRaises(TypeError):
+            graph.weights[0] = 0.0
+        with self.assertRaises(AttributeError):
+            graph.weights = array("d")
+        graph._spatial_index = None  # per-graph caches stay writable
+
+    def test_far_smaller_than_adjacency_dicts(self):
+        data = _grid_map(40, 40, seed=3)
+        graph = build_graph_data(data)
+        adjacency = {node["id"]: [] for node in data["nodes"]}
+        for edge in data["edges"]:
+            adjacency[edge["u"]].append((edge["v"], edge["weight"]))
+            adjacency[edge["v"]].append((edge["u"], edge["weight"]))
+        dict_bytes = sys.getsizeof(adjacency) + sum(
+            sys.getsizeof(neighbors) + sum(sys.getsizeof(pair) + sys.getsizeof(pair[1]) for pair in neighbors)
+            for neighbors in adjacency.values())
+        csr_bytes = sum(len(values) * values.itemsize for values in (graph.offsets, graph.targets, graph.weights,
+                                                                     graph.twins))
+        self.assertLess(csr_bytes * 3, dict_bytes)
+
+
+# --- BINARY GRAPH FORMAT ---
+
+def _older_format(blob: bytes, version: int, n: int, m: int) -> bytes:
+    """blob (current version 3) as an older version: without elevation (v2), and headings (v1)."""
+    dropped = 8 * n + (8 * m if version == 1 else 0)
+    older = bytearray(blob[:len(blob) - dropped])
+    struct.pack_into("<I", older, 8, version)
+    return bytes(older)
+
+
+class GraphFormatTests(SimpleTestCase):
+    FIELDS = ("node_ids", "lat", "lon", "lat_rad", "lon_rad", "cos_lat", "offsets", "targets", "weights", "twins",
+              "headings")
+
+    def setUp(self):
+        self.graph = build_graph_data(_grid_map(6, 7, elevation=True))
+        self.blob = encode_graph(self.graph)
+
+    def assertSameGraph(self, loaded: GraphData, elevation: bool = True):
+        for name in self.FIELDS:
+            self.assertEqual(list(getattr(loaded, name)), list(getattr(self.graph, name)), name)
+        self.assertEqual(loaded.has_elevation, elevation)
+        if elevation:
+            self.assertEqual(list(loaded.elevation), list(self.graph.elevation))
+            self.assertEqual(list(loaded.energy_weights), list(self.graph.energy_weights))
+
+    def test_round_trip(self):
+        self.assertSameGraph(GraphData(**read_graph_arrays(self.blob)))
+
+    def test_round_trip_through_a_mapped_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "map.wpg")
+            write_graph_file(self.blob, path)
+            self.assertSameGraph(GraphData(**map_graph_file(path)))
+
+    def test_reads_older_versions(self):
+        n, m = self.graph.node_count, self.graph.edge_count
+        for version in (1, 2):
+            with self.subTest(version=version):
+                # v1 files have no headings: GraphData computes the same ones
+                self.assertSameGraph(GraphData(**read_graph_arrays(_older_format(self.blob, version, n, m))),
+                                     elevation=False)
+
+    def test_rejects_malformed_files(self):
+        for blob in (self.blob[:HEADER_SIZE - 1], b"NOTAGRAPH" + self.blob[9:], self.blob[:-8]):
+            with self.assertRaises(ValueError):
+                read_graph_arrays(blob)
+        future = bytearray(self.blob)
+        struct.pack_into("<I", future, 8, 99)
+        with self.assertRaises(ValueError):
+            read_graph_arrays(bytes(future))
+
+
+# --- GPX PARSING ---
+
+GPX = b"""<?xml version="1.0"?>
+<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1"><trk>
+<trkseg><trkpt lat="12.97" lon="77.59"><ele>910</ele></trkpt><trkpt lat="12.971" lon="77.59"/></trkseg>
+<trkseg><trkpt lat="12.972" lon="77.591"><ele>912.5</ele></trkpt></trkseg>
+</trk></gpx>"""
+
+
+class GpxParserTests(SimpleTestCase):
+    def test_namespaces_and_skipped_elements(self):
+        for namespace in ('', ' xmlns="http://www.topografix.com/GPX/1/0"', ' xmlns="http://www.topografix.com/GPX/1/1"'):
+            document = f"""<gpx{namespace}><wpt lat="1" lon="1"><ele>5</ele></wpt>
+                <rte><rtept lat="2" lon="2"/></rte>
+                <trk><trkseg></trkseg><trkseg><trkpt lat="12.97" lon="77.59"><ele> </ele></trkpt>
+                <trkpt lat="12.971" lon="77.592"><time>2026-10-05T10:00:00Z</time><ele>7.5</ele></trkpt>
+                </trkseg></trk></gpx>""".encode()
+            with self.subTest(namespace=namespace):
+                self.assertEqual(list(iter_gpx_segments(document)),
+                                 [[(12.97, 77.59, None), (12.971, 77.592, 7.5)]])
+                self.assertEqual(list(iter_gpx_segments(io.BytesIO(document))),
+                                 list(iter_gpx_segments(document)))
+
+    def test_malformed_xml(self):
+        for document in (b"", b"<gpx><trk><trkseg><trkpt lat='1' lon='2'></trkseg></trk></gpx>",
+                         b"<gpx><trk><trkseg><trkpt lat='1' lon='2'/>", b"not xml at all"):
+            with self.subTest(document=document), self.assertRaises(ET.ParseError):
+                list(iter_gpx_segments(document))
+
+        # Segments before the error have already been handed out
+        segments = iter_gpx_segments(b"<gpx><trk><trkseg><trkpt lat='1' lon='2'/></trkseg>"
+                                     b"<trkseg><trkpt lat='3' lon='4'></trkseg></trk></gpx>")
+        self.assertEqual(next(segments), [(1.0, 2.0, None)])
+        with self.assertRaises(ET.ParseError):
+            next(segments)
+
+    def test_finished_trackpoints_are_dropped_from_the_tree(self):
+        points = "".join(f'<trkpt lat="{i}" lon="0"/>' for i in range(20_000))
+        document = f"<gpx><trk><trkseg>{points}</trkseg></trk></gpx>".encode()
+        sizes = []
+        real_iterparse = ET.iterparse
+
+        def watched(source, events):
+            for event, elem in real_iterparse(source, events):
+                if event == "start" and elem.tag == "trkseg":
+                    segment = elem
+                if event == "end" and elem.tag == "trkpt":
+                    sizes.append(len(segment))
+                yield event, elem
+
+        with mock.patch("routing.utils.gpx_parser.ET.iterparse", watched):
+            self.assertEqual(len(next(iter_gpx_segments(document))), 20_000)
+        # What stays attached is the points iterparse has read ahead (one buffer), not the segment so far
+        self.assertLess(max(sizes), 2_000)
+
+
+class GpxFromUrlTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _ScriptedHandler)
+        cls.server.daemon_threads = True
+        cls.server.failures, cls.server.seen, cls.server.delay = [], [], 0.0
+        cls.server.documents = {
+            "/track.gpx": (GPX, {}),
+            "/track.gpx.gz": (gzip.compress(GPX), {"Content-Encoding": "gzip"}),
+            "/broken.gpx": (GPX[:-40], {}),
+        }
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+    def test_streams_and_parses_the_remote_file(self):
+        self.assertEqual(parse_gpx_from_url(self.url("/track.gpx")),
+                         [(12.97, 77.59, 910.0), (12.971, 77.59, 0.0), (12.972, 77.591, 912.5)])
+
+    def test_gzip_content_encoding_is_decoded(self):
+        self.assertEqual(parse_gpx_from_url(self.url("/track.gpx.gz")), parse_gpx_from_url(self.url("/track.gpx")))
+
+    def test_errors(self):
+        with self.assertRaises(ET.ParseError):
+            parse_gpx_from_url(self.url("/broken.gpx"))
+        with self.assertRaises(requests.HTTPError):
+            parse_gpx_from_url(self.url("/missing.gpx"))
+
+
+class GraphBuilderTests(SimpleTestCase):
+    def test_rejects_snap_tolerances_of_zero_or_less(self):
+        segments = [[(12.97, 77.59, None), (12.971, 77.59, None)]]
+        for tolerance in (0.0, -1.0, math.nan):
+            with self.subTest(tolerance=tolerance), self.assertRaises(ValueError):
+                build_graph(segments, snap_tolerance_m=tolerance)
+        self.assertEqual(len(build_graph(segments, snap_tolerance_m=3.0)["nodes"]), 2)
+
+
+# --- BENCHMARK GENERATORS ---
+
+def _degrees(data):
+    degrees = {node["id"]: 0 for node in data["nodes"]}
+    for edge in data["edges"]:
+        degrees[edge["u"]] += 1
+        degrees[edge["v"]] += 1
+    return degrees
+
+
+class BenchmarkGeneratorTests(SimpleTestCase):
+    def assert_haversine_weights(self, data, detour=1.0):
+        coords = {node["id"]: (node["lat"], node["lon"]) for node in data["nodes"]}
+        for edge in data["edges"]:
+            length = haversine_distance(*coords[edge["u"]], *coords[edge["v"]])
+            self.assertGreaterEqual(edge["weight"], length - 1e-6)
+            self.assertLessEqual(edge["weight"], length * detour + 1e-6)
+
+    def test_grid_graph(self):
+        data = generators.grid_graph(12, 9, seed=4, detour=1.3)
+        self.assertEqual([node["id"] for node in data["nodes"]], list(range(12 * 9)))
+        for edge in data["edges"]:
+            self.assertIn(edge["v"] - edge["u"], (1, 9))
+            if edge["v"] - edge["u"] == 1:
+                self.assertNotEqual(edge["u"] % 9, 8)  # no wrap-around between rows
+        # keep_edge_prob 0.9 of the 12 * 8 + 11 * 9 grid edges, give or take
+        self.assertGreater(len(data["edges"]), 0.75 * 195)
+        self.assertLess(len(data["edges"]), 195)
+        self.assert_haversine_weights(data, detour=1.3)
+
+        self.assertEqual(generators.grid_graph(12, 9, seed=4), data)
+        self.assertNotEqual(generators.grid_graph(12, 9, seed=5), data)
+        self.assertEqual(len(generators.grid_graph(5, 5, keep_edge_prob=1.0)["edges"]), 40)
+
+    def test_trail_network(self):
+        data = generators.trail_network(6, 6, points_per_edge=8, seed=2)
+        self.assertEqual([node["id"] for node in data["nodes"]], list(range(len(data["nodes"]))))
+        trails = len(data["edges"]) // 8
+        self.assertEqual(len(data["edges"]), 8 * trails)
+        self.assertEqual(len(data["nodes"]), 36 + 7 * trails)
+        degrees = _degrees(data)
+        # Every trackpoint between junctions has degree 2
+        self.assertTrue(all(degrees[node_id] == 2 for node_id in range(36, len(data["nodes"]))))
+        self.assertGreater(sum(degree == 2 for degree in degrees.values()), 0.9 * len(degrees))
+        self.assert_haversine_weights(data)
+        self.assertEqual(generators.trail_network(6, 6, points_per_edge=8, seed=2), data)
+
+    def test_random_geometric_graph(self):
+        data = generators.random_geometric_graph(400, neighbors=4, seed=1)
+        self.assertEqual([node["id"] for node in data["nodes"]], list(range(400)))
+        pairs = [(edge["u"], edge["v"]) for edge in data["edges"]]
+        self.assertTrue(all(u < v for u, v in pairs))
+        self.assertEqual(len(set(pairs)), len(pairs))
+        self.assertGreaterEqual(min(_degrees(data).values()), 4)
+        self.assertGreater(len(set(_degrees(data).values())), 2)  # unlike a grid, degrees vary
+        self.assert_haversine_weights(data)
+        self.assertEqual(generators.random_geometric_graph(400, neighbors=4, seed=1), data)
+
+    def test_trail_gpx_rebuilds_the_trail_network(self):
+        network = generators.trail_network(4, 4, points_per_edge=10, seed=3)
+        document = generators.trail_gpx(4, 4, points_per_edge=10, passes=2, noise_m=1.0, seed=3)
+        segments = list(iter_gpx_segments(document))
+        trails = len(network["edges"]) // 10
+        self.assertEqual(len(segments), 2 * trails)
+        self.assertTrue(all(len(segment) == 11 for segment in segments))
+
+        # Each pass is the same trail, within the GPS noise of every recorded point
+        coords = [(node["lat"], node["lon"]) for node in network["nodes"]]
+        for edge_index, segment in zip(range(0, len(network["edges"]), 10), segments[::2]):
+            edges = network["edges"][edge_index:edge_index + 10]
+            trail = [edges[0]["u"]] + [edge["v"] for edge in edges]
+            for point, (lat, lon, ele) in zip(trail, segment):
+                self.assertLessEqual(haversine_distance(*coords[point], lat, lon), 1.5)
+                self.assertEqual(ele, 900.0)
+
+        # Repeated passes snap together, giving back about the trail network
+        graph = build_graph(segments)
+        self.assertAlmostEqual(len(graph["nodes"]), len(network["nodes"]), delta=0.05 * len(network["nodes"]))
+        self.assertAlmostEqual(len(graph["edges"]), len(network["edges"]), delta=0.05 * len(network["edges"]))
+
+    def test_suite_map_sizes(self):
+        for kind in suite.GRAPH_KINDS:
+            with self.subTest(kind=kind):
+                nodes = len(suite.generate(kind, 2_000, seed=0)["nodes"])
+                self.assertGreater(nodes, 1_500)
+                self.assertLess(nodes, 2_500)
+        with self.assertRaises(ValueError):
+            suite.generate("hexagonal", 100, seed=0)
+
+    def test_compare_flags_regressions_beyond_the_tolerance(self):
+        baseline = {"config": {}, "queries": 10, "results": {
+            "route/grid/shortest": {"ms_p50": 1.0, "queries_per_s": 1000.0, "nodes_expanded": 0},
+        }}
+        report = {"config": {}, "queries": 10, "results": {
+            "route/grid/shortest": {"ms_p50": 1.2, "queries_per_s": 700.0, "nodes_expanded": 50.0},
+            "route/grid/energy_efficient": {"ms_p50": 9.0},
+        }}
+        lines = []
+        regressions = suite.compare(report, baseline, 0.25, lines.append)
+        self.assertEqual(regressions, ["route/grid/shortest queries_per_s: 1000 -> 700 (-30.0%)"])
+        self.assertTrue(any("(not in baseline)" in line for line in lines))
+        self.assertEqual(suite.compare(report, baseline, 0.35, lines.append), [])
+
+        report["results"]["route/grid/shortest"]["ms_p50"] = 1.5
+        self.assertEqual(len(suite.compare(report, baseline, 0.35, lines.append)), 1)
+
+    def test_command_rejects_unknown_kinds_and_missing_baselines(self):
+        with self.assertRaisesMessage(CommandError, "Unknown graph kind: hexagonal"):
+            call_command("routing_benchmark", kinds="grid,hexagonal", stdout=io.StringIO())
+        with mock.patch.object(suite, "run_suite", return_value={"results": {}}), \
+                self.assertRaisesMessage(CommandError, "No baseline at /nonexistent/baseline.json"):
+            call_command("routing_benchmark", baseline="/nonexistent/baseline.json", stdout=io.StringIO())
+
+
+# --- UPLOAD PIPELINE ---
+
+def _wait_for_job(jobs: UploadJobs, job_id: str):
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Upload job {job_id} didn't finish")
+
+
+class _BrokenPool(ThreadPoolExecutor):
+    """A process pool whose worker died: every submitted conversion fails."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_exception(BrokenProcessPool("worker died"))
+        return future
+
+
+class _FailingStorage(LocalStorage):
+    def save(self, fileobj, key):
+        raise OSError("storage is down")
+
+
+@override_settings(ROUTING_UPLOAD_PROCESS_WORKERS=0)
+class UploadPipelineTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = LocalStorage(directory.name, "/routing/storage/")
+        # Conversions run in a thread pool of their own, created under the settings above
+        patcher = mock.patch.object(upload_pipeline, "_cpu_pool", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_broken_converter_pool_is_a_retryable_server_error(self):
+        path, digest = spool_upload(io.BytesIO(GPX))
+        with mock.patch.object(upload_pipeline, "_cpu_executor", return_value=_BrokenPool(max_workers=1)):
+            with self.assertRaises(RetryableUploadError):
+                process_gpx_upload(path, digest, self.storage)
+
+            jobs = UploadJobs()
+            path, digest = spool_upload(io.BytesIO(GPX))
+            job = _wait_for_job(jobs, jobs.start(path, digest, "track.gpx", self.storage))
+        self.assertEqual(job["status"], "failed")
+        self.assertTrue(job["retryable"])
+
+    def test_stores_content_addressed_artifacts(self):
+        path, digest = spool_upload(io.BytesIO(GPX))
+        result = process_gpx_upload(path, digest, self.storage)
+        self.assertFalse(result["deduplicated"])
+        self.assertEqual(result["content_hash"], digest)
+        for key in ("cloudinary_gpx_url", "cloudinary_json_url", "cloudinary_graph_bin_url"):
+            self.assertIn(digest, result[key])
+            self.assertIsNotNone(self.storage.local_path(result[key]), key)
+        with open(self.storage.local_path(result["cloudinary_json_url"])) as f:
+            self.assertEqual(len(json.load(f)["nodes"]), 3)
+
+    def test_reupload_is_deduplicated_without_converting(self):
+        path, digest = spool_upload(io.BytesIO(GPX))
+        first = process_gpx_upload(path, digest, self.storage)
+        path, digest = spool_upload(io.BytesIO(GPX))
+        with mock.patch.object(upload_pipeline, "convert_gpx_file") as convert:
+            second = process_gpx_upload(path, digest, self.storage)
+        convert.assert_not_called()
+        self.assertTrue(second["deduplicated"])
+        self.assertEqual(second["cloudinary_json_url"], first["cloudinary_json_url"])
+        self.assertEqual(second["cloudinary_graph_bin_url"], first["cloudinary_graph_bin_url"])
+
+    def test_concurrent_identical_uploads_share_one_build(self):
+        release = threading.Event()
+        convert = upload_pipeline.convert_gpx_file
+        calls = []
+
+        def slow_convert(*args):
+            calls.append(args)
+            release.wait(5)
+            return convert(*args)
+
+        uploads = [spool_upload(io.BytesIO(GPX)) for _ in range(3)]
+        with mock.patch.object(upload_pipeline, "convert_gpx_file", slow_convert), \
+                ThreadPoolExecutor(max_workers=3) as pool:
+            futures = [pool.submit(process_gpx_upload, path, digest, self.storage) for path, digest in uploads]
+            while not calls:
+                time.sleep(0.001)
+            time.sleep(0.05)  # let the other two join the build in flight
+            release.set()
+            results = [future.result(10) for future in futures]
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len({result["cloudinary_json_url"] for result in results}), 1)
+        self.assertEqual(sorted(result["deduplicated"] for result in results), [False, True, True])
+        # The leader's spooled file goes once its last reader finishes, just after the results are set
+        deadline = time.monotonic() + 5
+        while any(os.path.exists(path) for path, _ in uploads) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(any(os.path.exists(path) for path, _ in uploads))
+
+    def test_invalid_gpx_fails_the_job(self):
+        jobs = UploadJobs()
+        path, digest = spool_upload(io.BytesIO(b"<gpx><trk></trk></gpx>"))
+        job = _wait_for_job(jobs, jobs.start(path, digest, "empty.gpx", self.storage))
+        self.assertEqual(job["status"], "failed")
+        self.assertIn("no valid track", job["error"])
+        self.assertIsNone(self.storage.url_if_exists(upload_pipeline.artifact_keys(digest, 3.0)["json"]))
+
+    def test_storage_failure_fails_the_job(self):
+        storage = _FailingStorage(self.storage.directory, self.storage.base_url)
+        path, digest = spool_upload(io.BytesIO(GPX))
+        with self.assertRaises(UploadError):
+            process_gpx_upload(path, digest, storage)
+
+        jobs = UploadJobs()
+        path, digest = spool_upload(io.BytesIO(GPX))
+        job = _wait_for_job(jobs, jobs.start(path, digest, "track.gpx", storage))
+        self.assertEqual(job["status"], "failed")
+        self.assertFalse(job["retryable"])
+        self.assertIn("Failed to upload", job["error"])
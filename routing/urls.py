@@ -1,9 +1,16 @@
 from django.urls import path
-from .views import calculate_routes, upload_gpx
+from .views import calculate_routes, calculate_routes_batch, upload_gpx, invalidate_graph_cache, cache_stats, nearest_nodes_view, upload_job_status, storage_file, metrics_view
 
 urlpatterns = [
     path('calculate/', calculate_routes, name='calculate_routes'),
+    path('calculate/batch/', calculate_routes_batch, name='calculate_routes_batch'),
+    path('nearest/', nearest_nodes_view, name='nearest_nodes'),
     path('upload_gpx/', upload_gpx, name='upload_gpx'),
+    path('upload_gpx/jobs/<str:job_id>/', upload_job_status, name='upload_job_status'),
+    path('storage/<path:key>', storage_file, name='storage_file'),
+    path('cache/invalidate/', invalidate_graph_cache, name='invalidate_graph_cache'),
+    path('cache/stats/', cache_stats, name='cache_stats'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
 
 
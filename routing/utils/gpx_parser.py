@@ -1,27 +1,80 @@
 import xml.etree.ElementTree as ET
-import requests
 from io import BytesIO
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
 
-def parse_gpx_from_url(gpx_url):
-    response = requests.get(gpx_url, timeout=15)
-    response.raise_for_status()
+from .http_session import http_get
 
-    tree = ET.parse(BytesIO(response.content))
-    root = tree.getroot()
+# (lat, lon, elevation in meters or None when the trackpoint has no <ele>)
+TrackPoint = Tuple[float, float, Optional[float]]
 
-    namespace = {'default': 'http://www.topografix.com/GPX/1/1'}
-    points = []
 
-    for trk in root.findall('default:trk', namespace):
-        for trkseg in trk.findall('default:trkseg', namespace):
-            for trkpt in trkseg.findall('default:trkpt', namespace):
-                lat = float(trkpt.get('lat'))
-                lon = float(trkpt.get('lon'))
+def iter_gpx_segments(source: Union[bytes, BinaryIO]) -> Iterator[List[TrackPoint]]:
+    """
+    Yields the track segments of a GPX document one at a time.
 
-                ele_tag = trkpt.find('default:ele', namespace)
-                ele = float(ele_tag.text) if ele_tag is not None else 0.0
+    source is the raw bytes or a binary file object. The document is read
+    with iterparse and every trackpoint is dropped from the tree as soon as it
+    has been read, so memory stays proportional to the largest segment rather
+    than the file. Tags are matched by local name, so both GPX 1.0 and 1.1
+    namespaces work. Empty segments are skipped. Raises ET.ParseError on
+    malformed XML (possibly after some segments were already yielded).
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
 
-                points.append((lat, lon, ele))
+    local_names = {}
+    segment_elem = None
+    segment: List[TrackPoint] = []
+    lat = lon = ele = None
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        tag = elem.tag
+        name = local_names.get(tag)
+        if name is None:
+            name = local_names[tag] = tag.rpartition('}')[2]
+
+        if event == "start":
+            if name == "trkpt":
+                lat, lon, ele = elem.get('lat'), elem.get('lon'), None
+            elif name == "trkseg":
+                segment_elem = elem
+                segment = []
+            continue
+
+        if name == "ele" and lat is not None:
+            text = elem.text
+            ele = float(text) if text and text.strip() else None
+        elif name == "trkpt":
+            if lat is not None and lon is not None:
+                segment.append((float(lat), float(lon), ele))
+            lat = lon = None
+            # Drop every finished child (this point included) from the segment
+            if segment_elem is not None:
+                del segment_elem[:]
+        elif name == "trkseg":
+            if segment:
+                yield segment
+            segment = []
+            segment_elem = None
+            elem.clear()
+        elif name in ("trk", "rte", "wpt"):
+            elem.clear()
 
-    return points
 
+def parse_gpx_from_url(gpx_url):
+    """
+    The trackpoints of the GPX file at gpx_url as (lat, lon, ele) tuples, ele
+    0.0 where missing. The body is parsed as it streams in rather than read
+    into memory first.
+    """
+    with http_get(gpx_url, stream=True) as response:
+        response.raise_for_status()
+        # Undo any Content-Encoding (gzip) while reading the raw stream
+        response.raw.decode_content = True
+
+        points = []
+        for segment in iter_gpx_segments(response.raw):
+            for lat, lon, ele in segment:
+                points.append((lat, lon, ele if ele is not None else 0.0))
+
+    return points
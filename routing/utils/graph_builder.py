@@ -1,9 +1,142 @@
-def build_graph(points):
-    points = points[0]
-    graph = {}
+import math
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
-    for i in range(len(points) - 1):
-        graph.setdefault(i, []).append(i + 1)
-        graph.setdefault(i + 1, []).append(i)
+import numpy as np
 
-    return graph
+# Trackpoints closer than this (in meters) become one shared node
+DEFAULT_SNAP_TOLERANCE_METERS = 3.0
+
+METERS_PER_DEGREE = 111_320.0
+
+
+class _NodeGrid:
+    """
+    Spatial hash of graph nodes on a local equirectangular projection (meters).
+
+    Cells are twice the snap tolerance wide, so every node within tolerance of
+    a point lies in the point's cell or in the three cells of the quadrant the
+    point sits in: at most four dict lookups per point.
+    """
+
+    def __init__(self, tolerance_m: float, ref_lat: float):
+        if not tolerance_m > 0:  # NaN included
+            raise ValueError(f"Snap tolerance must be above 0 meters "
+                             f"(ROUTING_GPX_SNAP_TOLERANCE_METERS), got {tolerance_m}")
+        self.tolerance_sq = tolerance_m * tolerance_m
+        self.cell_size = 2.0 * tolerance_m
+        self.x_scale = METERS_PER_DEGREE * math.cos(math.radians(ref_lat))
+        self.cells: Dict[int, List[int]] = {}
+        self.x: List[float] = []
+        self.y: List[float] = []
+
+    def snap_segment(self, lat: np.ndarray, lon: np.ndarray) -> Tuple[List[int], List[int]]:
+        """
+        Snaps each point of a segment to the closest node within tolerance (earlier
+        points of the same segment included), creating nodes where there is none.
+        Returns (node index per point, indices of the points that created a node);
+        new nodes are numbered consecutively in that order.
+        """
+        x = lon * self.x_scale
+        y = lat * METERS_PER_DEGREE
+        fx, fy = x / self.cell_size, y / self.cell_size
+        cx, cy = np.floor(fx), np.floor(fy)
+        dx = np.where(fx - cx < 0.5, -1, 1)
+        dy = np.where(fy - cy < 0.5, -1, 1)
+        # Cells keyed by one int (cx * 2^32 + cy) rather than a tuple: cheaper to hash
+        cx, cy = cx.astype(np.int64) << 32, cy.astype(np.int64)
+        own = (cx + cy).tolist()
+        side_x = (cx + (dx.astype(np.int64) << 32) + cy).tolist()
+        side_y = (cx + cy + dy).tolist()
+        corner = (cx + (dx.astype(np.int64) << 32) + cy + dy).tolist()
+        xs_new, ys_new = x.tolist(), y.tolist()
+
+        cells, xs, ys, tolerance_sq = self.cells, self.x, self.y, self.tolerance_sq
+        get = cells.get
+        snapped, created = [], []
+        for i in range(len(own)):
+            px, py = xs_new[i], ys_new[i]
+            best, best_d = -1, tolerance_sq
+            for key in (own[i], side_x[i], side_y[i], corner[i]):
+                members = get(key)
+                if members is None:
+                    continue
+                for node in members:
+                    ex, ey = xs[node] - px, ys[node] - py
+                    d = ex * ex + ey * ey
+                    if d <= best_d:
+                        best, best_d = node, d
+            if best == -1:
+                best = len(xs)
+                xs.append(px)
+                ys.append(py)
+                members = get(own[i])
+                if members is None:
+                    cells[own[i]] = [best]
+                else:
+                    members.append(best)
+                created.append(i)
+            snapped.append(best)
+        return snapped, created
+
+
+def build_graph(segments: Iterable[Sequence[Tuple[float, ...]]],
+                snap_tolerance_m: float = DEFAULT_SNAP_TOLERANCE_METERS) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Builds a routable {'nodes': [...], 'edges': [...]} map from GPX track segments.
+
+    segments is any iterable of point lists, (lat, lon) or (lat, lon, ele), such
+    as the parse_gpx_content() generator; it is consumed one segment at a time.
+    Every segment is used. Points within snap_tolerance_m of an existing node
+    (from any segment) are merged into it, which joins tracks where they meet
+    or overlap. A node keeps the coordinates and elevation of its first point.
+    Consecutive points become undirected edges; self-loops and duplicates are
+    dropped. Edge weights are haversine lengths, computed in one vectorized
+    pass at the end.
+    """
+    # Imported here because routingUtil pulls in Django settings and the graph caches
+    from .routingUtil import haversine_distance_batch
+
+    grid: Optional[_NodeGrid] = None
+    lat_parts: List[np.ndarray] = []
+    lon_parts: List[np.ndarray] = []
+    ele: List[Optional[float]] = []
+    edge_parts: List[np.ndarray] = []
+
+    for segment in segments:
+        if not segment:
+            continue
+        points = np.asarray([(p[0], p[1]) for p in segment], dtype=np.float64)
+        if grid is None:
+            grid = _NodeGrid(snap_tolerance_m, points[0, 0])
+        snapped, created = grid.snap_segment(points[:, 0], points[:, 1])
+
+        lat_parts.append(points[created, 0])
+        lon_parts.append(points[created, 1])
+        ele.extend(segment[i][2] if len(segment[i]) > 2 else None for i in created)
+
+        # Consecutive points give edges, packed as low << 32 | high; self-loops dropped
+        nodes_np = np.asarray(snapped, dtype=np.int64)
+        u, v = nodes_np[:-1], nodes_np[1:]
+        keep = u != v
+        u, v = u[keep], v[keep]
+        edge_parts.append((np.minimum(u, v) << 32) | np.maximum(u, v))
+
+    lat_np = np.concatenate(lat_parts) if lat_parts else np.empty(0)
+    lon_np = np.concatenate(lon_parts) if lon_parts else np.empty(0)
+
+    # Duplicates (a track walked twice, or back and forth) are dropped, keeping first-seen order
+    keys = np.concatenate(edge_parts) if edge_parts else np.empty(0, dtype=np.int64)
+    _, first = np.unique(keys, return_index=True)
+    keys = keys[np.sort(first)]
+    u_np, v_np = keys >> 32, keys & 0xFFFFFFFF
+    weights = haversine_distance_batch(lat_np[u_np], lon_np[u_np], lat_np[v_np], lon_np[v_np]).tolist()
+
+    nodes = []
+    for i, (node_lat, node_lon, node_ele) in enumerate(zip(lat_np.tolist(), lon_np.tolist(), ele)):
+        node = {"id": i, "lat": node_lat, "lon": node_lon}
+        if node_ele is not None:
+            node["ele"] = node_ele
+        nodes.append(node)
+
+    edges = [{"u": u, "v": v, "weight": w} for u, v, w in zip(u_np.tolist(), v_np.tolist(), weights)]
+    return {"nodes": nodes, "edges": edges}
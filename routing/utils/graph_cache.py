@@ -0,0 +1,179 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+from typing import Any, Callable, Dict, Optional
+
+
+class GraphCache:
+    """
+    Bounded LRU cache of loaded graphs, keyed by map URL.
+
+    Each entry is a self-contained graph object that is never mutated after it
+    is stored, so requests against different maps can't overwrite each other.
+    Entries are evicted least-recently-used first once either the entry count
+    or the total approximate byte size goes over its limit.
+
+    Concurrent misses on one key are coalesced: the first caller loads the
+    graph and the others wait for its result, so a cold map is fetched and
+    indexed once rather than once per request. Loads of one key never overlap:
+    a load started after invalidate() waits for the one it superseded to end
+    first, so two loads never race on the same map's disk cache files.
+
+    A loaded graph is published by swapping it into the cache under the lock,
+    and callers keep the reference they were given for as long as they need
+    it, so a reload or eviction never changes a graph in use.
+    """
+
+    def __init__(self, max_entries: int = 16, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._loading: Dict[str, Future] = {}
+        # Loads dropped by invalidate() that may still be running
+        self._superseded: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns the cached graph for key (marking it recently used), or None."""
+        with self._lock:
+            graph = self._entries.get(key)
+            if graph is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return graph
+
+    def put(self, key: str, graph: Any) -> None:
+        """Stores graph under key and evicts old entries until the limits are met."""
+        size = graph.approx_bytes() if hasattr(graph, "approx_bytes") else 0
+        with self._lock:
+            self._store(key, graph, size)
+
+    def get_or_load(self, key: str, loader: Callable[[str], Any]) -> Any:
+        """
+        Returns the cached graph for key, calling loader(key) and caching the
+        result on a miss. Callers that miss while another one is loading key
+        wait for that load (and get its exception if it fails).
+        """
+        with self._lock:
+            graph = self._entries.get(key)
+            if graph is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return graph
+            self.misses += 1
+            pending = self._loading.get(key)
+            if pending is None:
+                pending = self._loading[key] = Future()
+                previous = self._superseded.pop(key, None)
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            return pending.result()
+
+        if previous is not None:
+            wait([previous])
+        try:
+            graph = loader(key)
+        except BaseException as e:
+            with self._lock:
+                if self._loading.get(key) is pending:
+                    del self._loading[key]
+                self._forget_superseded(key, pending)
+            pending.set_exception(e)
+            raise
+
+        size = graph.approx_bytes() if hasattr(graph, "approx_bytes") else 0
+        with self._lock:
+            # An invalidate() during the load dropped this entry: the waiting
+            # callers still get the graph, but it isn't cached
+            if self._loading.get(key) is pending:
+                del self._loading[key]
+                self._store(key, graph, size)
+            self._forget_superseded(key, pending)
+        pending.set_result(graph)
+        return graph
+
+    def invalidate(self, key: Optional[str] = None) -> int:
+        """Drops one entry (or every entry when key is None). Returns the number removed."""
+        with self._lock:
+            if key is None:
+                removed = len(self._entries)
+                self._superseded.update(self._loading)
+                self._loading.clear()
+                self._entries.clear()
+                self._sizes.clear()
+                self.current_bytes = 0
+                return removed
+
+            pending = self._loading.pop(key, None)
+            if pending is not None:
+                self._superseded[key] = pending
+            if key not in self._entries:
+                return 0
+            self._remove(key)
+            return 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of the cache counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "coalesced": self.coalesced,
+            }
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    # --- internal helpers (caller holds the lock) ---
+
+    def _forget_superseded(self, key: str, pending: Future) -> None:
+        if self._superseded.get(key) is pending:
+            del self._superseded[key]
+
+    def _store(self, key: str, graph: Any, size: int) -> None:
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = graph
+        self._sizes[key] = size
+        self.current_bytes += size
+
+        # Never evict the entry we just stored, even if it alone is over budget.
+        while len(self._entries) > 1 and self._over_budget():
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _over_budget(self) -> bool:
+        if self.max_entries and len(self._entries) > self.max_entries:
+            return True
+        if self.max_bytes and self.current_bytes > self.max_bytes:
+            return True
+        return False
+
+    def _remove(self, key: str) -> None:
+        del self._entries[key]
+        self.current_bytes -= self._sizes.pop(key, 0)
@@ -0,0 +1,126 @@
+"""
+Compact binary routing graph format (.wpg).
+
+Layout (little-endian), all sections 8-byte items so every one stays aligned:
+
+    header   64 bytes: magic, format version, flags, node count n, edge slot count m
+    node_ids int64[n]    lat, lon, lat_rad, lon_rad, cos_lat  float64[n] each
+    offsets  int64[n+1]  targets int64[m]  weights float64[m]  twins int64[m]
+    headings float64[m]  (version 2 on)  elevation float64[n]  (version 3 on, NaN where unknown)
+
+Files of older versions are still read, without the sections added since.
+
+That is the GraphData CSR layout as-is, so a file can be memory-mapped and
+every array used in place through a memoryview: no parsing and no copy, and
+worker processes mapping the same file share its pages.
+"""
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from typing import Dict, Union
+
+MAGIC = b"WPGRAPH\0"
+FORMAT_VERSION = 3
+HEADER = struct.Struct("<8sIIQQ")
+HEADER_SIZE = 64
+
+# (GraphData constructor argument, typecode, length in terms of n / m, first format version with it)
+SECTIONS = (
+    ("node_ids", "q", "n", 1),
+    ("lat", "d", "n", 1),
+    ("lon", "d", "n", 1),
+    ("lat_rad", "d", "n", 1),
+    ("lon_rad", "d", "n", 1),
+    ("cos_lat", "d", "n", 1),
+    ("offsets", "q", "n+1", 1),
+    ("targets", "q", "m", 1),
+    ("weights", "d", "m", 1),
+    ("twins", "q", "m", 1),
+    ("headings", "d", "m", 2),
+    ("elevation", "d", "n", 3),
+)
+
+
+def is_binary_graph(content: bytes) -> bool:
+    """True if content starts like a .wpg file."""
+    return content[:len(MAGIC)] == MAGIC
+
+
+def encode_graph(graph) -> bytes:
+    """Serialises a GraphData into the binary format."""
+    n, m = graph.node_count, graph.edge_count
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, 0, n, m).ljust(HEADER_SIZE, b"\0")]
+    for name, typecode, _, _ in SECTIONS:
+        values = getattr(graph, name)
+        if sys.byteorder != "little":
+            values = array(typecode, values)
+            values.byteswap()
+        parts.append(memoryview(values).tobytes())
+    return b"".join(parts)
+
+
+def write_graph_file(content: bytes, path: str) -> None:
+    """
+    Writes an encoded graph to path atomically (temp file + rename), so readers
+    never map a half-written file and existing mappings of an older file stay valid.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def map_graph_file(path: str) -> Dict[str, Union[memoryview, array]]:
+    """Memory-maps a .wpg file read-only and returns its arrays (see read_graph_arrays)."""
+    with open(path, "rb") as f:
+        # The mapping stays alive as long as any view into it; closing the file is fine.
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return read_graph_arrays(buffer)
+
+
+def read_graph_arrays(buffer) -> Dict[str, Union[memoryview, array]]:
+    """
+    Returns {GraphData argument: array} for an encoded graph in buffer (bytes or mmap).
+
+    On little-endian hosts each array is a zero-copy memoryview into buffer;
+    elsewhere it is a byte-swapped array copy. Raises ValueError on a
+    malformed or unsupported file.
+    """
+    if len(buffer) < HEADER_SIZE:
+        raise ValueError("Graph file is truncated.")
+    magic, version, _flags, n, m = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a binary graph file.")
+    if not 1 <= version <= FORMAT_VERSION:
+        raise ValueError(f"Unsupported graph format version {version} (expected {FORMAT_VERSION}).")
+
+    sections = [section for section in SECTIONS if section[3] <= version]
+    lengths = {"n": n, "n+1": n + 1, "m": m}
+    expected = HEADER_SIZE + 8 * sum(lengths[length] for _, _, length, _ in sections)
+    if len(buffer) != expected:
+        raise ValueError(f"Graph file size {len(buffer)} does not match its header ({expected}).")
+
+    view = memoryview(buffer)
+    arrays: Dict[str, Union[memoryview, array]] = {}
+    position = HEADER_SIZE
+    for name, typecode, length, _ in sections:
+        end = position + 8 * lengths[length]
+        if sys.byteorder == "little":
+            arrays[name] = view[position:end].cast(typecode)
+        else:
+            values = array(typecode)
+            values.frombytes(view[position:end])
+            values.byteswap()
+            arrays[name] = values
+        position = end
+    return arrays
@@ -0,0 +1,63 @@
+import os
+import threading
+from typing import Optional, Tuple
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Transient answers worth retrying; anything else is returned to the caller at once
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+
+
+def get_session() -> requests.Session:
+    """
+    The process-wide HTTP session used for map and GPX fetches.
+
+    Connections are pooled and kept alive per host, so a cache miss doesn't
+    pay TCP and TLS setup again. Idempotent requests are retried on
+    connection errors and RETRY_STATUSES with exponential backoff (honouring
+    Retry-After). A forked worker builds its own session rather than
+    sharing the parent's sockets.
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            retry = Retry(
+                total=getattr(settings, 'ROUTING_HTTP_RETRIES', 3),
+                backoff_factor=getattr(settings, 'ROUTING_HTTP_BACKOFF_SECONDS', 0.5),
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset({'GET', 'HEAD'}),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            pool_size = getattr(settings, 'ROUTING_HTTP_POOL_SIZE', 10)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+def default_timeout() -> Tuple[float, float]:
+    """(connect, read) timeouts in seconds; the read timeout bounds each wait for data, not the whole body."""
+    return (getattr(settings, 'ROUTING_HTTP_CONNECT_TIMEOUT_SECONDS', 5.0),
+            getattr(settings, 'ROUTING_HTTP_READ_TIMEOUT_SECONDS', 30.0))
+
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    """GET through the shared session with the default timeouts (unless timeout= is given)."""
+    kwargs.setdefault('timeout', default_timeout())
+    return get_session().get(url, **kwargs)
+
+
+def http_head(url: str, **kwargs) -> requests.Response:
+    """HEAD through the shared session with the default timeouts (unless timeout= is given)."""
+    kwargs.setdefault('timeout', default_timeout())
+    return get_session().head(url, **kwargs)
@@ -0,0 +1,304 @@
+import asyncio
+import contextvars
+import functools
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+# --- REGISTRY ---
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters, summaries (count and sum of observations) and
+    max-gauges, rendered in the Prometheus text exposition format.
+
+    Metrics live in this process only: with several worker processes each
+    one is scraped (or aggregated) on its own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._summaries: Dict[str, Dict[LabelKey, List[float]]] = {}
+        self._maxima: Dict[str, Dict[LabelKey, float]] = {}
+        self._help: Dict[str, str] = {}
+
+    def inc(self, name: str, value: float = 1, help: str = "", **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+            if help:
+                self._help.setdefault(name, help)
+
+    def observe(self, name: str, value: float, help: str = "", **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            summary = self._summaries.setdefault(name, {}).setdefault(key, [0, 0.0])
+            summary[0] += 1
+            summary[1] += value
+            if help:
+                self._help.setdefault(name, help)
+
+    def set_max(self, name: str, value: float, help: str = "", **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._maxima.setdefault(name, {})
+            if value > series.get(key, -math.inf):
+                series[key] = value
+            if help:
+                self._help.setdefault(name, help)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+            self._maxima.clear()
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text format (version 0.0.4)."""
+        lines: List[str] = []
+        with self._lock:
+            for kind, metrics in (('counter', self._counters), ('gauge', self._maxima)):
+                for name in sorted(metrics):
+                    _header(lines, name, kind, self._help.get(name))
+                    for key, value in sorted(metrics[name].items()):
+                        lines.append(f"{name}{_labels(key)} {_number(value)}")
+            for name in sorted(self._summaries):
+                _header(lines, name, 'summary', self._help.get(name))
+                for key, (count, total) in sorted(self._summaries[name].items()):
+                    lines.append(f"{name}_count{_labels(key)} {count}")
+                    lines.append(f"{name}_sum{_labels(key)} {_number(total)}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def _header(lines: List[str], name: str, kind: str, help: Optional[str]) -> None:
+    if help:
+        lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in key)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+
+
+def metrics_enabled() -> bool:
+    return getattr(settings, 'ROUTING_METRICS_ENABLED', False)
+
+
+# --- PER-REQUEST TIMINGS ---
+
+class RequestTimings:
+    """Stage durations and search counters of one request, for the debug_timings response block."""
+
+    __slots__ = ('endpoint', 'stages', 'searches', 'debug')
+
+    def __init__(self, endpoint: str = "", debug: bool = False):
+        self.endpoint = endpoint
+        self.stages: Dict[str, float] = {}
+        self.searches: List[Dict[str, Any]] = []
+        self.debug = debug
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "stages_ms": {name: round(1000 * seconds, 3) for name, seconds in self.stages.items()},
+            "searches": self.searches,
+        }
+
+    def server_timing(self) -> str:
+        """The stages as a Server-Timing header value (shown by browser dev tools)."""
+        return ", ".join(f"{name};dur={1000 * seconds:.3f}" for name, seconds in self.stages.items())
+
+
+_current: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar('routing_request_timings',
+                                                                                     default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def debug_timings() -> RequestTimings:
+    """
+    Turns on the debug_timings block for the current request and returns its
+    timings; they are collected even when ROUTING_METRICS_ENABLED is off.
+    """
+    timings = _current.get()
+    if timings is None:
+        timings = RequestTimings()
+        _current.set(timings)
+    timings.debug = True
+    return timings
+
+
+class _Stage:
+    __slots__ = ('name', 'timings', 'started')
+
+    def __init__(self, name: str, timings: Optional[RequestTimings]):
+        self.name = name
+        self.timings = timings
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        add_stage(self.name, time.perf_counter() - self.started, self.timings)
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name: str):
+    """
+    Context manager timing one stage of the current request. When metrics are
+    off and the request didn't ask for debug_timings it is a shared no-op, so
+    the hot path pays for a context variable lookup only.
+    """
+    timings = _current.get()
+    if timings is None and not metrics_enabled():
+        return _NO_STAGE
+    return _Stage(name, timings)
+
+
+def add_stage(name: str, seconds: float, timings: Optional[RequestTimings] = None) -> None:
+    """Records a stage measured elsewhere (e.g. in an upload worker process)."""
+    if timings is None:
+        timings = _current.get()
+    if timings is not None:
+        timings.stages[name] = timings.stages.get(name, 0.0) + seconds
+    if metrics_enabled():
+        registry.observe('routing_stage_seconds', seconds, help="Time spent per request stage.",
+                         endpoint=timings.endpoint if timings is not None else "", stage=name)
+
+
+def record_search(mode: str, stats) -> None:
+    """Adds a finished search's SearchStats to the process counters and the request's timings."""
+    timings = _current.get()
+    if timings is not None and timings.debug:
+        timings.searches.append({"mode": mode, **stats.as_dict()})
+    if metrics_enabled():
+        registry.inc('routing_searches_total', help="Searches run.", mode=mode)
+        registry.inc('routing_search_nodes_expanded_total', stats.nodes_expanded,
+                     help="Search states settled.", mode=mode)
+        registry.inc('routing_search_nodes_popped_total', stats.nodes_popped,
+                     help="Priority queue pops, stale entries included.", mode=mode)
+        registry.inc('routing_search_pushes_total', stats.pushes, help="Priority queue pushes.", mode=mode)
+        registry.set_max('routing_search_heap_peak', stats.heap_peak,
+                         help="Largest priority queue any search reached.", mode=mode)
+
+
+# --- VIEWS ---
+
+def instrumented(endpoint: str) -> Callable:
+    """
+    Decorator for views: counts requests by status and times them, and gives
+    each request its own RequestTimings while ROUTING_METRICS_ENABLED is on
+    (debug_timings() creates one on demand otherwise). Requests that asked for
+    debug_timings also get a Server-Timing header. Streamed responses are
+    timed until their last chunk is produced. The wrapper's routing_endpoint
+    attribute marks it for the ProfilingMiddleware.
+    """
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                started = time.perf_counter()
+                token = _current.set(RequestTimings(endpoint) if metrics_enabled() else None)
+                try:
+                    response = await view(request, *args, **kwargs)
+                    return _finish(endpoint, started, response)
+                finally:
+                    _current.reset(token)
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                started = time.perf_counter()
+                token = _current.set(RequestTimings(endpoint) if metrics_enabled() else None)
+                try:
+                    response = view(request, *args, **kwargs)
+                    return _finish(endpoint, started, response)
+                finally:
+                    _current.reset(token)
+        wrapper.routing_endpoint = endpoint
+        return wrapper
+    return decorator
+
+
+def _finish(endpoint: str, started: float, response):
+    timings = _current.get()
+    if timings is not None and timings.debug and not response.streaming:
+        response.headers['Server-Timing'] = timings.server_timing()
+    if not metrics_enabled():
+        return response
+    if response.streaming and not response.is_async:
+        response.streaming_content = _timed_stream(response.streaming_content, timings, endpoint, started,
+                                                   response.status_code)
+    else:
+        _count_request(endpoint, response.status_code, time.perf_counter() - started)
+    return response
+
+
+def _timed_stream(chunks, timings: Optional[RequestTimings], endpoint: str, started: float, status: int):
+    # Each chunk is produced in the request's timing context, though the view has already returned
+    iterator = iter(chunks)
+    try:
+        while True:
+            token = _current.set(timings)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current.reset(token)
+            yield chunk
+    finally:
+        _count_request(endpoint, status, time.perf_counter() - started)
+
+
+def _count_request(endpoint: str, status: int, seconds: float) -> None:
+    registry.inc('routing_requests_total', help="Requests handled.", endpoint=endpoint, status=str(status))
+    registry.observe('routing_request_seconds', seconds, help="Request latency.", endpoint=endpoint)
+
+
+def render_metrics(caches: Dict[str, Dict[str, Any]]) -> str:
+    """
+    The registry's metrics plus the counters of each cache (name -> its
+    stats() dict), e.g. routing_graph_cache_hits_total and routing_graph_cache_entries.
+    """
+    lines = [registry.render()]
+    for cache, stats in caches.items():
+        for key, value in stats.items():
+            if value is None:
+                continue
+            counter = key in ('hits', 'reverse_hits', 'misses', 'evictions', 'coalesced', 'expirations')
+            name = f"routing_{cache}_{key}" + ("_total" if counter else "")
+            lines.append(f"# TYPE {name} {'counter' if counter else 'gauge'}\n{name} {_number(value)}\n")
+    return "".join(lines)
@@ -0,0 +1,155 @@
+import cProfile
+import glob
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+# Request fields kept with a capture (besides the whole JSON body), shown by routing_replay
+CAPTURE_FIELDS = ("map_url", "mode", "source_id", "target_id", "source_coords", "target_coords", "snap", "bidirectional")
+# Request bodies bigger than this aren't stored (batch requests can carry thousands of pairs)
+MAX_CAPTURED_BODY_BYTES = 256 * 1024
+
+
+# --- STACK SAMPLING ---
+
+class StackSampler:
+    """
+    Samples the Python stacks of the threads serving requests every
+    interval_s seconds, from one background thread.
+
+    Each sample is a collapsed stack ("module:function;module:function;...",
+    outermost first) counted per request, the input format of flamegraph.pl
+    and speedscope. Unlike cProfile it doesn't slow the request down, so it
+    can watch every request and keep the samples of the slow ones only.
+    """
+
+    def __init__(self, interval_s: float = 0.01):
+        self.interval_s = interval_s
+        self._requests: Dict[int, Counter] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, samples: Optional[Counter] = None) -> Counter:
+        """Starts sampling the calling thread; returns the counter its samples go to (samples, or a new one)."""
+        if samples is None:
+            samples = Counter()
+        with self._lock:
+            self._requests[threading.get_ident()] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='routing-stack-sampler', daemon=True)
+                self._thread.start()
+        return samples
+
+    def stop(self) -> None:
+        with self._lock:
+            self._requests.pop(threading.get_ident(), None)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval_s)
+            with self._lock:
+                if not self._requests:
+                    continue
+                requests = list(self._requests.items())
+            frames = sys._current_frames()
+            for thread_id, samples in requests:
+                frame = frames.get(thread_id)
+                if frame is not None and thread_id != own:
+                    samples[_collapse(frame)] += 1
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+# --- CAPTURES ---
+
+class ProfileCapture:
+    """
+    Writes profiles of slow requests to directory, keeping the newest
+    max_captures: <id>.json holds the request, its latency and any stack
+    samples, and <id>.prof the cProfile stats when the request was profiled
+    (open it with pstats or snakeviz).
+    """
+
+    def __init__(self, directory: str, max_captures: int = 100):
+        self.directory = directory
+        self.max_captures = max_captures
+        self._lock = threading.Lock()
+
+    def write(self, request_info: Dict[str, Any], seconds: float, samples: Optional[Counter] = None,
+              profile: Optional[cProfile.Profile] = None) -> str:
+        """Stores one capture and returns the path of its JSON file."""
+        # Sortable by time, so rotation drops the oldest
+        now = time.time()
+        capture_id = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}{int(now * 1000) % 1000:03d}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(self.directory, exist_ok=True)
+        capture = {
+            "id": capture_id,
+            "captured_at": now,
+            "duration_ms": 1000 * seconds,
+            **request_info,
+            "profile": f"{capture_id}.prof" if profile is not None else None,
+            "stack_samples": dict(samples.most_common()) if samples else {},
+        }
+        path = os.path.join(self.directory, f"{capture_id}.json")
+        with self._lock:
+            if profile is not None:
+                profile.dump_stats(os.path.join(self.directory, f"{capture_id}.prof"))
+            with open(path, 'w') as f:
+                json.dump(capture, f)
+            self._rotate()
+        return path
+
+    def list(self) -> List[str]:
+        """JSON files of the stored captures, oldest first."""
+        return sorted(glob.glob(os.path.join(self.directory, '*.json')))
+
+    def _rotate(self) -> None:
+        captures = self.list()
+        for path in captures[:max(0, len(captures) - self.max_captures)]:
+            for stale in (path, path[:-len('.json')] + '.prof'):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+
+def request_info(request) -> Dict[str, Any]:
+    """What replaying a request needs: method, path, query and (JSON) body, plus its routing parameters."""
+    info: Dict[str, Any] = {"method": request.method, "path": request.path, "query": request.GET.urlencode()}
+    body = None
+    if request.content_type == 'application/json' and len(request.body) <= MAX_CAPTURED_BODY_BYTES:
+        try:
+            body = json.loads(request.body)
+        except ValueError:
+            pass
+    info["body"] = body
+    info["params"] = {key: body[key] for key in CAPTURE_FIELDS if key in body} if isinstance(body, dict) else {}
+    return info
+
+
+def load_capture(directory: str, capture: str) -> Dict[str, Any]:
+    """A capture by path, file name or id (in directory); 'latest' is the newest one."""
+    if capture == 'latest':
+        captures = ProfileCapture(directory).list()
+        if not captures:
+            raise FileNotFoundError(f"No captures in {directory}")
+        path = captures[-1]
+    elif os.path.isfile(capture):
+        path = capture
+    else:
+        path = os.path.join(directory, capture if capture.endswith('.json') else f"{capture}.json")
+    with open(path) as f:
+        return json.load(f)
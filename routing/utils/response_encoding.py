@@ -0,0 +1,120 @@
+import json
+import math
+from typing import Any, BinaryIO, Iterable, Iterator, Sequence, Tuple
+
+from django.conf import settings
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # optional: the standard library encoder is used instead
+    orjson = None
+
+# Streamed JSON is written in pieces of about this many bytes
+JSON_CHUNK_BYTES = 64 * 1024
+
+_compact_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+# Refuses NaN and infinities, so dumps() can write them as null like orjson does
+_strict_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, allow_nan=False)
+
+
+def _use_orjson() -> bool:
+    backend = getattr(settings, 'ROUTING_JSON_BACKEND', 'auto')
+    if backend == 'orjson' and orjson is None:
+        raise ImportError("ROUTING_JSON_BACKEND is 'orjson' but orjson isn't installed.")
+    return orjson is not None and backend in ('auto', 'orjson')
+
+
+def dumps(data: Any) -> bytes:
+    """
+    Compact UTF-8 JSON for data. Uses orjson when it is installed (several
+    times faster on long coordinate lists), else the standard library encoder
+    with the same compact separators. Either way NaN and infinities become
+    null, as JSON has no literal for them.
+    """
+    if _use_orjson():
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    try:
+        return _strict_encoder.encode(data).encode('utf-8')
+    except ValueError:
+        # Rare (an unreachable cost, a missing elevation): only then copy data to replace them
+        return _strict_encoder.encode(_finite(data)).encode('utf-8')
+
+
+def _finite(data: Any) -> Any:
+    """data with every non-finite float replaced by None."""
+    if isinstance(data, float):
+        return data if math.isfinite(data) else None
+    if isinstance(data, dict):
+        return {key: _finite(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_finite(value) for value in data]
+    return data
+
+
+def iter_json(data: Any, chunk_bytes: int = JSON_CHUNK_BYTES) -> Iterator[bytes]:
+    """
+    Compact JSON for data as a sequence of byte chunks, for payloads (whole
+    graphs) too big to build as one string. Only the chunk being filled is
+    held in memory, besides data itself.
+    """
+    pieces, size = [], 0
+    for piece in _compact_encoder.iterencode(data):
+        pieces.append(piece)
+        size += len(piece)
+        if size >= chunk_bytes:
+            yield ''.join(pieces).encode('utf-8')
+            pieces, size = [], 0
+    if pieces:
+        yield ''.join(pieces).encode('utf-8')
+
+
+def write_json(data: Any, out: BinaryIO) -> None:
+    """Writes data to out as compact JSON, chunk by chunk."""
+    for chunk in iter_json(data):
+        out.write(chunk)
+
+
+def encode_polyline(coords: Iterable[Sequence[float]], precision: int = 5) -> str:
+    """
+    Encodes (lat, lon) pairs in the Encoded Polyline Algorithm Format used by
+    Google Maps, Leaflet and OSRM: about a fifth of the size of the JSON coordinate list.
+    """
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon in coords:
+        lat_i, lon_i = int(round(lat * factor)), int(round(lon * factor))
+        for delta in (lat_i - prev_lat, lon_i - prev_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                out.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            out.append(chr(value + 63))
+        prev_lat, prev_lon = lat_i, lon_i
+    return ''.join(out)
+
+
+class CompactJsonResponse(HttpResponse):
+    """Like JsonResponse, but encoded with dumps(): compact, and through orjson when available."""
+
+    def __init__(self, data: Any, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+def accepted_encodings(accept_encoding: str) -> Tuple[str, ...]:
+    """Content codings an Accept-Encoding header allows (q > 0), lower-cased."""
+    accepted = []
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding and q > 0:
+            accepted.append(coding.strip().lower())
+    return tuple(accepted)
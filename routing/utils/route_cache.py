@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+class RouteCache:
+    """
+    Bounded LRU cache of computed routes with an optional time-to-live.
+
+    Keys are (map_url, graph_version, mode, source_id, target_id). The graph
+    version changes whenever the map is reloaded, so routes computed on an
+    older copy of a map are never served; invalidate(map_url) drops them
+    eagerly as well. Values are the route fields of the calculate_routes
+    response (path ids, coords, costs...), stored once and copied on reversal.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.reverse_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, map_url: str, graph_version: int, mode: str, source_id: int, target_id: int,
+            symmetric: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached route, or None. For symmetric modes (the same route
+        both ways, see RoutingMode.symmetric) a cached opposite-direction route
+        is reversed.
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            route = self._lookup((map_url, graph_version, mode, source_id, target_id))
+            if route is not None:
+                self.hits += 1
+                return route
+
+            if symmetric and source_id != target_id:
+                route = self._lookup((map_url, graph_version, mode, target_id, source_id))
+                if route is not None:
+                    self.hits += 1
+                    self.reverse_hits += 1
+                    return _reversed(route)
+
+            self.misses += 1
+            return None
+
+    def put(self, map_url: str, graph_version: int, mode: str, source_id: int, target_id: int,
+            route: Dict[str, Any]) -> None:
+        """Stores route and evicts least-recently-used entries over max_entries."""
+        if not self.enabled:
+            return
+
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else float("inf")
+        key = (map_url, graph_version, mode, source_id, target_id)
+        with self._lock:
+            self._entries[key] = (expires_at, route)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, map_url: Optional[str] = None) -> int:
+        """Drops every route of map_url (or all routes when None). Returns the number removed."""
+        with self._lock:
+            if map_url is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+
+            stale = [key for key in self._entries if key[0] == map_url]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of the cache counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "reverse_hits": self.reverse_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    # --- internal helpers (caller holds the lock) ---
+
+    def _lookup(self, key: Tuple[Hashable, ...]) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, route = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return route
+
+
+def _reversed(route: Dict[str, Any]) -> Dict[str, Any]:
+    """The same route walked the other way (costs are unchanged in symmetric modes)."""
+    reverse = dict(route)
+    reverse["path_node_ids"] = route["path_node_ids"][::-1]
+    reverse["path_coords"] = route["path_coords"][::-1]
+    return reverse
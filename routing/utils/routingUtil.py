@@ -1,26 +1,291 @@
 import math
-import heapq
-from typing import Dict, Any, List, Tuple, Optional
+import sys
+import threading
+import itertools
+import hashlib
+import json
+import logging
+import os
+from array import array
+from collections.abc import Mapping
+from typing import BinaryIO, Dict, Any, Iterator, List, Sequence, Tuple, Optional, Union
+import numpy as np
+from django.conf import settings
 from django.forms import ValidationError
 import requests
 import xml.etree.ElementTree as ET
-import io
 from http.client import HTTPException
+from .graph_cache import GraphCache
+from .gpx_parser import TrackPoint, iter_gpx_segments
+from .route_cache import RouteCache
+from .graph_format import encode_graph, is_binary_graph, map_graph_file, read_graph_arrays, write_graph_file
+from .storage import get_storage, is_content_addressed_url
+from .http_session import http_get
+from .metrics import stage
+from ..algorithms.contraction_hierarchy import ContractionHierarchy
+from ..algorithms.landmarks import Landmarks
+from ..algorithms.chain_simplification import SimplifiedGraph
+from ..algorithms.spatial_index import EdgeSnap, SpatialIndex
+from ..algorithms.bidirectional import bidirectional_astar, bidirectional_turn_search, lower_bound_to
+from ..algorithms.energy_path import edge_energy_costs, energy_lower_bound
+from ..algorithms.search import EdgeExpansion, Heuristic, NodeExpansion
+from .search_state import ScratchPool, SearchState, SearchStats
+
+logger = logging.getLogger(__name__)
+
+# Every GraphData gets a new version, so caches keyed on it never mix up two loads of one map.
+_graph_versions = itertools.count(1)
 
 class GraphData:
-    """Holds the graph data, adjacency lists, and node coordinates."""
-    nodes: List[Dict[str, Any]] = []
-    node_coords: Dict[int, Tuple[float, float]] = {}
-    graph_adj: Dict[int, List[Tuple[int, float]]] = {}
-    physical_dist_adj: Dict[int, Dict[int, float]] = {}
-    last_url: str = ""
+    """
+    Compressed-sparse-row (CSR) routing graph for one map.
+
+    Nodes are stored under dense internal indices 0..n-1; index_of / node_ids
+    translate between those and the external 'id' values from the map JSON.
+    The outgoing edges of node i are the slots offsets[i]..offsets[i+1]-1 of
+    the targets (neighbor index) and weights arrays; twins[slot] is the slot
+    of the same edge in the opposite direction. Weights are the same both
+    ways; energy_weights, present when the map has elevation, are not.
+
+    Instances are built once by load_and_prepare_graph(), frozen (see freeze())
+    and only then published through the graph cache, so every thread routing
+    on a graph sees the same immutable snapshot. Reloading a map builds a new
+    GraphData rather than updating the cached one. The arrays may also be
+    read-only memoryviews into a memory-mapped binary graph file (see graph_format).
+    """
+
+    # Most states one search holds at once: node slots (bidirectional: forward,
+    # backward, potentials) and edge slots (bidirectional least_turn)
+    SCRATCH_NODE_STATES, SCRATCH_EDGE_STATES = 3, 2
+
+    # Arrays made read-only by freeze()
+    _ARRAY_FIELDS = ('node_ids', 'lat', 'lon', 'offsets', 'targets', 'weights', 'twins', 'lat_rad', 'lon_rad', 'cos_lat',
+                     'headings', 'elevation', 'energy_weights', 'reverse_energy_weights')
+
+    def __init__(self, node_ids: array, lat: array, lon: array, offsets: array,
+                 targets: array, weights: array, twins: array, source_url: str = "",
+                 lat_rad: Optional[array] = None, lon_rad: Optional[array] = None, cos_lat: Optional[array] = None,
+                 headings: Optional[array] = None, elevation: Optional[array] = None):
+        self.node_ids = node_ids
+        self.index_of: Dict[int, int] = {node_id: i for i, node_id in enumerate(node_ids)}
+        self.lat = lat
+        self.lon = lon
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.twins = twins
+        self.source_url = source_url
+        self.version = next(_graph_versions)
+        self.node_coords = _NodeCoordsView(self)
+        # Optional preprocessing, attached by the loader before the graph is cached.
+        self.contraction_hierarchy: Optional[ContractionHierarchy] = None
+        self.landmarks: Optional[Landmarks] = None
+        self.energy_landmarks: Optional[Landmarks] = None
+        self.simplified: Optional[SimplifiedGraph] = None
+
+        # Heuristic terms precomputed once per map: latitude/longitude in radians
+        # and cos(latitude), so A* only needs two sines, a sqrt and an asin per node.
+        # Binary graph files carry them precomputed.
+        if lat_rad is None or lon_rad is None or cos_lat is None:
+            lat_rad_np = np.radians(np.frombuffer(lat, dtype=np.float64))
+            lat_rad = _to_array(lat_rad_np)
+            lon_rad = _to_array(np.radians(np.frombuffer(lon, dtype=np.float64)))
+            cos_lat = _to_array(np.cos(lat_rad_np))
+        self.lat_rad = lat_rad
+        self.lon_rad = lon_rad
+        self.cos_lat = cos_lat
+        # Initial bearing of every edge slot, for the least_turn searches (see edge_headings()).
+        # Binary graph files from format version 2 on carry it precomputed too.
+        self.headings = headings if headings is not None else edge_headings(self)
+        # Elevation of every node in meters, NaN where the map has none (as do binary
+        # graph files before format version 3).
+        self.elevation = elevation if elevation is not None else array('d', [math.nan]) * len(node_ids)
+        known = int(np.count_nonzero(~np.isnan(np.frombuffer(self.elevation, dtype=np.float64))))
+        self.has_elevation = known > 0
+        self.complete_elevation = known == len(node_ids)
+        # Energy cost of every edge slot, and of its twin (for backward searches), precomputed
+        # from the grades (see energy_path.edge_energy_costs()). Without elevation every
+        # edge is flat, so energy routing scales the weights instead and these stay None.
+        self.energy_weights: Optional[array] = None
+        self.reverse_energy_weights: Optional[array] = None
+        if self.has_elevation:
+            costs = edge_energy_costs(weights, targets, twins, self.elevation, ENERGY_PENALTY_FACTOR,
+                                      ENERGY_CLIMB_COST, ENERGY_STEEP_COST)
+            self.energy_weights = _to_array(costs)
+            self.reverse_energy_weights = _to_array(costs[np.frombuffer(twins, dtype=np.int64)])
+
+        # Search scratch space, allocated lazily and shared by at most SEARCH_SCRATCH_SETS
+        # searches at once (see search_scratch()).
+        self._scratch = ScratchPool(SEARCH_SCRATCH_SETS)
+        # Built on the first coordinate lookup (see spatial_index()), as most
+        # requests route between node ids and never need it.
+        self._spatial_index: Optional[SpatialIndex] = None
+        self._spatial_index_lock = threading.Lock()
+        self._frozen = False
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        # Private attributes are per-graph caches (search scratch, spatial index) and stay writable
+        if not name.startswith('_') and self.__dict__.get('_frozen'):
+            raise AttributeError(f"GraphData is frozen, can't set {name!r}")
+        super().__setattr__(name, value)
+
+    def freeze(self) -> 'GraphData':
+        """
+        Makes the graph an immutable snapshot: public attributes can no longer be
+        rebound and the CSR arrays become read-only memoryviews (which index as
+        fast as the arrays). Called by the loader once the overlays are
+        attached, before the graph is shared between threads.
+        """
+        if not self._frozen:
+            for name in self._ARRAY_FIELDS:
+                values = getattr(self, name)
+                if isinstance(values, array):
+                    super().__setattr__(name, memoryview(values).toreadonly())
+            self._frozen = True
+        return self
+
+    @property
+    def frozen(self) -> bool:
+        return self._frozen
+
+    @property
+    def node_count(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self) -> int:
+        """Number of directed edge slots (each undirected edge is stored twice)."""
+        return len(self.targets)
+
+    def has_node(self, node_id: int) -> bool:
+        return node_id in self.index_of
+
+    def neighbors(self, index: int) -> range:
+        """Edge slots leaving the node at dense index."""
+        return range(self.offsets[index], self.offsets[index + 1])
+
+    def spatial_index(self) -> SpatialIndex:
+        """The k-d tree over node coordinates, built once per graph on first use."""
+        index = self._spatial_index
+        if index is None:
+            with self._spatial_index_lock:
+                index = self._spatial_index
+                if index is None:
+                    index = self._spatial_index = SpatialIndex.build(self)
+        return index
+
+    def search_scratch(self):
+        """
+        Context manager checking out one of the graph's scratch sets for a search.
+
+        Every search runs inside one (the search functions check out their own),
+        so at most SEARCH_SCRATCH_SETS searches run on the graph at once and
+        their state arrays are bounded by that, not by the number of threads.
+        """
+        return self._scratch.checkout()
+
+    def search_state(self, slot: int = 0, begin: bool = True) -> SearchState:
+        """
+        Returns the reusable per-node SearchState number slot of the scratch set
+        this thread has checked out (see search_scratch()), already begun.
+
+        The arrays are allocated on a set's first search that needs them; every
+        later search only bumps the generation stamp. Searches that need
+        several independent states at once (e.g. bidirectional) use distinct slots.
+        begin=False returns the state as-is, to share one already begun.
+        """
+        return self._state('node', slot, self.node_count, begin)
+
+    def edge_search_state(self, slot: int = 0, begin: bool = True) -> SearchState:
+        """Like search_state(), but indexed by edge slot for searches over directed edges."""
+        return self._state('edge', slot, self.edge_count, begin)
+
+    def _state(self, kind: str, slot: int, size: int, begin: bool) -> SearchState:
+        state = self._scratch.current().state(kind, slot, size)
+        if begin:
+            state.begin()
+        return state
+
+    def approx_bytes(self) -> int:
+        """Rough in-memory size of the graph (search scratch included), used for cache budgeting."""
+        size = sum(
+            arr.itemsize * len(arr)
+            for arr in (self.node_ids, self.lat, self.lon, self.offsets, self.targets, self.weights, self.twins,
+                        self.lat_rad, self.lon_rad, self.cos_lat, self.headings, self.elevation,
+                        self.energy_weights, self.reverse_energy_weights)
+            if arr is not None
+        )
+        # id -> index dict: the table itself plus one int object per key/value.
+        size += sys.getsizeof(self.index_of) + len(self.index_of) * 2 * sys.getsizeof(0)
+        if self.contraction_hierarchy is not None:
+            size += self.contraction_hierarchy.approx_bytes()
+        if self.landmarks is not None:
+            size += self.landmarks.approx_bytes()
+        if self.energy_landmarks is not None:
+            size += self.energy_landmarks.approx_bytes()
+        if self.simplified is not None:
+            size += self.simplified.approx_bytes()
+        if self._spatial_index is not None:
+            size += self._spatial_index.approx_bytes()
+        # Search scratch, as much as the pool can hold once every set has been used
+        size += self._scratch.limit * SearchState.BYTES_PER_ENTRY * (
+            self.SCRATCH_NODE_STATES * self.node_count + self.SCRATCH_EDGE_STATES * self.edge_count)
+        return size
+
+
+def _to_array(values: np.ndarray) -> array:
+    """Copies a float64 NumPy array into an array('d'), which is much faster to index from Python loops."""
+    out = array('d')
+    out.frombytes(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return out
+
+
+class _NodeCoordsView(Mapping):
+    """Read-only {node_id: (lat, lon)} view over a GraphData's coordinate arrays."""
+
+    def __init__(self, graph: GraphData):
+        self._graph = graph
+
+    def __getitem__(self, node_id: int) -> Tuple[float, float]:
+        i = self._graph.index_of[node_id]
+        return (self._graph.lat[i], self._graph.lon[i])
+
+    def __contains__(self, node_id: object) -> bool:
+        return node_id in self._graph.index_of
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._graph.index_of)
+
+    def __len__(self) -> int:
+        return len(self._graph.index_of)
+
+
+# Process-wide cache of loaded graphs, keyed by map URL.
+graph_cache = GraphCache(
+    max_entries=getattr(settings, 'ROUTING_GRAPH_CACHE_MAX_ENTRIES', 16),
+    max_bytes=getattr(settings, 'ROUTING_GRAPH_CACHE_MAX_BYTES', None),
+)
+
+# Process-wide cache of computed routes, keyed by (map, graph version, mode, source, target).
+route_cache = RouteCache(
+    max_entries=getattr(settings, 'ROUTING_ROUTE_CACHE_MAX_ENTRIES', 4096),
+    ttl_seconds=getattr(settings, 'ROUTING_ROUTE_CACHE_TTL_SECONDS', None),
+)
+
+# Searches that may run on one graph at once, each with its own scratch set (see GraphData.search_scratch()).
+SEARCH_SCRATCH_SETS = getattr(settings, 'ROUTING_SEARCH_SCRATCH_SETS', 4)
 
 # --- 4. CORE ALGORITHMS AND HELPERS ---
 
 # Constants for cost functions
-ENERGY_PENALTY_FACTOR = 1.2
-TURN_PENALTY_METERS = 50.0
+ENERGY_PENALTY_FACTOR = 1.2 # Energy per meter on the flat
+ENERGY_CLIMB_COST = 10.0 # Extra energy per meter climbed (roughly Naismith's 1 m up = 8 m along)
+ENERGY_STEEP_COST = 50.0 # ... plus this times the grade, so steep climbs cost more per meter than gentle ones
+TURN_PENALTY_METERS = 50.0  # Cost added for a sharp turn
+SHARP_TURN_THRESHOLD_DEG = 45 # Angle threshold for a turn to be considered 'sharp'
+SIMPLIFY_MAX_CORE_FRACTION = 0.75 # Keep a simplified overlay only if it drops at least a quarter of the nodes
 EARTH_RADIUS_METERS = 6371e3 # Earth radius in meters
+EARTH_DIAMETER_METERS = 2 * EARTH_RADIUS_METERS
 
 def haversine_distance(lat1, lon1, lat2, lon2) -> float:
     """Calculate the distance (in meters) between two points on the earth."""
@@ -34,255 +299,669 @@ def haversine_distance(lat1, lon1, lat2, lon2) -> float:
 
     return EARTH_RADIUS_METERS * c
 
-def calculate_initial_heading(lat1, lon1, lat2, lon2):
-    """Calculate the initial bearing between two points (in radians)."""
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    
-    y = math.sin(lon2 - lon1) * math.cos(lat2)
-    x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(lon2 - lon1)
-    
-    return math.atan2(y, x)
-
-# --- Update energy_efficient_astar in main.py ---
-
-def energy_efficient_astar(start_id: int, goal_id: int, nodes_data: GraphData) -> Tuple[List[int], float]:
-    """Finds the path using physical distance adjusted by ENERGY_PENALTY_FACTOR (1.2)."""
-    
-    # Create a temporary graph where weights are adjusted for energy penalty
-    adjusted_adj = {}
-    for u, edges in nodes_data.graph_adj.items():
-        # Adjust the 'weight' field (cost) by the penalty factor
-        adjusted_adj[u] = [(v, w * ENERGY_PENALTY_FACTOR) for v, w in edges]
-
-    # Run A* on the adjusted graph. 
-    # NOTE: The base shortest_path_astar implementation is used, 
-    # but with the energy-penalized graph.
-    path, cost = shortest_path_astar(start_id, goal_id, nodes_data, adj_list=adjusted_adj)
-    
-    return path, cost
-
-
-# --- CRITICAL: Update shortest_path_astar to accept an optional custom adjacency list ---
-# (This allows us to reuse the A* logic for different modes)
-
-def shortest_path_astar(start_id: int, goal_id: int, nodes_data: GraphData, adj_list: Optional[Dict[int, List[Tuple[int, float]]]] = None) -> Tuple[List[int], float]:
-    """
-    Finds the shortest path using the provided adjacency list (or default).
-    """
-    adj = adj_list if adj_list is not None else nodes_data.graph_adj
-    
-    open_set = []
-    heapq.heappush(open_set, (0, start_id))
-    came_from = {}
-    g_score = {n['id']: float('inf') for n in nodes_data.nodes}
-    g_score[start_id] = 0
-
-    while open_set:
-        _, current = heapq.heappop(open_set)
-
-        if current == goal_id:
-            path = []
-            current_path_node = current
-            while current_path_node in came_from:
-                path.append(current_path_node)
-                current_path_node = came_from[current_path_node]
-            path.append(start_id)
-            return path[::-1], g_score[goal_id]
-
-        for neighbor, weight in adj.get(current, []): # Use the passed-in adj list
-            # ... (rest of A* logic remains the same)
-            tentative_g = g_score[current] + weight
-            if tentative_g < g_score[neighbor]:
-                came_from[neighbor] = current
-                g_score[neighbor] = tentative_g
-                
-                # Heuristic (straight-line physical distance to goal)
-                lat1, lon1 = nodes_data.node_coords[neighbor]
-                lat2, lon2 = nodes_data.node_coords[goal_id]
-                h = haversine_distance(lat1, lon1, lat2, lon2)
-                
-                f_score = tentative_g + h
-                heapq.heappush(open_set, (f_score, neighbor))
-    
-    return [], float('inf')
-
-# --- Update least_turn_astar in main.py ---
-# ... (near the top with other helpers like haversine_distance) ...
-
-
-
-
-# --- Define constants used in Least Turn ---
-# --- Define constants used in Least Turn ---
-TURN_PENALTY_METERS = 50.0  # Cost added for a sharp turn
-SHARP_TURN_THRESHOLD_DEG = 45 # Angle threshold for a turn to be considered 'sharp'
-NO_PREV_NODE = -1 
-
-# Make sure this helper function is defined correctly in your main.py!
-def calculate_initial_heading(lat1, lon1, lat2, lon2):
-    """Calculate the initial bearing between two points (in radians)."""
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    
-    y = math.sin(lon2 - lon1) * math.cos(lat2)
-    x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(lon2 - lon1)
-    
-    return math.atan2(y, x) 
-
-# --- Corrected least_turn_astar ---
-
-# --- 4. CORE ALGORITHMS AND HELPERS (Modify least_turn_astar) ---
-
-def least_turn_astar(start_id: int, goal_id: int, nodes_data: GraphData) -> Tuple[List[int], float, int]: # <<< CHANGED RETURN TYPE
-    """ Finds the path prioritizing minimal turns by adding a penalty. """
-    open_set = []
-    heapq.heappush(open_set, (0, start_id, NO_PREV_NODE))
-    g_score: Dict[Tuple[int, int], float] = {}
-    g_score[(start_id, NO_PREV_NODE)] = 0
-    final_parent: Dict[int, int] = {}
-    final_cost: Dict[int, float] = {start_id: 0}
-    
-    # NEW: Dictionary to track the minimum turn count to reach each node
-    turn_count_to_node: Dict[int, int] = {start_id: 0} 
-
-    while open_set:
-        _, current, previous = heapq.heappop(open_set)
-        current_state = (current, previous)
-        
-        if g_score[current_state] > final_cost.get(current, float('inf')): continue
-
-        if current == goal_id:
-            path = []
-            temp = current
-            while temp != start_id:
-                path.append(temp)
-                temp = final_parent.get(temp, NO_PREV_NODE)
-                if temp == NO_PREV_NODE: return [], final_cost[goal_id], 0 # Error path
-            path.append(start_id)
-            
-            # Return the path, the total cost, and the total turn count
-            return path[::-1], final_cost[goal_id], turn_count_to_node.get(goal_id, 0) # <<< CHANGED RETURN VALUE
-
-        for neighbor, base_weight in nodes_data.graph_adj.get(current, []):
-            if neighbor == previous and current != start_id: continue
-
-            turn_penalty = 0.0
-            is_turn = False # NEW: Flag to track if a turn occurred
-            
-            if previous != NO_PREV_NODE:
-                lat_prev, lon_prev = nodes_data.node_coords[previous]
-                lat_curr, lon_curr = nodes_data.node_coords[current]
-                lat_next, lon_next = nodes_data.node_coords[neighbor]
-
-                heading1 = calculate_initial_heading(lat_prev, lon_prev, lat_curr, lon_curr)
-                heading2 = calculate_initial_heading(lat_curr, lon_curr, lat_next, lon_next)
-                
-                angle_change = abs(heading2 - heading1)
-                if angle_change > math.pi: angle_change = 2 * math.pi - angle_change
-                
-                if math.degrees(angle_change) > SHARP_TURN_THRESHOLD_DEG:
-                    turn_penalty = TURN_PENALTY_METERS 
-                    is_turn = True # Set flag if turn is detected
-                    
-            cost = base_weight + turn_penalty
-            tentative_g = g_score.get(current_state, float('inf')) + cost
-            neighbor_state = (neighbor, current)
-            
-            # NEW: Calculate tentative turn count
-            current_turn_count = turn_count_to_node.get(current, 0)
-            tentative_turn_count = current_turn_count + (1 if is_turn else 0)
-
-            if tentative_g < g_score.get(neighbor_state, float('inf')):
-                g_score[neighbor_state] = tentative_g
-                
-                if tentative_g < final_cost.get(neighbor, float('inf')):
-                    final_cost[neighbor] = tentative_g
-                    final_parent[neighbor] = current 
-                    
-                    # Update turn count for the node on the best current path
-                    turn_count_to_node[neighbor] = tentative_turn_count # NEW LINE
-
-                lat_next, lon_next = nodes_data.node_coords[neighbor]
-                lat_goal, lon_goal = nodes_data.node_coords[goal_id]
-                h = haversine_distance(lat_next, lon_next, lat_goal, lon_goal)
-                
-                f_score = tentative_g + h
-                heapq.heappush(open_set, (f_score, neighbor, current))
-
-    return [], float('inf'), 0 # <<< CHANGED RETURN VALUE
-
-
-def load_and_prepare_graph(map_url: str):
-    """Fetches graph data, computes physical distances, and prepares for routing."""
-    if map_url == GraphData.last_url and GraphData.nodes:
-        # Cache hit: graph already loaded
-        return
+def haversine_distance_batch(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Vectorized haversine_distance: element-wise distances (in meters) between arrays of points."""
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    delta_phi = phi2 - phi1
+    delta_lambda = np.radians(np.subtract(lon2, lon1))
+
+    a = np.sin(delta_phi / 2)**2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2)**2
+    return EARTH_DIAMETER_METERS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def path_physical_distance(path_coords: Sequence[Tuple[float, float]]) -> float:
+    """Total haversine length (in meters) of a polyline given as (lat, lon) pairs."""
+    if len(path_coords) < 2:
+        return 0.0
+    coords = np.asarray(path_coords, dtype=np.float64)
+    return float(haversine_distance_batch(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1]).sum())
+
+def energy_efficient_astar(start_id: int, goal_id: int, nodes_data: GraphData,
+                           stats: Optional[SearchStats] = None, bidirectional: bool = False) -> Tuple[List[int], float]:
+    """
+    Finds the path using the least energy: ENERGY_PENALTY_FACTOR per meter,
+    plus ENERGY_CLIMB_COST per meter climbed and more on steep grades, from the
+    graph's precomputed energy_weights (see EnergyMode). Costs differ by
+    direction, so a route and its reverse can take different ways.
+    """
+    path_ids, cost, _ = _route_ids(EnergyMode(), start_id, goal_id, nodes_data, stats, bidirectional)
+    return path_ids, cost
+
+
+def shortest_path_astar(start_id: int, goal_id: int, nodes_data: GraphData, weight_factor: float = 1.0,
+                        stats: Optional[SearchStats] = None, bidirectional: bool = False) -> Tuple[List[int], float]:
+    """
+    Finds the shortest path over the graph's weights, each multiplied by
+    weight_factor as it is relaxed (see ShortestMode for the searches used).
+    """
+    path_ids, cost, _ = _route_ids(ShortestMode(weight_factor), start_id, goal_id, nodes_data, stats, bidirectional)
+    return path_ids, cost
+
+
+def least_turn_astar(start_id: int, goal_id: int, nodes_data: GraphData,
+                     stats: Optional[SearchStats] = None, bidirectional: bool = False) -> Tuple[List[int], float, int]:
+    """
+    Finds the path prioritizing minimal turns by adding TURN_PENALTY_METERS
+    per sharp turn (see LeastTurnMode). Returns (path_ids, cost, turn_count).
+    """
+    return _route_ids(LeastTurnMode(), start_id, goal_id, nodes_data, stats, bidirectional)
+
+
+def edge_headings(nodes_data: GraphData) -> array:
+    """
+    Initial bearing (radians) of every edge slot, computed in one vectorized
+    pass. GraphData does this once when it is built and keeps the result as
+    its headings array; use that rather than calling this again.
+    """
+    targets = np.frombuffer(nodes_data.targets, dtype=np.int64)
+    sources = targets[np.frombuffer(nodes_data.twins, dtype=np.int64)]
+    lat_rad = np.frombuffer(nodes_data.lat_rad, dtype=np.float64)
+    lon_rad = np.frombuffer(nodes_data.lon_rad, dtype=np.float64)
+    lat1, lat2 = lat_rad[sources], lat_rad[targets]
+    d_lon = lon_rad[targets] - lon_rad[sources]
+    y = np.sin(d_lon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(d_lon)
+    return _to_array(np.arctan2(y, x))
+
+
+# --- Routing modes ---
+
+class RoutingMode:
+    """
+    One way of costing routes, run on the shared search core (see
+    algorithms/search.py).
+
+    A mode names its per-slot costs, how the search expands (costs(),
+    expansion()) and a lower bound to guide it (heuristic()); route() and
+    one_to_many() run those, and modes override them to put their overlays
+    and bidirectional searches in front. units labels its costs in responses;
+    symmetric modes route the same both ways, so the route cache may answer
+    s -> t with a cached t -> s. Searches take and return dense indices.
+
+    register_mode() makes a mode available to every routing endpoint.
+    """
+    name = ""
+    units = ""
+    symmetric = False
+
+    def costs(self, graph: GraphData) -> Tuple[Sequence[float], float]:
+        """(per-slot costs, factor they are multiplied by) on graph."""
+        raise NotImplementedError
+
+    def expansion(self, graph: GraphData):
+        costs, factor = self.costs(graph)
+        return NodeExpansion(costs, factor)
+
+    def heuristic(self, graph: GraphData, goal: int, origin: int) -> Optional[Heuristic]:
+        """A consistent lower bound h(v) on the cost from v to goal, or None to search without one."""
+        return None
+
+    def route(self, graph: GraphData, start: int, goal: int, stats: Optional[SearchStats] = None,
+              bidirectional: bool = False) -> Tuple[List[int], float, int]:
+        """(index path, cost, turn_count) from start to goal; ([], inf, 0) when unreachable."""
+        return self.expansion(graph).search(graph, start, (goal,), self.heuristic(graph, goal, start), stats)[goal]
+
+    def one_to_many(self, graph: GraphData, source: int, targets: Sequence[int],
+                    stats: Optional[SearchStats] = None) -> Dict[int, Tuple[List[int], float, int]]:
+        """{target: (index path, cost, turn_count)} from one search tree, stopping once every target is settled."""
+        return self.expansion(graph).search(graph, source, targets, stats=stats)
+
+
+class ShortestMode(RoutingMode):
+    """
+    Distance times factor. Queries are answered from the contraction
+    hierarchy when there is one, else over the simplified overlay, else from
+    both ends when bidirectional. The heuristic is haversine, raised by the
+    ALT landmarks when there are some.
+    """
+    name = "shortest"
+    units = "meters"
+    symmetric = True
+
+    def __init__(self, factor: float = 1.0):
+        self.factor = factor
+
+    def costs(self, graph: GraphData) -> Tuple[Sequence[float], float]:
+        return graph.weights, self.factor
+
+    def heuristic(self, graph: GraphData, goal: int, origin: int) -> Optional[Heuristic]:
+        bound = lower_bound_to(graph, goal, origin)
+        if self.factor == 1.0:
+            return bound
+        factor = self.factor
+        return lambda v: bound(v) * factor # Scaled like the weights so it stays a lower bound
+
+    def route(self, graph: GraphData, start: int, goal: int, stats: Optional[SearchStats] = None,
+              bidirectional: bool = False) -> Tuple[List[int], float, int]:
+        if graph.contraction_hierarchy is not None:
+            path, cost = graph.contraction_hierarchy.query(start, goal, stats=stats)
+            return path, cost * self.factor, 0
+        if graph.simplified is not None:
+            path, cost = graph.simplified.shortest_path(start, goal, self.factor, lower_bound_to(graph, goal, start),
+                                                        stats=stats)
+            return path, cost, 0
+        if bidirectional:
+            path, cost = bidirectional_astar(graph, start, goal, weight_factor=self.factor, stats=stats)
+            return path, cost, 0
+        return super().route(graph, start, goal, stats)
+
+    def one_to_many(self, graph: GraphData, source: int, targets: Sequence[int],
+                    stats: Optional[SearchStats] = None) -> Dict[int, Tuple[List[int], float, int]]:
+        # CH queries are already far cheaper than growing a tree
+        ch = graph.contraction_hierarchy
+        if ch is None:
+            return super().one_to_many(graph, source, targets, stats)
+        results = {}
+        for target in targets:
+            path, cost = ch.query(source, target, stats=stats)
+            results[target] = (path, cost * self.factor, 0)
+        return results
+
+
+class EnergyMode(RoutingMode):
+    """
+    The graph's precomputed energy_weights: ENERGY_PENALTY_FACTOR per meter,
+    plus ENERGY_CLIMB_COST per meter climbed and more on steep grades.
+
+    The heuristic is energy_lower_bound(): haversine at the flat rate plus the
+    climb left to the goal (dropped when some nodes lack elevation), raised by
+    the energy_landmarks when ALT is on. Queries run over the simplified
+    overlay when there is one, else from both ends when bidirectional. On
+    maps without elevation every edge is flat, so this is the shortest mode
+    times ENERGY_PENALTY_FACTOR, with all its speed-ups. Not symmetric, as
+    climbing costs more than descending.
+    """
+    name = "energy_efficient"
+    units = "E-units"
+
+    flat = ShortestMode(ENERGY_PENALTY_FACTOR)
+
+    def costs(self, graph: GraphData) -> Tuple[Sequence[float], float]:
+        if graph.energy_weights is None:
+            return self.flat.costs(graph)
+        return graph.energy_weights, 1.0
+
+    def heuristic(self, graph: GraphData, goal: int, origin: int, toward: bool = True) -> Optional[Heuristic]:
+        if graph.energy_weights is None:
+            return self.flat.heuristic(graph, goal, origin)
+        climb_cost = ENERGY_CLIMB_COST if graph.complete_elevation else 0.0
+        return energy_lower_bound(graph, goal, origin, ENERGY_PENALTY_FACTOR, climb_cost, toward=toward)
+
+    def route(self, graph: GraphData, start: int, goal: int, stats: Optional[SearchStats] = None,
+              bidirectional: bool = False) -> Tuple[List[int], float, int]:
+        if graph.energy_weights is None:
+            return self.flat.route(graph, start, goal, stats, bidirectional)
+        if graph.simplified is not None and graph.simplified.costs is not None:
+            path, cost = graph.simplified.shortest_path(start, goal, 1.0, self.heuristic(graph, goal, start),
+                                                        stats=stats, directed=True)
+            return path, cost, 0
+        if bidirectional:
+            bounds = (self.heuristic(graph, goal, start), self.heuristic(graph, start, goal, toward=False))
+            path, cost = bidirectional_astar(graph, start, goal, stats=stats, bounds=bounds,
+                                             costs=(graph.energy_weights, graph.reverse_energy_weights))
+            return path, cost, 0
+        return super().route(graph, start, goal, stats)
+
+    def one_to_many(self, graph: GraphData, source: int, targets: Sequence[int],
+                    stats: Optional[SearchStats] = None) -> Dict[int, Tuple[List[int], float, int]]:
+        if graph.energy_weights is None:
+            return self.flat.one_to_many(graph, source, targets, stats)
+        return super().one_to_many(graph, source, targets, stats)
+
+
+class LeastTurnMode(RoutingMode):
+    """
+    Distance plus TURN_PENALTY_METERS per turn sharper than
+    SHARP_TURN_THRESHOLD_DEG, searched over directed edge slots so the turn
+    onto each edge is known (see EdgeExpansion). Turn penalties only add
+    cost, so the distance bounds of lower_bound_to() stay admissible. On a
+    graph with a simplified overlay the search runs over its collapsed chains
+    (with the same per-trackpoint turn costs) whatever bidirectional says.
+    Not symmetric: initial bearings aren't exactly reversible and U-turns are
+    only allowed at the start.
+    """
+    name = "least_turn"
+    units = "Weighted-Units"
+
+    turn_penalty = TURN_PENALTY_METERS
+    sharp_turn_rad = math.radians(SHARP_TURN_THRESHOLD_DEG)
+
+    def costs(self, graph: GraphData) -> Tuple[Sequence[float], float]:
+        return graph.weights, 1.0
+
+    def expansion(self, graph: GraphData):
+        return EdgeExpansion(graph.weights, graph.headings, self.turn_penalty, self.sharp_turn_rad)
+
+    def heuristic(self, graph: GraphData, goal: int, origin: int) -> Optional[Heuristic]:
+        return lower_bound_to(graph, goal, origin)
+
+    def route(self, graph: GraphData, start: int, goal: int, stats: Optional[SearchStats] = None,
+              bidirectional: bool = False) -> Tuple[List[int], float, int]:
+        if graph.simplified is not None:
+            return graph.simplified.least_turn_path(start, goal, self.turn_penalty, lower_bound_to(graph, goal, start),
+                                                    stats=stats)
+        if bidirectional:
+            return bidirectional_turn_search(graph, start, goal, self.turn_penalty, self.sharp_turn_rad,
+                                             graph.headings, stats=stats)
+        return super().route(graph, start, goal, stats)
+
+
+# Routing modes by name; membership is what the views validate "mode" against
+ROUTING_MODES: Dict[str, RoutingMode] = {}
+
+def register_mode(mode: RoutingMode) -> RoutingMode:
+    """Makes mode available to every routing endpoint under mode.name (replacing any mode of that name)."""
+    ROUTING_MODES[mode.name] = mode
+    return mode
 
+register_mode(ShortestMode())
+register_mode(EnergyMode())
+register_mode(LeastTurnMode())
+
+def routing_mode(mode: str) -> RoutingMode:
+    """The registered mode named mode; ValidationError for unknown names."""
     try:
-        response = requests.get(map_url)
-        response.raise_for_status() 
-        data = response.json()
+        return ROUTING_MODES[mode]
+    except KeyError:
+        raise ValidationError(f"Invalid routing mode: {mode}")
+
+
+def _route_ids(mode: RoutingMode, source_id: int, target_id: int, nodes_data: GraphData,
+               stats: Optional[SearchStats], bidirectional: bool) -> Tuple[List[int], float, int]:
+    path, cost, turns = mode.route(nodes_data, nodes_data.index_of[source_id], nodes_data.index_of[target_id],
+                                   stats, bidirectional)
+    return [nodes_data.node_ids[i] for i in path], cost, turns
+
+
+def route_by_mode(source_id: int, target_id: int, nodes_data: GraphData, mode: str,
+                  stats: Optional[SearchStats] = None, bidirectional: bool = False) -> Tuple[List[int], float, int]:
+    """Runs the search for mode between two node ids: (path_ids, cost, turn_count); turn_count is 0 outside least_turn."""
+    return _route_ids(routing_mode(mode), source_id, target_id, nodes_data, stats, bidirectional)
+
+
+# --- Many-to-many routing ---
+
+def one_to_many_routes(source_id: int, target_ids: Sequence[int], nodes_data: GraphData, mode: str,
+                       stats: Optional[SearchStats] = None) -> Dict[int, Tuple[List[int], float, int]]:
+    """
+    Routes from one source to several targets as {target_id: (path_ids, cost, turn_count)}.
+
+    All targets share a single search tree from the source, which stops once
+    the last target is settled (or, for modes with a contraction hierarchy,
+    one CH query per pair). Unreachable targets get ([], inf, 0).
+    """
+    routing = routing_mode(mode)
+    source = nodes_data.index_of[source_id]
+    targets = {nodes_data.index_of[target_id] for target_id in target_ids}
+    node_ids = nodes_data.node_ids
+    tree = routing.one_to_many(nodes_data, source, targets, stats)
+    return {
+        node_ids[target]: ([node_ids[i] for i in path], cost, turns)
+        for target, (path, cost, turns) in tree.items()
+    }
+
+
+# --- Coordinate lookups ---
+
+def nearest_nodes(nodes_data: GraphData, lat: float, lon: float, k: int = 1,
+                  radius: Optional[float] = None) -> List[Tuple[int, float]]:
+    """
+    The nodes closest to (lat, lon) as (node_id, meters), nearest first: the k
+    nearest, or with radius, up to k of those within radius meters.
+    """
+    index = nodes_data.spatial_index()
+    found = index.nearest(lat, lon, k) if radius is None else index.within(lat, lon, radius, limit=k)
+    return [(nodes_data.node_ids[i], distance) for i, distance in found]
+
+
+def nearest_edge(nodes_data: GraphData, lat: float, lon: float,
+                 max_distance: Optional[float] = None) -> Optional[EdgeSnap]:
+    """The closest point on any edge to (lat, lon) (u/v as dense indices), or None beyond max_distance meters."""
+    return nodes_data.spatial_index().nearest_edge(lat, lon, max_distance)
+
+
+def route_between_snaps(source: Union[int, EdgeSnap], target: Union[int, EdgeSnap], nodes_data: GraphData,
+                        mode: str, stats: Optional[SearchStats] = None,
+                        bidirectional: bool = False) -> Tuple[List[int], float, int]:
+    """
+    Routes between two endpoints that are each a node id or a point on an edge
+    (a virtual node splitting the edge). Returns (path_ids, cost, turn_count)
+    where path_ids are the real nodes passed through, possibly none when both
+    points lie on the same edge.
+
+    Moving along an edge from a point costs the matching fraction of the
+    edge's cost in that direction (its weight times the mode's factor, or its
+    energy cost, which assumes a constant grade along the edge), so the best
+    of up to four node-to-node routes is exact for shortest /
+    energy_efficient. For least_turn the turn onto and off the split edges
+    isn't charged.
+    """
+    routing = routing_mode(mode)
+    weights, factor = routing.costs(nodes_data)
+    twins, node_ids = nodes_data.twins, nodes_data.node_ids
+
+    def ends(point, leaving: bool):
+        if isinstance(point, EdgeSnap):
+            forward, backward = weights[point.slot] * factor, weights[twins[point.slot]] * factor
+            if not leaving:
+                forward, backward = backward, forward
+            return [(node_ids[point.u], point.fraction * backward), (node_ids[point.v], (1 - point.fraction) * forward)]
+        return [(point, 0.0)]
+
+    best: Tuple[List[int], float, int] = ([], math.inf, 0)
+    if isinstance(source, EdgeSnap) and isinstance(target, EdgeSnap):
+        # Both on one edge: straight along it, unless a way round through its ends is cheaper
+        along = None
+        if (source.u, source.v) == (target.u, target.v):
+            along = target.fraction - source.fraction
+        elif (source.u, source.v) == (target.v, target.u):
+            along = (1 - target.fraction) - source.fraction
+        if along is not None:
+            slot = source.slot if along >= 0 else twins[source.slot]
+            best = ([], abs(along) * weights[slot] * factor, 0)
+
+    for source_id, head in ends(source, True):
+        for target_id, tail in ends(target, False):
+            if source_id == target_id:
+                path_ids, cost, turns = [source_id], 0.0, 0
+            else:
+                path_ids, cost, turns = _route_ids(routing, source_id, target_id, nodes_data, stats, bidirectional)
+                if not path_ids:
+                    continue
+            if head + cost + tail < best[1]:
+                best = (path_ids, head + cost + tail, turns)
+    return best
+
+
+def load_and_prepare_graph(map_url: str) -> GraphData:
+    """Returns the graph for map_url, fetching and indexing it only on a cache miss."""
+    return graph_cache.get_or_load(map_url, _fetch_and_build_graph)
+
+
+def load_disk_cached_graph(map_url: str) -> Optional[GraphData]:
+    """
+    map_url's graph from the local disk cache alone, without asking its server,
+    prepared for routing; None when it isn't cached. For replaying requests offline.
+    """
+    cache_path = _disk_cache_path(map_url)
+    if cache_path is None or not os.path.exists(cache_path):
+        return None
+    graph = GraphData(**map_graph_file(cache_path), source_url=map_url)
+    prepare_graph(graph)
+    return graph.freeze()
+
+
+def invalidate_graph(map_url: Optional[str] = None) -> int:
+    """
+    Drops map_url (or every map when None) from the graph cache so the next
+    request reloads it, along with its cached routes.
+    """
+    route_cache.invalidate(map_url)
+    _remove_disk_cached_graph(map_url)
+    return graph_cache.invalidate(map_url)
+
+
+def _fetch_and_build_graph(map_url: str) -> GraphData:
+    """
+    Loads the graph for map_url and prepares it for routing.
+
+    The local disk cache (ROUTING_GRAPH_DISK_CACHE_DIR) is a read-through cache
+    in front of map_url: a cached copy is revalidated with a conditional GET
+    (ETag / Last-Modified) and memory-mapped as-is when the server answers 304
+    Not Modified, or when the server can't be reached. Content-addressed
+    artifacts never change, so their cached copies are used without asking.
+    Maps kept by the local storage backend are read from disk, not fetched.
+    Binary graph files are used as-is, JSON maps are indexed, and either way
+    the result is written to the disk cache so later loads (and other worker
+    processes) can map it.
+    """
+    cache_path = _disk_cache_path(map_url)
+    cached = cache_path is not None and os.path.exists(cache_path)
+    local_path = get_storage().local_path(map_url)
+
+    def fetch(known_validators):
+        with stage("fetch"):
+            if local_path is not None:
+                with open(local_path, 'rb') as f:
+                    return f.read(), {}
+            return _fetch_map(map_url, known_validators)
+
+    content = None
+    validators: Dict[str, str] = {}
+    if not cached:
+        content, validators = fetch(None)
+    elif local_path is None and not is_content_addressed_url(map_url):
+        try:
+            content, validators = fetch(_read_cache_validators(cache_path))
+        except ValidationError as e:
+            logger.warning("Using the cached copy of %s: %s", map_url, e.message)
+
+    graph = None
+    if content is None:
+        try:
+            with stage("fetch"):
+                graph = GraphData(**map_graph_file(cache_path), source_url=map_url)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable cached graph %s: %s", cache_path, e)
+            content, validators = fetch(None)
+
+    if graph is None:
+        if is_binary_graph(content):
+            try:
+                read_graph_arrays(content) # validate before caching
+            except ValueError as e:
+                raise ValidationError(f"Invalid binary graph file: {e}")
+        else:
+            try:
+                with stage("parse"):
+                    data = json.loads(content)
+            except ValueError as e:
+                raise ValidationError(f"Invalid graph JSON: {e}")
+            with stage("index"):
+                content = encode_graph(build_graph_data(data, source_url=map_url))
+
+        with stage("index"):
+            if cache_path:
+                write_graph_file(content, cache_path)
+                _write_cache_validators(cache_path, validators)
+                graph = GraphData(**map_graph_file(cache_path), source_url=map_url)
+            else:
+                graph = GraphData(**read_graph_arrays(content), source_url=map_url)
+
+    with stage("index"):
+        prepare_graph(graph)
+    return graph.freeze()
+
+
+def _fetch_map(map_url: str, validators: Optional[Dict[str, str]]) -> Tuple[Optional[bytes], Dict[str, str]]:
+    """
+    GETs map_url, conditionally when validators (from an earlier response) are
+    given. Returns (content, validators of the response), with content None
+    when the server says the cached copy is still current.
+    """
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    try:
+        response = http_get(map_url, headers=headers)
+        if response.status_code == 304 and validators:
+            return None, validators
+        response.raise_for_status()
     except requests.RequestException as e:
         raise ValidationError(f"Failed to fetch graph data from URL: {e}")
 
-    # Reset cache and populate new data
-    GraphData.nodes = data.get('nodes', [])
-    GraphData.graph_adj = {}
-    GraphData.node_coords = {}
-    GraphData.physical_dist_adj = {}
-    
-    # 1. Map Node ID to Coordinates (and vice versa)
-    for node in GraphData.nodes:
-        node_id = node['id']
-        GraphData.node_coords[node_id] = (node['lat'], node['lon'])
-
-    # 2. Build Adjacency List (A* graph input) and physical distance map
-    for edge in data.get('edges', []):
-        u, v, weight = edge['u'], edge['v'], edge['weight']
-
-        # Determine the cost/weight for shortest path (using the provided 'weight' field, assumed to be distance)
-        cost = weight 
-        
-        # Build directed graph adjacency list (for A*)
-        if u not in GraphData.graph_adj: GraphData.graph_adj[u] = []
-        if v not in GraphData.graph_adj: GraphData.graph_adj[v] = []
-        
-        GraphData.graph_adj[u].append((v, cost))
-        GraphData.graph_adj[v].append((u, cost)) # Assuming undirected graph for simplicity
-
-    GraphData.last_url = map_url
+    fresh = {}
+    if response.headers.get("ETag"):
+        fresh["etag"] = response.headers["ETag"]
+    if response.headers.get("Last-Modified"):
+        fresh["last_modified"] = response.headers["Last-Modified"]
+    return response.content, fresh
+
+
+def _read_cache_validators(cache_path: str) -> Dict[str, str]:
+    try:
+        with open(cache_path + '.meta', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache_validators(cache_path: str, validators: Dict[str, str]) -> None:
+    """Stores the response's ETag / Last-Modified next to the cached graph (written after it, atomically)."""
+    meta_path = cache_path + '.meta'
+    if not validators:
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        return
+    write_graph_file(json.dumps(validators).encode('utf-8'), meta_path)
+
+
+def _disk_cache_path(map_url: str) -> Optional[str]:
+    """Where map_url's binary graph is kept on disk, or None if the disk cache is off."""
+    directory = getattr(settings, 'ROUTING_GRAPH_DISK_CACHE_DIR', None)
+    if not directory:
+        return None
+    return os.path.join(directory, hashlib.sha256(map_url.encode('utf-8')).hexdigest() + '.wpg')
+
+
+def _remove_disk_cached_graph(map_url: Optional[str]) -> None:
+    """Deletes map_url's disk-cached graph (every one when None). Open mappings stay valid."""
+    directory = getattr(settings, 'ROUTING_GRAPH_DISK_CACHE_DIR', None)
+    if not directory or not os.path.isdir(directory):
+        return
+    if map_url is not None:
+        cache_path = _disk_cache_path(map_url)
+        paths = [cache_path, cache_path + '.meta']
+    else:
+        paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(('.wpg', '.wpg.meta'))]
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def prepare_graph(graph: GraphData) -> None:
+    """Runs the optional per-map preprocessing enabled in settings, before the graph is shared."""
+    if getattr(settings, 'ROUTING_SIMPLIFY_CHAINS', False):
+        # Maps with few degree-2 nodes (street grids) aren't worth a second copy. Every
+        # node without exactly two edge slots stays core, which rules most out before building.
+        degrees = np.diff(np.frombuffer(graph.offsets, dtype=np.int64))
+        if np.count_nonzero(degrees != 2) <= graph.node_count * SIMPLIFY_MAX_CORE_FRACTION:
+            simplified = SimplifiedGraph.build(graph, graph.headings, math.radians(SHARP_TURN_THRESHOLD_DEG),
+                                               graph.energy_weights, SEARCH_SCRATCH_SETS)
+            if simplified.core_count <= graph.node_count * SIMPLIFY_MAX_CORE_FRACTION:
+                graph.simplified = simplified
+    if getattr(settings, 'ROUTING_CONTRACTION_HIERARCHIES', False):
+        graph.contraction_hierarchy = ContractionHierarchy.build(graph)
+    landmark_count = getattr(settings, 'ROUTING_ALT_LANDMARKS', 0)
+    if landmark_count > 0:
+        graph.landmarks = Landmarks.build(graph, landmark_count)
+        if graph.energy_weights is not None:
+            graph.energy_landmarks = Landmarks.build(graph, landmark_count, graph.energy_weights,
+                                                     graph.reverse_energy_weights)
+
+
+def build_graph_data(data: Dict[str, Any], source_url: str = "") -> GraphData:
+    """Indexes a parsed {'nodes': [...], 'edges': [...]} graph payload into a new CSR GraphData."""
+    nodes = data.get('nodes', [])
+    edges = data.get('edges', [])
+
     # Status check
-    if not GraphData.nodes:
+    if not nodes:
         raise ValidationError("Graph data loaded but is empty.")
 
+    # 1. Assign dense indices and pack coordinates and elevations, NaN where a node
+    #    has no 'ele' (a repeated id keeps its first index but takes the last
+    #    values, like the old dict did)
+    node_ids = array('q')
+    lat = array('d')
+    lon = array('d')
+    elevation = array('d')
+    index_of: Dict[int, int] = {}
+    for node in nodes:
+        node_id = node['id']
+        ele = node.get('ele')
+        ele = math.nan if ele is None else ele
+        i = index_of.get(node_id)
+        if i is None:
+            index_of[node_id] = len(node_ids)
+            node_ids.append(node_id)
+            lat.append(node['lat'])
+            lon.append(node['lon'])
+            elevation.append(ele)
+        else:
+            lat[i], lon[i], elevation[i] = node['lat'], node['lon'], ele
+
+    n = len(node_ids)
+
+    # 2. Resolve edge endpoints; edges that reference unknown nodes can't be routed over
+    edge_u = array('q')
+    edge_v = array('q')
+    edge_w = array('d')
+    missing_weight = False
+    for edge in edges:
+        u = index_of.get(edge['u'])
+        v = index_of.get(edge['v'])
+        if u is None or v is None:
+            continue
+        edge_u.append(u)
+        edge_v.append(v)
+        # The provided 'weight' field is assumed to be distance
+        weight = edge.get('weight')
+        if weight is None:
+            missing_weight = True
+            weight = math.nan
+        edge_w.append(weight)
+
+    # Edges without a 'weight' get their haversine length, computed in one batch
+    if missing_weight:
+        w_np = np.frombuffer(edge_w, dtype=np.float64).copy()
+        missing = np.isnan(w_np)
+        u_np = np.frombuffer(edge_u, dtype=np.int64)[missing]
+        v_np = np.frombuffer(edge_v, dtype=np.int64)[missing]
+        lat_np = np.frombuffer(lat, dtype=np.float64)
+        lon_np = np.frombuffer(lon, dtype=np.float64)
+        w_np[missing] = haversine_distance_batch(lat_np[u_np], lon_np[u_np], lat_np[v_np], lon_np[v_np])
+        edge_w = _to_array(w_np)
+
+    # 3. Count degrees and build CSR offsets (undirected: each edge fills two slots)
+    offsets = array('q', [0]) * (n + 1)
+    for u in edge_u: offsets[u + 1] += 1
+    for v in edge_v: offsets[v + 1] += 1
+    for i in range(n):
+        offsets[i + 1] += offsets[i]
+
+    # 4. Fill neighbor and weight slots, preserving the input edge order per node,
+    #    and link the two slots of each edge as twins
+    targets = array('q', [0]) * offsets[n]
+    weights = array('d', [0.0]) * offsets[n]
+    twins = array('q', [0]) * offsets[n]
+    cursor = offsets[:n]
+    for u, v, w in zip(edge_u, edge_v, edge_w):
+        a = cursor[u]; cursor[u] += 1
+        b = cursor[v]; cursor[v] += 1
+        targets[a] = v; weights[a] = w; twins[a] = b
+        targets[b] = u; weights[b] = w; twins[b] = a
+
+    return GraphData(node_ids, lat, lon, offsets, targets, weights, twins, source_url=source_url, elevation=elevation)
+
+
+def parse_gpx_content(gpx_content: Union[bytes, BinaryIO]) -> Iterator[List[TrackPoint]]:
+    """
+    Parses raw GPX content (bytes or a binary file object) into track segments,
+    yielded one at a time as lists of (lat, lon, ele) points.
 
-def parse_gpx_content(gpx_content: bytes) -> List[List[Tuple[float, float]]]:
-    """Parses raw GPX content (bytes) into a list of track segments."""
+    Parsing is streamed (see gpx_parser.iter_gpx_segments), so the caller can
+    consume segments while the rest of the file is still being read.
+    Raises ValidationError if the file isn't valid XML.
+    """
     try:
-        print("Parsing GPX content...")
-        print(gpx_content.decode('utf-8', errors='ignore'))  # Print GPX content for debugging
-        # Use io.BytesIO to treat the bytes content as a file
-        tree = ET.parse(io.BytesIO(gpx_content))
-        root = tree.getroot()
-        # Handle GPX namespaces
-        ns = {'gpx': 'http://www.topografix.com/GPX/1/1'}
-        tracks = []
-
-        for trk in root.findall('.//gpx:trk', ns):
-            for trkseg in trk.findall('.//gpx:trkseg', ns):
-                segment = []
-                for trkpt in trkseg.findall('.//gpx:trkpt', ns):
-                    lat = float(trkpt.get('lat'))
-                    lon = float(trkpt.get('lon'))
-                    segment.append((lat, lon))
-                
-                if segment:
-                    tracks.append(segment)
-        
-        print("Finished parsing GPX content.")
-        print(tracks)
-        print("End of parsed tracks.")
-        return tracks
+        yield from iter_gpx_segments(gpx_content)
     except ET.ParseError:
         raise ValidationError("Invalid GPX file format.")
-    except Exception as e:
+    except ValueError as e:
         raise ValidationError(f"Error parsing GPX content: {e}")
@@ -0,0 +1,150 @@
+import math
+import threading
+from array import array
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+# Scratch sets kept per graph unless the graph is told otherwise (see ScratchPool)
+DEFAULT_SCRATCH_SETS = 4
+
+
+class SearchState:
+    """
+    Per-node A* bookkeeping arrays that are reused across queries on one graph.
+
+    Instead of clearing the arrays before every search (O(V)), each search bumps
+    `generation`; an entry is only valid when stamp[i] == generation, so
+    untouched nodes read as "unreached" for free. A state must only be used by
+    one search at a time, which is why graphs hand them out through a ScratchPool.
+    """
+
+    # g_score, came_from and stamp: 8 bytes each per entry
+    BYTES_PER_ENTRY = 24
+
+    def __init__(self, size: int):
+        self.size = size
+        self.g_score = array('d', [math.inf]) * size
+        self.came_from = array('q', [-1]) * size
+        self.stamp = array('q', [0]) * size
+        self.generation = 0
+
+    def begin(self) -> int:
+        """Starts a new search and returns its generation number."""
+        self.generation += 1
+        return self.generation
+
+    def g(self, index: int) -> float:
+        """Best known cost of index in the current search (inf if unreached)."""
+        if self.stamp[index] != self.generation:
+            return math.inf
+        return self.g_score[index]
+
+    def path_to(self, index: int):
+        """Dense indices from the search root to index, following came_from."""
+        path = [index]
+        parent = self.came_from[index]
+        while parent != -1:
+            path.append(parent)
+            parent = self.came_from[parent]
+        path.reverse()
+        return path
+
+
+class ScratchSet:
+    """The SearchStates one search uses, by (kind, slot); each is allocated on first use."""
+
+    def __init__(self):
+        self.states: Dict[Tuple[str, int], SearchState] = {}
+
+    def state(self, kind: str, slot: int, size: int) -> SearchState:
+        state = self.states.get((kind, slot))
+        if state is None:
+            state = self.states[kind, slot] = SearchState(size)
+        return state
+
+
+class ScratchPool:
+    """
+    At most limit ScratchSets for one graph, which searches check out while they run.
+
+    Giving every thread its own states would keep one set of O(V + E) arrays
+    alive per thread that ever searched the graph; a pool bounds them by the
+    number of searches running at once instead, and a search arriving while
+    every set is out waits for one to come back. Checkouts are reentrant, so
+    a search made while the thread already holds a set (e.g. the per-segment
+    searches of one query) shares it.
+    """
+
+    def __init__(self, limit: int = DEFAULT_SCRATCH_SETS):
+        if limit < 1:
+            raise ValueError(f"A scratch pool needs at least one set, got {limit}.")
+        self.limit = limit
+        self._free: List[ScratchSet] = []
+        self._created = 0
+        self._available = threading.Condition()
+        self._local = threading.local()
+
+    @contextmanager
+    def checkout(self) -> Iterator[ScratchSet]:
+        held = getattr(self._local, "scratch", None)
+        if held is not None:
+            yield held
+            return
+
+        with self._available:
+            while not self._free and self._created >= self.limit:
+                self._available.wait()
+            if self._free:
+                scratch = self._free.pop()
+            else:
+                scratch = ScratchSet()
+                self._created += 1
+        self._local.scratch = scratch
+        try:
+            yield scratch
+        finally:
+            self._local.scratch = None
+            with self._available:
+                self._free.append(scratch)
+                self._available.notify()
+
+    def current(self) -> ScratchSet:
+        """The set this thread has checked out; searches must run inside checkout()."""
+        scratch = getattr(self._local, "scratch", None)
+        if scratch is None:
+            raise RuntimeError("Search state requested outside of a scratch checkout.")
+        return scratch
+
+
+class SearchStats:
+    """
+    Counters a search fills in when the caller passes one in (stats=...).
+
+    nodes_expanded counts settled search states (nodes, or edge slots for
+    turn-aware searches); nodes_popped also counts stale heap entries; pushes
+    counts every entry that went into a priority queue; heap_peak is the
+    largest size any of the search's queues reached.
+    """
+
+    def __init__(self):
+        self.nodes_expanded = 0
+        self.nodes_popped = 0
+        self.pushes = 0
+        self.heap_peak = 0
+
+    def record(self, expanded: int, skipped: int, left: int, heap_peak: int) -> None:
+        """
+        Adds a finished search's counters (several searches sharing one stats
+        object, as in route_between_snaps, are summed). Searches only count
+        expansions and skipped pops (stale entries, or the pop that ended the
+        search) in their loop; every pushed entry was either popped or is among
+        the left ones still queued, so pushes need no counting of their own.
+        """
+        self.nodes_expanded += expanded
+        self.nodes_popped += expanded + skipped
+        self.pushes += expanded + skipped + left
+        self.heap_peak = max(self.heap_peak, heap_peak, left)
+
+    def as_dict(self):
+        return {"nodes_expanded": self.nodes_expanded, "nodes_popped": self.nodes_popped,
+                "pushes": self.pushes, "heap_peak": self.heap_peak}
@@ -0,0 +1,129 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+from typing import BinaryIO, Optional
+from urllib.parse import unquote, urlparse
+
+from django.conf import settings
+
+from .http_session import http_head
+
+# Keys of content-addressed artifacts: <kind>/<sha256 of the GPX file>[-<build params>].<ext>
+CONTENT_ADDRESSED_KEY = re.compile(r'(?:^|/)(?:raw_gpx|json_graph|bin_graph)/[0-9a-f]{64}(?:-[\w.]+)?\.\w+$')
+
+
+def is_content_addressed_url(url: str) -> bool:
+    """True for URLs of artifacts named by the hash of their content, which therefore never change."""
+    return bool(CONTENT_ADDRESSED_KEY.search(urlparse(url).path))
+
+
+class Storage:
+    """
+    Where uploaded GPX files and the maps built from them are kept.
+
+    Keys are slash-separated relative paths such as 'json_graph/<sha256>-snap3m.json'.
+    save() returns the URL the artifact can be fetched (or loaded as map_url) from.
+    """
+
+    def save(self, fileobj: BinaryIO, key: str) -> str:
+        raise NotImplementedError
+
+    def url_if_exists(self, key: str) -> Optional[str]:
+        """URL of key if it has already been stored, else None. May raise when the backend can't be reached."""
+        raise NotImplementedError
+
+    def local_path(self, url: str) -> Optional[str]:
+        """The file behind url if this storage keeps it on local disk (so it needn't be fetched), else None."""
+        return None
+
+
+class LocalStorage(Storage):
+    """
+    Artifacts as plain files under directory, served from base_url (see the
+    storage_file view). Useful for single-host deployments, development and
+    tests; map_urls pointing into it are read straight from disk.
+    """
+
+    def __init__(self, directory: str, base_url: str):
+        self.directory = os.path.abspath(directory)
+        self.base_url = base_url if base_url.endswith('/') else base_url + '/'
+
+    def save(self, fileobj: BinaryIO, key: str) -> str:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written next to the target and renamed, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                shutil.copyfileobj(fileobj, out, 1024 * 1024)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self.base_url + key
+
+    def url_if_exists(self, key: str) -> Optional[str]:
+        return self.base_url + key if os.path.isfile(self.path(key)) else None
+
+    def local_path(self, url: str) -> Optional[str]:
+        url_path, base_path = unquote(urlparse(url).path), urlparse(self.base_url).path
+        if not url_path.startswith(base_path):
+            return None
+        try:
+            path = self.path(url_path[len(base_path):])
+        except ValueError:
+            return None
+        return path if os.path.isfile(path) else None
+
+    def path(self, key: str) -> str:
+        """File path of key; raises ValueError for keys that would escape the storage directory."""
+        path = os.path.abspath(os.path.join(self.directory, key))
+        if not path.startswith(self.directory + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+
+class CloudinaryStorage(Storage):
+    """Artifacts as raw Cloudinary assets under folder/ (credentials from the cloudinary config in views)."""
+
+    def __init__(self, folder: str = "gpx_graphs"):
+        self.folder = folder
+
+    def save(self, fileobj: BinaryIO, key: str) -> str:
+        import cloudinary.uploader
+        result = cloudinary.uploader.upload(
+            fileobj,
+            resource_type="raw",
+            public_id=f"{self.folder}/{key}",
+            overwrite=True
+        )
+        return result['secure_url']
+
+    def url_if_exists(self, key: str) -> Optional[str]:
+        # A HEAD on the delivery URL: no Admin API call, so no API rate limit
+        import cloudinary.utils
+        url, _ = cloudinary.utils.cloudinary_url(f"{self.folder}/{key}", resource_type="raw", secure=True)
+        response = http_head(url, allow_redirects=True)
+        return url if response.status_code == 200 else None
+
+
+_storage_lock = threading.Lock()
+_storage: Optional[Storage] = None
+
+
+def get_storage() -> Storage:
+    """The backend selected by ROUTING_STORAGE_BACKEND ('cloudinary' or 'local'), created once per process."""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            backend = getattr(settings, 'ROUTING_STORAGE_BACKEND', 'cloudinary')
+            if backend == 'local':
+                _storage = LocalStorage(settings.ROUTING_STORAGE_LOCAL_DIR, settings.ROUTING_STORAGE_LOCAL_URL)
+            elif backend == 'cloudinary':
+                _storage = CloudinaryStorage()
+            else:
+                raise ValueError(f"Unknown ROUTING_STORAGE_BACKEND: {backend}")
+        return _storage
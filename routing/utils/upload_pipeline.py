@@ -0,0 +1,397 @@
+import contextvars
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.forms import ValidationError
+
+from .metrics import add_stage, stage
+from .response_encoding import write_json
+from .storage import Storage, get_storage
+
+# --- CPU-bound conversion (runs in a worker process) ---
+
+def _init_worker() -> None:
+    """Worker processes started with 'spawn' haven't set up Django yet."""
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wayplot_project.settings')
+    django.setup()
+
+
+def convert_gpx_file(path: str, snap_tolerance_m: float) -> Tuple[str, Optional[bytes], Dict[str, float]]:
+    """
+    Parses the GPX file at path into a map: returns (path of the JSON map,
+    binary graph bytes, seconds spent per stage).
+
+    The JSON is streamed to a temporary file rather than built as one string
+    (and pickled back from the worker); the caller deletes it. The binary copy
+    is optional (None if it couldn't be encoded). Raises ValidationError for
+    GPX files that aren't valid or have no track.
+    """
+    from .graph_builder import build_graph
+    from .graph_format import encode_graph
+    from .routingUtil import build_graph_data, parse_gpx_content
+
+    # Parsing and building are interleaved (segments are consumed as they are read), so both count as "parse"
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        graph_data = build_graph(parse_gpx_content(f), snap_tolerance_m=snap_tolerance_m)
+    if not graph_data["edges"]:
+        raise ValidationError("GPX file contained no valid track segments.")
+    parsed = time.perf_counter()
+
+    # Compact separators: the map is read by programs, and indent=2 made it about twice the size
+    fd, json_path = tempfile.mkstemp(suffix='.json', prefix='map-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            write_json(graph_data, out)
+    except BaseException:
+        os.remove(json_path)
+        raise
+    encoded = time.perf_counter()
+    try:
+        bin_bytes = encode_graph(build_graph_data(graph_data))
+    except Exception as e:
+        print(f"Binary Graph Encode Error: {e}")
+        bin_bytes = None
+    timings = {"parse": parsed - started, "encode": encoded - parsed, "index": time.perf_counter() - encoded}
+    return json_path, bin_bytes, timings
+
+
+# --- Worker pools (created on first use, shared by every upload in this process) ---
+
+_pools_lock = threading.Lock()
+_cpu_pool: Optional[Executor] = None
+_io_pool: Optional[ThreadPoolExecutor] = None
+_job_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _cpu_executor() -> Executor:
+    """Process pool for parsing and graph building; a thread pool when ROUTING_UPLOAD_PROCESS_WORKERS is 0."""
+    global _cpu_pool
+    with _pools_lock:
+        if _cpu_pool is None:
+            workers = getattr(settings, 'ROUTING_UPLOAD_PROCESS_WORKERS', 2)
+            if workers > 0:
+                _cpu_pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            else:
+                _cpu_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gpx-convert')
+        return _cpu_pool
+
+
+def _io_executor() -> ThreadPoolExecutor:
+    """Thread pool for the blocking storage uploads."""
+    global _io_pool
+    with _pools_lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=getattr(settings, 'ROUTING_UPLOAD_IO_WORKERS', 4),
+                                          thread_name_prefix='gpx-upload')
+        return _io_pool
+
+
+def _job_executor() -> ThreadPoolExecutor:
+    """Threads that drive whole uploads: background jobs and requests awaiting their result."""
+    global _job_pool
+    with _pools_lock:
+        if _job_pool is None:
+            _job_pool = ThreadPoolExecutor(max_workers=getattr(settings, 'ROUTING_UPLOAD_IO_WORKERS', 4),
+                                           thread_name_prefix='gpx-job')
+        return _job_pool
+
+
+def _reset_cpu_executor(broken: Executor) -> None:
+    """A worker process died (e.g. killed for memory): drop the pool so the next upload starts a new one."""
+    global _cpu_pool
+    with _pools_lock:
+        if _cpu_pool is broken:
+            _cpu_pool = None
+    broken.shutdown(wait=False)
+
+
+# --- Pipeline ---
+
+class UploadError(Exception):
+    """A storage upload failed; the message is safe to return to the client."""
+
+
+class RetryableUploadError(UploadError):
+    """A server-side failure that a later retry of the same upload may get past (e.g. a worker process died)."""
+
+
+def spool_upload(uploaded_file) -> Tuple[str, str]:
+    """
+    Copies an uploaded file to a private temporary file; returns (path, sha256 hex digest).
+
+    Django deletes its own temporary upload when the request ends, but the
+    pipeline (especially a background job) can outlive the request. The
+    digest is computed in the same pass and names every artifact of the upload.
+    The caller owns the copy and passes it to process_gpx_upload(), which deletes it.
+    """
+    digest = hashlib.sha256()
+    fd, path = tempfile.mkstemp(suffix='.gpx', prefix='upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            uploaded_file.seek(0)
+            for chunk in iter(lambda: uploaded_file.read(1024 * 1024), b''):
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def artifact_keys(digest: str, snap_tolerance_m: float) -> Dict[str, str]:
+    """
+    Storage keys for the artifacts of a GPX file with this content hash.
+
+    Maps also depend on the snap tolerance they were built with, so it is part
+    of their keys; the same file uploaded with another tolerance is rebuilt.
+    """
+    build = f"{digest}-snap{snap_tolerance_m:g}m"
+    return {
+        "gpx": f"raw_gpx/{digest}.gpx",
+        "json": f"json_graph/{build}.json",
+        "bin": f"bin_graph/{build}.wpg",
+    }
+
+
+# Uploads being processed, by JSON map key: identical files arriving together are built once
+_in_flight_lock = threading.Lock()
+_in_flight: Dict[Tuple[int, str], Future] = {}
+
+
+def process_gpx_upload(path: str, digest: str, storage: Optional[Storage] = None,
+                       snap_tolerance_m: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Stores the GPX file at path (with sha256 digest) and the map built from it;
+    returns their URLs.
+
+    Artifacts are content-addressed: when the map for this content is already
+    in storage the file isn't parsed or uploaded again, and identical uploads
+    running at the same time share one build. Otherwise the raw GPX upload
+    runs while the file is converted in a worker process, and the JSON and
+    binary maps are then uploaded side by side.
+
+    Blocks until everything is done; path is deleted once nothing reads it.
+    Raises ValidationError for a bad GPX file, UploadError when a required
+    upload fails (the binary map is optional: its URL is None if it failed)
+    and RetryableUploadError when the converter process died.
+    """
+    storage = storage or get_storage()
+    if snap_tolerance_m is None:
+        snap_tolerance_m = settings.ROUTING_GPX_SNAP_TOLERANCE_METERS
+    keys = artifact_keys(digest, snap_tolerance_m)
+
+    flight_key = (id(storage), keys["json"])
+    with _in_flight_lock:
+        leader = flight_key not in _in_flight
+        if leader:
+            flight = _in_flight[flight_key] = Future()
+        else:
+            flight = _in_flight[flight_key]
+
+    if not leader:
+        _remove(path)
+        result = flight.result()
+        return {**result, "deduplicated": True}
+
+    try:
+        result = _store_artifacts(path, keys, storage, snap_tolerance_m)
+        result["content_hash"] = digest
+    except BaseException as e:
+        flight.set_exception(e)
+        raise
+    else:
+        flight.set_result(result)
+    finally:
+        with _in_flight_lock:
+            del _in_flight[flight_key]
+    return result
+
+
+def _store_artifacts(path: str, keys: Dict[str, str], storage: Storage, snap_tolerance_m: float) -> Dict[str, Any]:
+    io_pool = _io_executor()
+    existing = {kind: io_pool.submit(_lookup, storage, key) for kind, key in keys.items()}
+    existing = {kind: future.result() for kind, future in existing.items()}
+
+    if existing["gpx"]:
+        raw_future = _done(existing["gpx"])
+    else:
+        raw_future = io_pool.submit(_save_file, storage, path, keys["gpx"])
+
+    if existing["json"]:
+        # Built before: nothing to parse
+        _remove_when_done(path, (raw_future,))
+        json_future, bin_future = _done(existing["json"]), _done(existing["bin"])
+        deduplicated = True
+    else:
+        cpu_pool = _cpu_executor()
+        try:
+            convert_future = cpu_pool.submit(convert_gpx_file, path, snap_tolerance_m)
+            _remove_when_done(path, (raw_future, convert_future))
+            json_path, bin_bytes, convert_timings = convert_future.result()
+        except BrokenProcessPool:
+            _reset_cpu_executor(cpu_pool)
+            _remove_when_done(path, (raw_future,))
+            raise RetryableUploadError("The GPX converter failed (it may have run out of resources); retry the upload.")
+
+        for name, seconds in convert_timings.items():
+            add_stage(name, seconds)
+
+        json_future = io_pool.submit(_save_file, storage, json_path, keys["json"])
+        _remove_when_done(json_path, (json_future,))
+        bin_future = io_pool.submit(storage.save, io.BytesIO(bin_bytes), keys["bin"]) if bin_bytes else _done(None)
+        deduplicated = False
+
+    # The uploads still running once the map is built
+    with stage("store"):
+        cloudinary_gpx_url = _result(raw_future, "GPX Upload Error (Credentials/Network)",
+                                     "Failed to upload raw GPX file to Cloudinary. Check credentials/network.")
+        cloudinary_json_url = _result(json_future, "JSON Upload Error",
+                                      "Failed to upload converted JSON file to Cloudinary.")
+        try:
+            cloudinary_graph_bin_url = bin_future.result()
+        except Exception as e:
+            print(f"Binary Graph Upload Error: {e}")
+            cloudinary_graph_bin_url = None
+
+    return {
+        "cloudinary_gpx_url": cloudinary_gpx_url,
+        "cloudinary_json_url": cloudinary_json_url,
+        "cloudinary_graph_bin_url": cloudinary_graph_bin_url,
+        "deduplicated": deduplicated,
+    }
+
+
+def submit_gpx_upload(path: str, digest: str, storage: Optional[Storage] = None) -> Future:
+    """
+    Runs process_gpx_upload() on the job pool; await it with asyncio.wrap_future().
+    It runs in a copy of the caller's context, so its stages are timed as part of the request.
+    """
+    context = contextvars.copy_context()
+    return _job_executor().submit(context.run, process_gpx_upload, path, digest, storage)
+
+
+def _done(value) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _lookup(storage: Storage, key: str) -> Optional[str]:
+    """storage.url_if_exists(), where a failed lookup only costs storing the artifact again."""
+    try:
+        return storage.url_if_exists(key)
+    except Exception as e:
+        print(f"Storage lookup failed for {key}: {e}")
+        return None
+
+
+def _save_file(storage: Storage, path: str, key: str) -> str:
+    with open(path, 'rb') as f:
+        return storage.save(f, key)
+
+
+def _result(future: Future, log_prefix: str, message: str) -> str:
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"{log_prefix}: {e}")
+        raise UploadError(message) from e
+
+
+def _remove_when_done(path: str, futures) -> None:
+    """Deletes path once every future (each reading the file) has finished."""
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            _remove(path)
+
+    for future in futures:
+        future.add_done_callback(done)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# --- Background jobs ---
+
+class UploadJobs:
+    """
+    Status of background uploads, by job id.
+
+    Jobs live in this process only, so with several worker processes a status
+    request has to reach the process that accepted the upload. Finished jobs
+    are forgotten ttl_seconds after they end.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600.0):
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def start(self, path: str, digest: str, name: str, storage: Optional[Storage] = None) -> str:
+        """Queues the upload of the spooled file at path and returns its job id."""
+        job_id = uuid.uuid4().hex
+        job = {"job_id": job_id, "status": "queued", "file_name": name, "content_hash": digest,
+               "created_at": time.time()}
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = job
+        _job_executor().submit(self._run, job_id, path, digest, storage)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A copy of the job's status, or None for an unknown (or expired) id."""
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _run(self, job_id: str, path: str, digest: str, storage: Optional[Storage]) -> None:
+        self._update(job_id, status="running")
+        try:
+            result = process_gpx_upload(path, digest, storage)
+        except ValidationError as e:
+            self._update(job_id, status="failed", error=e.message, finished_at=time.time())
+        except UploadError as e:
+            self._update(job_id, status="failed", error=str(e), retryable=isinstance(e, RetryableUploadError),
+                         finished_at=time.time())
+        except Exception as e:  # never let a job die without a status
+            print(f"Upload job {job_id} failed: {e}")
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+        else:
+            self._update(job_id, status="succeeded", result=result, finished_at=time.time())
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if job.get("finished_at", float('inf')) < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+upload_jobs = UploadJobs(ttl_seconds=getattr(settings, 'ROUTING_UPLOAD_JOB_TTL_SECONDS', 3600.0))
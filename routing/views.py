@@ -1,14 +1,21 @@
 from http.client import HTTPException
-import io
+import asyncio
+import hmac
+import math
 import os
 from typing import Optional
-from django.http import HttpResponseNotAllowed, JsonResponse, HttpResponse
+from django.conf import settings
+from django.forms import ValidationError
+from django.http import FileResponse, Http404, HttpResponseNotAllowed, JsonResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
-from .utils.routingUtil import GraphData, load_and_prepare_graph, haversine_distance, parse_gpx_content
-from .utils.graph_builder import build_graph
-from .algorithms.shortest_path import shortest_a_star
-from .algorithms.least_turn_path import turn_a_star
-from .algorithms.energy_path import elevation_a_star
+from .utils.routingUtil import GraphData, load_and_prepare_graph, invalidate_graph, graph_cache, path_physical_distance, one_to_many_routes, ROUTING_MODES, route_cache, nearest_nodes, nearest_edge, route_between_snaps, route_by_mode
+from .utils.upload_pipeline import RetryableUploadError, UploadError, spool_upload, submit_gpx_upload, upload_jobs
+from .utils.storage import LocalStorage, get_storage, is_content_addressed_url
+from .utils.search_state import SearchStats
+from .utils.response_encoding import CompactJsonResponse, dumps, encode_polyline
+from .utils.metrics import debug_timings, instrumented, record_search, render_metrics, stage
+from .algorithms.spatial_index import EdgeSnap
 from .utils.routingUtil import *
 import cloudinary.uploader
 import json
@@ -24,96 +31,438 @@ def health_check(request):
     return HttpResponse("Wayplot Django backend is healthy.", content_type="text/plain")
 
 @csrf_exempt
+@instrumented("calculate")
 def calculate_routes(request):
     if request.method != "POST":
         return HttpResponseNotAllowed(["POST"])
     
     try:
         # --- PARSE REQUEST ---
+        # Each endpoint is a node id, or raw coordinates ("source_coords": [lat, lon])
+        # snapped to the nearest node, or with "snap": "edge" to the nearest point on an edge.
+        # "path_encoding": "polyline" returns the path as an encoded polyline instead of path_coords.
+        # "debug_timings": true adds per-stage timings and search counters to the response.
         data = json.loads(request.body)
+        timings = debug_timings() if data.get("debug_timings") else None
         map_url = data.get("map_url")
-        source_id = int(data.get("source_id"))
-        target_id = int(data.get("target_id"))
         mode = data.get("mode", "shortest")
+        snap = data.get("snap", "node")
+        path_encoding = data.get("path_encoding", "coords")
+        bidirectional = data.get("bidirectional", settings.ROUTING_BIDIRECTIONAL_DEFAULT)
+        try:
+            source_id, source_coords = _parse_endpoint(data, "source")
+            target_id, target_coords = _parse_endpoint(data, "target")
+        except (TypeError, ValueError):
+            return JsonResponse(status=400, data={"error": "source/target must be a node id or [lat, lon] coordinates."})
 
-        if (map_url is None) or (source_id is None) or (target_id is None):
+        if (map_url is None) or (source_id is None and source_coords is None) or (target_id is None and target_coords is None):
             return JsonResponse(status=400, data={"error": "Missing required parameters in request."})
 
         if not map_url:
             return JsonResponse(status=400, data={"error": "Missing map_url in request. Cannot load graph data."})
-        
+
+        if snap not in ("node", "edge"):
+            return JsonResponse(status=400, data={"error": f"Invalid snap: {snap}"})
+
+        if not isinstance(bidirectional, bool):
+            return JsonResponse(status=400, data={"error": "bidirectional must be true or false."})
+
+        if mode not in ROUTING_MODES:
+            return JsonResponse(status=400, data={"error": f"Invalid routing mode: {mode}"})
+
+        if path_encoding not in PATH_ENCODINGS:
+            return JsonResponse(status=400, data={"error": f"Invalid path_encoding: {path_encoding}"})
+
         try:
-            # Load the graph. This function uses the internal cache 
-            # (GraphData.last_url) to avoid re-fetching if the URL hasn't changed.
-            load_and_prepare_graph(map_url)
+            # Load the graph. This goes through the per-map LRU graph cache, so
+            # the map is only fetched and indexed when it isn't cached yet.
+            with stage("graph_load"):
+                graph = load_and_prepare_graph(map_url)
         except Exception as e:
             # Re-raise error if fetching the graph data fails
             raise e
 
+        # --- SNAP COORDINATES TO THE GRAPH ---
+        snaps = {}
+        try:
+            with stage("snap"):
+                if source_coords is not None:
+                    source_id, snaps["source_snap"] = _snap_endpoint(graph, source_coords, snap)
+                if target_coords is not None:
+                    target_id, snaps["target_snap"] = _snap_endpoint(graph, target_coords, snap)
+        except ValidationError as e:
+            return JsonResponse(status=400, data={"error": e.message})
 
         # --- INPUT VALIDATION ---
-        if source_id not in GraphData.node_coords or target_id not in GraphData.node_coords:
-            return JsonResponse(status=400, data={"error": "Source or Target Node ID not found in graph."})
+        for node in (source_id, target_id):
+            if not isinstance(node, EdgeSnap) and node not in graph.node_coords:
+                return JsonResponse(status=400, data={"error": "Source or Target Node ID not found in graph."})
+
+        # --- ROUTES FROM POINTS ON EDGES (not cached: every GPS fix is a new point) ---
+        if isinstance(source_id, EdgeSnap) or isinstance(target_id, EdgeSnap):
+            stats = SearchStats()
+            with stage("search"):
+                path_ids, cost, turn_count = route_between_snaps(source_id, target_id, graph, mode, stats=stats,
+                                                                 bidirectional=bidirectional)
+            record_search(mode, stats)
+            if math.isinf(cost):
+                return JsonResponse(status=404, data={"error": "No path found between selected nodes."})
+            with stage("postprocess"):
+                path_coords = [graph.node_coords[node_id] for node_id in path_ids]
+                if isinstance(source_id, EdgeSnap):
+                    path_coords.insert(0, (source_id.lat, source_id.lon))
+                if isinstance(target_id, EdgeSnap):
+                    path_coords.append((target_id.lat, target_id.lon))
+                route = {
+                    "path_node_ids": path_ids,
+                    "path_coords": path_coords,
+                    "total_cost": cost,
+                    "total_physical_distance": path_physical_distance(path_coords),
+                    "units": ROUTING_MODES[mode].units,
+                    "turn_count": turn_count,
+                }
+                route = _encode_path(route, path_encoding)
+            return _success_response(
+                {"status": "Success", "mode": mode, **route, **snaps,
+                 "nodes_expanded": stats.nodes_expanded, "cached": False},
+                timings
+            )
+
+        # --- ROUTE CACHE ---
+        route = route_cache.get(map_url, graph.version, mode, source_id, target_id,
+                                symmetric=ROUTING_MODES[mode].symmetric)
+        if route is not None:
+            return _success_response(
+                {"status": "Success", "mode": mode, **_encode_path(route, path_encoding), **snaps,
+                 "nodes_expanded": 0, "cached": True},
+                timings
+            )
 
         # --- ROUTING LOGIC ---
-        turn_count = 0 # Initialize turn_count
-        
-        if mode == 'shortest':
-            path_ids, cost = shortest_path_astar(source_id, target_id, GraphData)
-            cost_units = "meters"
-        elif mode == 'energy_efficient':
-            path_ids, cost = energy_efficient_astar(source_id, target_id, GraphData)
-            cost_units = "E-units"
-        elif mode == 'least_turn':
-            path_ids, cost, turn_count = least_turn_astar(source_id, target_id, GraphData) 
-            cost_units = "Weighted-Units"
-        else:
-            return JsonResponse(status=400, data={"error": f"Invalid routing mode: {mode}"})
+        stats = SearchStats()
+        with stage("search"):
+            path_ids, cost, turn_count = route_by_mode(source_id, target_id, graph, mode, stats=stats,
+                                                       bidirectional=bidirectional)
+        record_search(mode, stats)
 
         if not path_ids:
             return JsonResponse(status=404, data={"error": "No path found between selected nodes."})
 
         # --- POST-PROCESSING ---
-        path_coords: List[Tuple[float, float]] = []
-        total_physical_distance: float = 0.0
-
-        for i in range(len(path_ids)):
-            node_id = path_ids[i]
-            coords = GraphData.node_coords.get(node_id)
-            if coords:
-                path_coords.append(coords)
-                
-                # Calculate total physical distance
-                if i > 0:
-                    prev_coords = path_coords[i-1]
-                    distance = haversine_distance(prev_coords[0], prev_coords[1], coords[0], coords[1])
-                    total_physical_distance += distance
+        with stage("postprocess"):
+            path_coords: List[Tuple[float, float]] = [graph.node_coords[node_id] for node_id in path_ids]
 
-        # --- RETURN RESPONSE ---
-        return JsonResponse(
-            status=200, 
-            data={
-                "status": "Success",
-                "mode": mode,
+            # Calculate total physical distance (vectorized over all path segments)
+            total_physical_distance: float = path_physical_distance(path_coords)
+
+            route = {
                 "path_node_ids": path_ids,
                 "path_coords": path_coords,
                 "total_cost": cost, # The output of A* (which is adjusted distance/cost)
                 "total_physical_distance": total_physical_distance, # Pure physical distance (meters)
-                "units": cost_units,
-                "turn_count": turn_count
+                "units": ROUTING_MODES[mode].units,
+                "turn_count": turn_count,
             }
+            route_cache.put(map_url, graph.version, mode, source_id, target_id, route)
+            route = _encode_path(route, path_encoding)
+
+        # --- RETURN RESPONSE ---
+        return _success_response(
+            {"status": "Success", "mode": mode, **route, **snaps,
+             "nodes_expanded": stats.nodes_expanded, "cached": False},
+            timings
         )
 
     except Exception as e:
         print(e)
         return JsonResponse({"error": str(e)}, status=500)
 
+def _success_response(data, timings) -> HttpResponse:
+    """
+    A 200 CompactJsonResponse for data, with a "debug_timings" block when the
+    request asked for one (its encode stage is only in the Server-Timing header).
+    """
+    if timings is not None:
+        data["debug_timings"] = timings.as_dict()
+    with stage("encode"):
+        return CompactJsonResponse(status=200, data=data)
+
+def _encode_path(route, path_encoding: str):
+    """The route with its path_coords as requested: a [lat, lon] list, or a "path_polyline" string."""
+    if path_encoding == "polyline":
+        coords = route["path_coords"]
+        route = {key: value for key, value in route.items() if key != "path_coords"}
+        route["path_polyline"] = encode_polyline(coords)
+    return route
+
+def _parse_endpoint(data, name: str):
+    """(node id, None) or (None, (lat, lon)) for the request's source/target; (None, None) when absent."""
+    coords = data.get(f"{name}_coords")
+    if coords is not None:
+        lat, lon = (float(value) for value in coords)
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError(f"{name}_coords out of range")
+        return None, (lat, lon)
+    node_id = data.get(f"{name}_id")
+    return (int(node_id) if node_id is not None else None), None
+
+def _snap_endpoint(graph: GraphData, coords, snap: str):
+    """
+    Snaps (lat, lon) to the graph within ROUTING_MAX_SNAP_DISTANCE_METERS: a node
+    id, or an EdgeSnap when snap is "edge". Returns it with a description for the
+    response; raises ValidationError when nothing is close enough.
+    """
+    lat, lon = coords
+    max_distance = settings.ROUTING_MAX_SNAP_DISTANCE_METERS
+    if snap == "edge":
+        point = nearest_edge(graph, lat, lon, max_distance)
+        if point is not None:
+            return point, {
+                "edge": [graph.node_ids[point.u], graph.node_ids[point.v]],
+                "fraction": point.fraction,
+                "coords": (point.lat, point.lon),
+                "distance_m": point.distance,
+            }
+    else:
+        found = nearest_nodes(graph, lat, lon, k=1, radius=max_distance)
+        if found:
+            node_id, distance = found[0]
+            return node_id, {"node_id": node_id, "coords": graph.node_coords[node_id], "distance_m": distance}
+    raise ValidationError(f"No part of the map within {max_distance:g} m of ({lat}, {lon}).")
+
+@csrf_exempt
+@instrumented("nearest")
+def nearest_nodes_view(request):
+    """
+    Nodes closest to a coordinate, so clients needn't download the map to find one.
+
+    Body: {"map_url", "lat", "lon"} plus "k" (result count, default 1) and an
+    optional "radius" in meters, which returns up to k nodes within it.
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    try:
+        data = json.loads(request.body)
+        map_url = data["map_url"]
+        lat, lon = float(data["lat"]), float(data["lon"])
+        k = int(data.get("k", 1))
+        radius = float(data["radius"]) if data.get("radius") is not None else None
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+        return JsonResponse(status=400, data={"error": "Body needs map_url, lat and lon."})
+
+    if not map_url:
+        return JsonResponse(status=400, data={"error": "Missing map_url in request. Cannot load graph data."})
+    if not 1 <= k <= settings.ROUTING_NEAREST_MAX_RESULTS:
+        return JsonResponse(status=400, data={"error": f"k must be between 1 and {settings.ROUTING_NEAREST_MAX_RESULTS}."})
+    if radius is not None and radius < 0:
+        return JsonResponse(status=400, data={"error": "radius must not be negative."})
+
+    try:
+        with stage("graph_load"):
+            graph = load_and_prepare_graph(map_url)
+    except Exception as e:
+        print(e)
+        return JsonResponse({"error": str(e)}, status=500)
+
+    with stage("snap"):
+        nodes = [
+            {"node_id": node_id, "coords": graph.node_coords[node_id], "distance_m": distance}
+            for node_id, distance in nearest_nodes(graph, lat, lon, k=k, radius=radius)
+        ]
+    with stage("encode"):
+        return CompactJsonResponse(status=200, data={"status": "Success", "nodes": nodes})
+
+# "coords": path_coords as [[lat, lon], ...]; "polyline": path_polyline, an encoded polyline (precision 5)
+PATH_ENCODINGS = ("coords", "polyline")
+
+@csrf_exempt
+@instrumented("batch")
+def calculate_routes_batch(request):
+    """
+    Many routes on one map in a single request.
+
+    Body: {"map_url", "mode", "costs_only", "path_encoding"} plus either "pairs": [[source_id, target_id], ...]
+    or a matrix as "sources": [...] and "targets": [...]. Pairs sharing a source are
+    answered from one search tree. Results stream back as newline-delimited JSON,
+    grouped by source: one line per pair, or with costs_only and a matrix, one
+    {"source_id", "costs"} line per source (costs in "targets" order, null if unreachable).
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    # --- PARSE REQUEST ---
+    # The pair count is checked before any pair is built, so an oversized matrix costs nothing
+    try:
+        data = json.loads(request.body)
+        map_url = data.get("map_url")
+        mode = data.get("mode", "shortest")
+        costs_only = data.get("costs_only", False)
+        path_encoding = data.get("path_encoding", "coords")
+        matrix = "pairs" not in data
+        if matrix:
+            sources, targets = data["sources"], data["targets"]
+            pair_count = len(sources) * len(targets)
+        else:
+            pair_count = len(data["pairs"])
+    except (json.JSONDecodeError, AttributeError, KeyError, TypeError):
+        return JsonResponse(status=400, data={"error": "Body needs map_url and either pairs or sources and targets."})
+
+    if pair_count > settings.ROUTING_BATCH_MAX_PAIRS:
+        return JsonResponse(status=400, data={"error": f"Too many pairs ({pair_count}); the limit is {settings.ROUTING_BATCH_MAX_PAIRS}."})
+
+    try:
+        if matrix:
+            sources = [int(node_id) for node_id in sources]
+            targets = [int(node_id) for node_id in targets]
+            pairs = [(s, t) for s in sources for t in targets]
+        else:
+            pairs = [(int(s), int(t)) for s, t in data["pairs"]]
+    except (TypeError, ValueError):
+        return JsonResponse(status=400, data={"error": "Body needs map_url and either pairs or sources and targets."})
+
+    if not map_url:
+        return JsonResponse(status=400, data={"error": "Missing map_url in request. Cannot load graph data."})
+    if mode not in ROUTING_MODES:
+        return JsonResponse(status=400, data={"error": f"Invalid routing mode: {mode}"})
+    if not isinstance(costs_only, bool):
+        return JsonResponse(status=400, data={"error": "costs_only must be true or false."})
+    if path_encoding not in PATH_ENCODINGS:
+        return JsonResponse(status=400, data={"error": f"Invalid path_encoding: {path_encoding}"})
+
+    try:
+        with stage("graph_load"):
+            graph = load_and_prepare_graph(map_url)
+    except Exception as e:
+        print(e)
+        return JsonResponse({"error": str(e)}, status=500)
+
+    # --- INPUT VALIDATION ---
+    unknown = sorted({node_id for pair in pairs for node_id in pair if node_id not in graph.node_coords})
+    if unknown:
+        return JsonResponse(status=400, data={"error": "Node IDs not found in graph.", "node_ids": unknown})
+
+    # --- GROUP BY SOURCE (keeping request order within each group) ---
+    by_source: Dict[int, List[Tuple[int, int]]] = {}
+    for index, (source_id, target_id) in enumerate(pairs):
+        by_source.setdefault(source_id, []).append((index, target_id))
+
+    units = ROUTING_MODES[mode].units
+
+    def stream():
+        for source_id, group in by_source.items():
+            stats = SearchStats()
+            try:
+                with stage("search"):
+                    routes = one_to_many_routes(source_id, [target_id for _, target_id in group], graph, mode, stats)
+            except Exception as e:
+                print(e)
+                yield dumps({"source_id": source_id, "error": str(e)}) + b"\n"
+                continue
+            record_search(mode, stats)
+
+            if matrix and costs_only:
+                costs = [_finite_or_none(routes[target_id][1]) for _, target_id in group]
+                yield dumps({"source_id": source_id, "costs": costs, "units": units}) + b"\n"
+                continue
+
+            for index, target_id in group:
+                path_ids, cost, turn_count = routes[target_id]
+                line = {"index": index, "source_id": source_id, "target_id": target_id,
+                        "total_cost": _finite_or_none(cost), "units": units}
+                if not path_ids:
+                    line["error"] = "No path found between selected nodes."
+                elif not costs_only:
+                    path_coords = [graph.node_coords[node_id] for node_id in path_ids]
+                    line.update(_encode_path({
+                        "path_node_ids": path_ids,
+                        "path_coords": path_coords,
+                        "total_physical_distance": path_physical_distance(path_coords),
+                        "turn_count": turn_count,
+                    }, path_encoding))
+                yield dumps(line) + b"\n"
+
+    return StreamingHttpResponse(stream(), content_type="application/x-ndjson")
+
+def _finite_or_none(cost: float) -> Optional[float]:
+    """JSON has no Infinity, so unreachable costs are sent as null."""
+    return cost if math.isfinite(cost) else None
+
+def _is_admin(request) -> bool:
+    """True when the request carries ROUTING_ADMIN_TOKEN as "Authorization: Bearer <token>" (never when it is unset)."""
+    token = getattr(settings, 'ROUTING_ADMIN_TOKEN', '')
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(header.encode(), f"Bearer {token}".encode())
+
+@csrf_exempt
+def invalidate_graph_cache(request):
+    """
+    Drops one map (body: {"map_url": ...}) or every map ({"all": true}) from
+    the graph cache. Admin only: see _is_admin().
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    if not _is_admin(request):
+        return JsonResponse(status=403, data={"error": "Admin token required."})
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse(status=400, data={"error": "Request body must be JSON."})
+
+    map_url = data.get("map_url") if isinstance(data, dict) else None
+    drop_all = isinstance(data, dict) and data.get("all") is True
+    if not map_url and not drop_all:
+        return JsonResponse(status=400, data={"error": "Body needs a map_url, or \"all\": true to drop every map."})
+
+    removed = invalidate_graph(None if drop_all else map_url)
+    return JsonResponse(
+        status=200,
+        data={
+            "status": "Success",
+            "removed": removed,
+            "cache": graph_cache.stats(),
+            "route_cache": route_cache.stats(),
+        }
+    )
+
+def cache_stats(request):
+    """Hit/miss counters of the graph and route caches."""
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+
+    return JsonResponse(status=200, data={"graph_cache": graph_cache.stats(), "route_cache": route_cache.stats()})
+
+def metrics_view(request):
+    """
+    Request, stage and search metrics (collected while ROUTING_METRICS_ENABLED
+    is on) and the cache counters, in the Prometheus text format.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+
+    text = render_metrics({"graph_cache": graph_cache.stats(), "route_cache": route_cache.stats()})
+    return HttpResponse(text, content_type="text/plain; version=0.0.4; charset=utf-8")
+
 @csrf_exempt
+@instrumented("upload")
 async def upload_gpx(request):
+    """
+    Stores an uploaded GPX file and the routable map built from it.
+
+    Nothing blocking runs on the event loop: the file is spooled in a thread,
+    converted in a worker process and uploaded from a thread pool (see
+    upload_pipeline). Artifacts are named by the file's hash, so a file that
+    was uploaded before comes back at once with "deduplicated": true. With "background" set in the form (or ?background=1) the
+    response is 202 with a job id right away; poll status_url for the result.
+    "debug_timings" (form or query) adds the time spent in each stage to a
+    response that waited for the result.
+    """
     if request.method != "POST":
         return HttpResponseNotAllowed(["POST"])
 
-    gpx_file = request.FILES.get("gpx_file")
+    # Parsing the multipart body reads (and may write) temporary files
+    gpx_file = await asyncio.to_thread(lambda: request.FILES.get("gpx_file"))
     if gpx_file is None:
         return JsonResponse(status=400, data={"error": "No GPX file uploaded."})
     
@@ -121,71 +470,80 @@ async def upload_gpx(request):
     if gpx_file.content_type not in ["application/gpx+xml", "application/xml"] and not gpx_file.name.endswith(".gpx"):
         return JsonResponse(status=400, data={"error": "Invalid file type. Please upload a GPX file."})
         
-    # Read the content once
-    gpx_content = gpx_file.read()
-    print(f"Received GPX file of size: {len(gpx_content)} bytes")
-    
-    # --- A. UPLOAD RAW GPX FILE FIRST ---
-    try:
-        # Create a new stream for the first upload (Cloudinary consumes the stream)
-        gpx_stream = io.BytesIO(gpx_content)
-        
-        # NOTE: Using standard upload() but setting resource_type='raw'
-        gpx_upload_result = cloudinary.uploader.upload(
-            gpx_stream,
-            resource_type="raw", 
-            public_id=f"raw_gpx/{gpx_file.name.split('.')[0]}_{os.urandom(4).hex()}", # Use a unique ID to avoid overwriting issues
-            folder="gpx_graphs",
-            overwrite=True
-        )
-        # FIX: Access the secure_url directly, as the standard upload() function returns a dictionary.
-        cloudinary_gpx_url = gpx_upload_result['secure_url'] 
+    print(f"Received GPX file of size: {gpx_file.size} bytes")
 
-    except Exception as e:
-        print(f"GPX Upload Error (Credentials/Network): {e}")
-        return JsonResponse(status=500, data={"error": "Failed to upload raw GPX file to Cloudinary. Check credentials/network."})
+    timings = debug_timings() if _flag(request, "debug_timings") else None
 
+    # The pipeline may outlive this request, so it works on its own copy of the file
+    with stage("spool"):
+        path, digest = await asyncio.to_thread(spool_upload, gpx_file)
 
-    # --- B. PARSE AND BUILD GRAPH (Using your existing logic) ---
-    tracks = parse_gpx_content(gpx_content)
-    if not tracks:
-         return JsonResponse(status=400, data={"error": "GPX file contained no valid track segments."})
-    
-    graph_data = build_graph(tracks)
-    
-    # C. CONVERT TO JSON BYTES
-    json_data = json.dumps(graph_data, indent=2)
-    json_bytes = json_data.encode('utf-8')
-    
-    # --- D. UPLOAD CONVERTED JSON FILE ---
-    try:
-        # Create a new stream for the second upload
-        json_stream = io.BytesIO(json_bytes)
-        
-        # NOTE: Using standard upload()
-        json_upload_result = cloudinary.uploader.upload(
-            json_stream,
-            resource_type="raw", 
-            public_id=f"json_graph/{gpx_file.name.split('.')[0]}",
-            folder="gpx_graphs",             
-            overwrite=True                   
+    if _flag(request, "background"):
+        job_id = upload_jobs.start(path, digest, gpx_file.name)
+        return JsonResponse(
+            status=202,
+            data={
+                "status": "Accepted",
+                "job_id": job_id,
+                "status_url": reverse("upload_job_status", args=[job_id]),
+            }
         )
-        cloudinary_json_url = json_upload_result['secure_url'] 
 
-    except Exception as e:
-        print(f"JSON Upload Error: {e}")
-        return JsonResponse(status=500, data={"error": "Failed to upload converted JSON file to Cloudinary."})
+    try:
+        result = await asyncio.wrap_future(submit_gpx_upload(path, digest))
+    except ValidationError as e:
+        return JsonResponse(status=400, data={"error": e.message})
+    except RetryableUploadError as e:
+        response = JsonResponse(status=503, data={"error": str(e)})
+        response.headers["Retry-After"] = "5"
+        return response
+    except UploadError as e:
+        return JsonResponse(status=500, data={"error": str(e)})
 
-    print("------------ STart of graph -------------")
-    print(graph_data)
-    print("------------ End of graph -------------")
-    # --- E. RETURN RESPONSE ---
     return JsonResponse(
         status=200,
         data={
             "status": "Success",
             "message": "GPX converted and uploaded successfully.",
-            "cloudinary_gpx_url": cloudinary_gpx_url,
-            "cloudinary_json_url": cloudinary_json_url,
+            **result,
+            **({"debug_timings": timings.as_dict()} if timings is not None else {}),
         }
-    )
\ No newline at end of file
+    )
+
+def _flag(request, name: str) -> bool:
+    """A true/false option of a form upload, from the form or the query string."""
+    return request.POST.get(name, request.GET.get(name, "")).lower() in ("1", "true", "yes")
+
+def upload_job_status(request, job_id):
+    """Status of a background upload: queued, running, succeeded (with the URLs) or failed (with the error)."""
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+
+    job = upload_jobs.get(job_id)
+    if job is None:
+        return JsonResponse(status=404, data={"error": "Unknown or expired upload job."})
+    return JsonResponse(status=200, data=job)
+
+def storage_file(request, key):
+    """Serves artifacts of the local storage backend (ROUTING_STORAGE_BACKEND = 'local')."""
+    if request.method not in ("GET", "HEAD"):
+        return HttpResponseNotAllowed(["GET", "HEAD"])
+
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        raise Http404("Local storage is not enabled.")
+    try:
+        path = storage.path(key)
+    except ValueError:
+        raise Http404("Invalid storage key.")
+    if not os.path.isfile(path):
+        raise Http404("No such file.")
+
+    # JSON maps get their own type, so the compression middleware gzips them on the way out
+    content_type = "application/json" if path.endswith(".json") else "application/octet-stream"
+    response = FileResponse(open(path, 'rb'), content_type=content_type)
+    if is_content_addressed_url(key):
+        # Named by the hash of their content, so they never change
+        response["Cache-Control"] = "public, max-age=31536000, immutable"
+        response["ETag"] = f'"{os.path.basename(key)}"'
+    return response
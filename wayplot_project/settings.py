@@ -45,7 +45,8 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    "corsheaders"
+    "corsheaders",
+    'routing',
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -56,12 +57,14 @@ CORS_ALLOWED_ORIGINS = [
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
+    'routing.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'routing.middleware.ProfilingMiddleware',  # last, so it times the view alone
 ]
 
 CORS_ALLOW_CREDENTIALS = True
@@ -137,3 +140,151 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Routing graph cache
+# Loaded maps are kept in a per-process LRU cache keyed by map URL. The oldest
+# maps are evicted once either limit is exceeded (0 disables a limit).
+
+ROUTING_GRAPH_CACHE_MAX_ENTRIES = int(os.environ.get('ROUTING_GRAPH_CACHE_MAX_ENTRIES', 16))
+ROUTING_GRAPH_CACHE_MAX_BYTES = int(os.environ.get('ROUTING_GRAPH_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Searches that may run on one map at once; more wait for a free one. Each keeps
+# about 72 bytes per node and 48 per edge slot of scratch arrays, which count
+# towards ROUTING_GRAPH_CACHE_MAX_BYTES.
+
+ROUTING_SEARCH_SCRATCH_SETS = int(os.environ.get('ROUTING_SEARCH_SCRATCH_SETS', 4))
+
+# Admin endpoints (/routing/cache/invalidate/) need an "Authorization: Bearer
+# <token>" header matching ROUTING_ADMIN_TOKEN; unset, they are turned off.
+
+ROUTING_ADMIN_TOKEN = os.environ.get('ROUTING_ADMIN_TOKEN', '')
+
+# Optional per-map preprocessing, run once when a map is loaded into the cache.
+# Contraction Hierarchies make repeated shortest-path queries much faster at the
+# cost of a slower first load.
+
+ROUTING_CONTRACTION_HIERARCHIES = os.environ.get('ROUTING_CONTRACTION_HIERARCHIES', 'false').lower() in ('1', 'true', 'yes')
+
+# Number of ALT landmarks picked per map (0 disables). Each landmark costs one
+# full Dijkstra at load time and 8 bytes per node, and tightens the A* heuristic
+# on maps where path lengths are well above straight-line distance. Maps with
+# elevation get a second set over the energy costs (three Dijkstras each).
+
+ROUTING_ALT_LANDMARKS = int(os.environ.get('ROUTING_ALT_LANDMARKS', 0))
+
+# Search from both ends by default. Requests can still choose per call with
+# {"bidirectional": true/false}.
+
+ROUTING_BIDIRECTIONAL_DEFAULT = os.environ.get('ROUTING_BIDIRECTIONAL_DEFAULT', 'false').lower() in ('1', 'true', 'yes')
+
+# Upper limit on the number of source/target pairs one batch routing request
+# may ask for (a sources x targets matrix counts as len(sources) * len(targets)).
+
+ROUTING_BATCH_MAX_PAIRS = int(os.environ.get('ROUTING_BATCH_MAX_PAIRS', 10000))
+
+# Route result cache: how many computed routes to keep (0 turns it off) and
+# how long one stays valid, in seconds (unset = until evicted or the map is reloaded).
+
+ROUTING_ROUTE_CACHE_MAX_ENTRIES = int(os.environ.get('ROUTING_ROUTE_CACHE_MAX_ENTRIES', 4096))
+ROUTING_ROUTE_CACHE_TTL_SECONDS = float(os.environ['ROUTING_ROUTE_CACHE_TTL_SECONDS']) if os.environ.get('ROUTING_ROUTE_CACHE_TTL_SECONDS') else None
+
+# Local disk cache of loaded maps in the binary graph format. Cached files are
+# memory-mapped, so a restart skips the download and parsing, and worker
+# processes share one copy of each map. Set to an empty string to turn it off.
+
+ROUTING_GRAPH_DISK_CACHE_DIR = os.environ.get('ROUTING_GRAPH_DISK_CACHE_DIR', str(BASE_DIR / 'graph_cache'))
+
+# When a GPX upload is turned into a map, trackpoints closer than this many
+# meters are merged into one node, joining tracks where they cross or overlap.
+
+ROUTING_GPX_SNAP_TOLERANCE_METERS = float(os.environ.get('ROUTING_GPX_SNAP_TOLERANCE_METERS', 3.0))
+
+# Collapse runs of degree-2 trackpoints into single edges when a map is loaded
+# and search that smaller graph (results are unpacked back to every trackpoint).
+# Skipped automatically on maps that have few such nodes.
+
+ROUTING_SIMPLIFY_CHAINS = os.environ.get('ROUTING_SIMPLIFY_CHAINS', 'true').lower() in ('1', 'true', 'yes')
+
+# Routes requested from raw coordinates (source_coords / target_coords) snap to
+# the map only within this many meters. /routing/nearest/ returns at most
+# ROUTING_NEAREST_MAX_RESULTS nodes per request.
+
+ROUTING_MAX_SNAP_DISTANCE_METERS = float(os.environ.get('ROUTING_MAX_SNAP_DISTANCE_METERS', 500.0))
+ROUTING_NEAREST_MAX_RESULTS = int(os.environ.get('ROUTING_NEAREST_MAX_RESULTS', 1000))
+
+# GPX uploads: files are converted to maps in ROUTING_UPLOAD_PROCESS_WORKERS
+# worker processes (0 converts in a thread instead) and stored from
+# ROUTING_UPLOAD_IO_WORKERS threads. Background upload jobs are remembered
+# for ROUTING_UPLOAD_JOB_TTL_SECONDS after they finish.
+
+ROUTING_UPLOAD_PROCESS_WORKERS = int(os.environ.get('ROUTING_UPLOAD_PROCESS_WORKERS', min(2, os.cpu_count() or 1)))
+ROUTING_UPLOAD_IO_WORKERS = int(os.environ.get('ROUTING_UPLOAD_IO_WORKERS', 4))
+ROUTING_UPLOAD_JOB_TTL_SECONDS = float(os.environ.get('ROUTING_UPLOAD_JOB_TTL_SECONDS', 3600))
+
+# Where uploaded GPX files and the maps built from them are stored: 'cloudinary'
+# or 'local' (files under ROUTING_STORAGE_LOCAL_DIR, served from
+# ROUTING_STORAGE_LOCAL_URL). Artifacts are named by the SHA-256 of the GPX
+# file, so re-uploading a known file costs a few existence checks.
+
+ROUTING_STORAGE_BACKEND = os.environ.get('ROUTING_STORAGE_BACKEND', 'cloudinary')
+ROUTING_STORAGE_LOCAL_DIR = os.environ.get('ROUTING_STORAGE_LOCAL_DIR', str(BASE_DIR / 'storage'))
+ROUTING_STORAGE_LOCAL_URL = os.environ.get('ROUTING_STORAGE_LOCAL_URL', '/routing/storage/')
+
+# Outgoing HTTP (map and GPX fetches) goes through one pooled keep-alive
+# session per process. Connect/read timeouts are in seconds; GET and HEAD are
+# retried ROUTING_HTTP_RETRIES times on connection errors and 429/5xx answers,
+# with exponential backoff starting at ROUTING_HTTP_BACKOFF_SECONDS.
+
+ROUTING_HTTP_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('ROUTING_HTTP_CONNECT_TIMEOUT_SECONDS', 5.0))
+ROUTING_HTTP_READ_TIMEOUT_SECONDS = float(os.environ.get('ROUTING_HTTP_READ_TIMEOUT_SECONDS', 30.0))
+ROUTING_HTTP_RETRIES = int(os.environ.get('ROUTING_HTTP_RETRIES', 3))
+ROUTING_HTTP_BACKOFF_SECONDS = float(os.environ.get('ROUTING_HTTP_BACKOFF_SECONDS', 0.5))
+ROUTING_HTTP_POOL_SIZE = int(os.environ.get('ROUTING_HTTP_POOL_SIZE', 10))
+
+# Response encoding: JSON is written compactly, through orjson when it is
+# installed ('auto'; 'json' forces the standard library, 'orjson' requires it).
+# JSON and text responses of at least ROUTING_COMPRESSION_MIN_BYTES are
+# compressed with brotli (if installed) or gzip, as the client accepts.
+
+ROUTING_JSON_BACKEND = os.environ.get('ROUTING_JSON_BACKEND', 'auto')
+ROUTING_COMPRESSION_MIN_BYTES = int(os.environ.get('ROUTING_COMPRESSION_MIN_BYTES', 1024))
+
+# Metrics: with ROUTING_METRICS_ENABLED, request latency, per-stage timings
+# (fetch, parse, index, search, ...) and search counters are collected and
+# served in the Prometheus text format at /routing/metrics/ (cache counters
+# are there either way). Off, timing costs nothing unless a request asks for
+# "debug_timings".
+
+ROUTING_METRICS_ENABLED = os.environ.get('ROUTING_METRICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+# Profiling (off unless ROUTING_PROFILING_ENABLED): requests to the routing
+# views are stack-sampled every ROUTING_PROFILING_INTERVAL_MS, and a
+# ROUTING_PROFILING_SAMPLE_RATE fraction runs under cProfile. Requests taking
+# ROUTING_PROFILING_SLOW_MS or longer are saved with their parameters to
+# ROUTING_PROFILING_DIR (the newest ROUTING_PROFILING_MAX_CAPTURES are kept);
+# "manage.py routing_replay" replays them against the disk-cached graph.
+
+ROUTING_PROFILING_ENABLED = os.environ.get('ROUTING_PROFILING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+ROUTING_PROFILING_SAMPLE_RATE = float(os.environ.get('ROUTING_PROFILING_SAMPLE_RATE', 0.01))
+ROUTING_PROFILING_SLOW_MS = float(os.environ.get('ROUTING_PROFILING_SLOW_MS', 1000))
+ROUTING_PROFILING_INTERVAL_MS = float(os.environ.get('ROUTING_PROFILING_INTERVAL_MS', 10))
+ROUTING_PROFILING_DIR = os.environ.get('ROUTING_PROFILING_DIR', str(BASE_DIR / 'profiles'))
+ROUTING_PROFILING_MAX_CAPTURES = int(os.environ.get('ROUTING_PROFILING_MAX_CAPTURES', 100))
+
+# Logging: the routing app's warnings (fallbacks to cached maps, slow request
+# captures, ...) go to stderr; ROUTING_LOG_LEVEL sets how much is shown.
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'routing': {
+            'handlers': ['console'],
+            'level': os.environ.get('ROUTING_LOG_LEVEL', 'INFO'),
+        },
+    },
+}